@@ -1,7 +1,9 @@
-# All imported objects may be used in construction.
-# (See state_storage.construct_creature)
-
-
-from visuals.creatures.jelly import JellyBell, GooeyBodyPart
-from visuals.animations import MeshAnimator
+# Class paths of the classes that may be used in construction (see state_storage.construct_creature).
+# Modules are only imported when a class is first looked up, see state_storage.ConstructableRegistry
 
+class_paths = (
+    'visuals.creatures.jelly.JellyBell',
+    'visuals.creatures.jelly.GooeyBodyPart',
+    'visuals.creatures.jelly.Tentacle',
+    'visuals.animations.MeshAnimator',
+)
@@ -2,8 +2,11 @@ __author__ = 'awhite'
 
 # Singletonish module that keeps kivy stores open for reading/writing state.
 
+import json
 import os.path as P
 import os
+from collections import Mapping
+from importlib import import_module
 from uuid import uuid4
 
 from kivy.storage.jsonstore import JsonStore
@@ -11,15 +14,59 @@ from kivy.logger import Logger
 from kivy.utils import reify
 from datetime import datetime
 
-# Mapping of class paths to classes allowed to be constructed from JSON
-constructable_members = {}
-
+from data import constructable
 from misc.exceptions import InsufficientData
+from misc.profiling import profiler, timer, on_main_thread
+from misc.startup import startup_tracer
+from misc.recording import recorder
+
+
+class ConstructableRegistry(Mapping):
+    """Mapping of class path -> class of the classes allowed to be constructed from JSON.
+    A class's module is imported the first time the class is looked up.
+    """
+
+    def __init__(self, class_paths):
+        self.class_paths = frozenset(class_paths)
+        self._classes = {}
+
+    def __getitem__(self, class_path):
+        try:
+            return self._classes[class_path]
+        except KeyError:
+            if class_path not in self.class_paths:
+                raise
+
+        module_name, _, class_name = class_path.rpartition('.')
+        with startup_tracer.phase('import {}', module_name):
+            clazz = getattr(import_module(module_name), class_name)
+
+        self._classes[class_path] = clazz
+        return clazz
+
+    def __contains__(self, class_path):
+        return class_path in self.class_paths
+
+    def __iter__(self):
+        return iter(self.class_paths)
+
+    def __len__(self):
+        return len(self.class_paths)
+
+# Mapping of class paths to classes allowed to be constructed from JSON
+constructable_members = ConstructableRegistry(constructable.class_paths)
 
 jelly_stores = {}
 app_store = None
+layout_cache_store = None
 # To be set by main
 user_data_dir = None
+# creature_id -> number incremented whenever the jelly store is saved with changes or deleted,
+# so screens can tell they're out of date
+jelly_generations = {}
+
+def _jelly_changed(creature_id):
+    jelly_generations[creature_id] = jelly_generations.get(creature_id, 0) + 1
 
 class LazyJsonStore(JsonStore):
     # Does not sync right away
@@ -27,6 +74,19 @@ class LazyJsonStore(JsonStore):
     # TODO Better to have a merge function? Think about API; maybe refactor
     # Besides, only root level dictionary merges, everything else doesn't
 
+    def store_load(self):
+        start = timer()
+        super(LazyJsonStore, self).store_load()
+        # Stores are also read by the warm-up thread
+        if profiler.enabled and on_main_thread():
+            profiler.record('store.load', timer() - start)
+
+    def store_sync(self):
+        start = timer()
+        super(LazyJsonStore, self).store_sync()
+        if profiler.enabled:
+            profiler.record('store.sync', timer() - start)
+
     def store_put(self, key, value):
         """Merges with existing data
         Warning: this means the dicts are the same object on first put (assignment),
@@ -94,6 +154,8 @@ class CreatureStore(LazyJsonStore):
 
     def __init__(self, filename, creature_id=None, **kwargs):
         super(CreatureStore, self).__init__(filename, **kwargs)
+        # Screens re-put unchanged data when saving, compared to tell if anything really changed
+        self._synced_content = self._content()
 
         if '_info' not in self:
             self._initialize_new(creature_id)
@@ -186,6 +248,31 @@ class CreatureStore(LazyJsonStore):
     def info(self):
         return self['_info']
 
+    @property
+    def data(self):
+        """The contents of the store (not a copy), i.e. to record what a creature was constructed from"""
+        return self._data
+
+    def _content(self):
+        return json.dumps(self._data, sort_keys=True)
+
+    def mark_changed(self):
+        """Call after modifying dicts in the store in place, so store_sync() saves them"""
+        self._is_changed = True
+
+    def store_sync(self):
+        if not self._is_changed:
+            return
+
+        content = self._content()
+        if content == self._synced_content:
+            self._is_changed = False
+            return
+
+        self._synced_content = content
+        _jelly_changed(self.creature_id)
+        super(CreatureStore, self).store_sync()
+
     def _initialize_new(self, creature_id):
         "called when info not already in store"
         if creature_id is None or len(creature_id) == 0:
@@ -385,6 +472,15 @@ def load_app_storage():
 
     return app_store
 
+def load_layout_cache_storage():
+    """Store of image layouts (such as Tentacle circles) keyed by image content hash"""
+    assert user_data_dir is not None
+    global layout_cache_store
+    if layout_cache_store is None:
+        Logger.debug('state_storage: Opening layout_cache.json')
+        layout_cache_store = LazyJsonStore(P.join(user_data_dir, 'layout_cache.json'))
+
+    return layout_cache_store
 
 def __jelly_json_path(creature_id):
     return P.join(get_jellies_dir(), creature_id+'.json')
@@ -444,7 +540,36 @@ def load_jelly_storage(creature_id, new=False):
 
     return jelly_stores[creature_id]
 
+def read_jelly_storage(creature_id):
+    """Read the existing store without caching it, so it can be read on another thread.
+    Cache it on the main thread with add_jelly_storage().
+    :rtype: CreatureStore
+    :raises ValueError if the store can't be read
+    """
+    return CreatureStore(__jelly_json_path(creature_id), creature_id=creature_id)
+
+def add_jelly_storage(store):
+    """Cache a store from read_jelly_storage(), unless it was loaded or deleted since it was read
+    :returns the cached store or None if deleted
+    """
+    creature_id = store.creature_id
+    if creature_id in jelly_stores:
+        return jelly_stores[creature_id]
+
+    if not P.exists(__jelly_json_path(creature_id)):
+        return None
+
+    jelly_stores[creature_id] = store
+    return store
+
 def load_all_jellies():
+    if startup_tracer.finished:
+        return _load_all_jellies()
+
+    with startup_tracer.phase('load_all_jellies'):
+        return _load_all_jellies()
+
+def _load_all_jellies():
     jellies_dir = get_jellies_dir()
     # TODO sort jellies? last access?
     jellies = []
@@ -463,6 +588,8 @@ def load_all_jellies():
     return jellies
 
 def delete_jelly(creature_id):
+    _jelly_changed(creature_id)
+
     if creature_id in jelly_stores:
         del jelly_stores[creature_id]
 
@@ -546,6 +673,13 @@ def construct_value(store_node, **merge_kwargs):
 
 def construct_creature(store, **merge_kwargs):
     """Construct """
+    if startup_tracer.finished:
+        return _construct_creature(store, **merge_kwargs)
+
+    with startup_tracer.phase('construct_creature {}', store.creature_id):
+        return _construct_creature(store, **merge_kwargs)
+
+def _construct_creature(store, **merge_kwargs):
     constructor_names = store.creature_constructors
     creature_id = store.creature_id
 
@@ -555,6 +689,8 @@ def construct_creature(store, **merge_kwargs):
     Logger.debug('state_storage: construct_creature() id=%s, constructors=%s', creature_id, constructor_names)
 
     creature_part_name = constructor_names[0]
+    # Kept to record the creature's construction (see misc.recording)
+    construct_kwargs = merge_kwargs.copy()
     merge_kwargs.update({'creature_id': creature_id, 'part_name': creature_part_name})
     creature = construct_value(store[creature_part_name], **merge_kwargs)
 
@@ -565,11 +701,18 @@ def construct_creature(store, **merge_kwargs):
 
     creature_parts = store.keys()
     for name in constructor_names[1:]:
-        if name in creature_parts:
-            construct_value(store[name], creature=creature, part_name=name)
-        else:
-            Logger.debug('Creature %s missing part structure "%s"', creature_id, name)
+        # Groups (i.e. tentacles/0/) construct each of their parts
+        part_names = store.parts.get(name, ()) if name[-1] == '/' else (name,)
+        for part_name in part_names:
+            if part_name in creature_parts:
+                construct_value(store[part_name], creature=creature, part_name=part_name)
+            else:
+                Logger.debug('Creature %s missing part structure "%s"', creature_id, part_name)
 
+    creature.construct_kwargs = construct_kwargs
+    creature.construct_store = store
+    if recorder.recording:
+        recorder.construct(creature)
 
     return creature
 
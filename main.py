@@ -3,8 +3,14 @@
 __author__ = 'awhite'
 __version__ = '0.1'
 
+# First, so the startup timeline includes the other imports
+from misc.startup import startup_tracer
+startup_tracer.begin('main imports')
+
 import gettext
-import inspect
+import os
+import os.path as P
+from datetime import datetime
 
 # Localization setup
 gettext.bindtextdomain('messages', 'locale')
@@ -22,23 +28,41 @@ from kivy.app import App
 from kivy.logger import Logger
 from kivy.uix.screenmanager import ScreenManager, Screen
 from kivy.metrics import Metrics
+from kivy.core.window import Window
 
 #from behaviors.basic import FollowPath
-from data import state_storage, constructable
+from data import state_storage
 from data.state_storage import load_app_storage, new_jelly
-from uix import screens
-from uix.elements import *
-from uix.hacks_fixes import *
+from uix import screens, factory_registers
+from uix.kv_loader import kv_loader
+from misc.frame_governor import frame_governor
+from misc.memory import leak_tracker
+from misc.recording import recorder
+from misc.warmup import warmup
+
+startup_tracer.end('main imports')
 
 class MyJellyApp(App):
+    # Key that toggles the ProfilerOverlay
+    profiler_key = 293  # F12
+    # Key that starts/stops recording the session for replay.py
+    recording_key = 292  # F11
+    # Number of the current screen's likely_next() screens prebuilt (those with prebuild set)
+    max_prebuilt = 2
+
     def build(self):
         Logger.debug('dpi=%s', Metrics.dpi)
+        self.profiler_overlay = None
+        Window.bind(on_keyboard=self.on_keyboard)
+        if not startup_tracer.finished:
+            Window.bind(on_flip=self.on_first_frame)
 
         sm = ScreenManager()
         self.screen_manager = sm  # Could use root, but this is more clear
 
         try:
-            self.restore_state()
+            with startup_tracer.phase('restore_state'):
+                self.restore_state()
 
         except:
             Logger.exception('Restoring app state failed')
@@ -47,8 +71,137 @@ class MyJellyApp(App):
         #self.open_animation_constructor()
         Logger.debug('user_data_directory: %s', self.user_data_dir)
 
+        # Adjust quality to the device
+        frame_governor.start()
+
         return sm
 
+    def load_kv(self, filename=None):
+        # Same as App.load_kv, through kv_loader's cache
+        filename = filename or P.join(self.directory, 'myjelly.kv')
+        if not P.exists(filename) or kv_loader.is_loaded(filename):
+            return False
+
+        with startup_tracer.phase('KV parsing'):
+            kv_loader.cache_dir = P.join(self.user_data_dir, 'kv_cache')
+            root = kv_loader.load_file(filename)
+            if root:
+                self.root = root
+
+            return True
+
+    def on_first_frame(self, window):
+        Window.unbind(on_flip=self.on_first_frame)
+        startup_tracer.finish()
+        Logger.info('main: startup timeline\n%s', startup_tracer.report())
+        try:
+            startup_tracer.write(self.user_data_dir, __version__)
+        except IOError:
+            Logger.exception('main: failed to write startup timeline')
+
+        self.start_warmup(startup=True)
+
+    def start_warmup(self, startup=False):
+        """Prefetch what the screens likely opened next need and prebuild them, in idle frames.
+        At startup also read the stores in a background thread and decode their images."""
+        current = self.screen_manager.current_screen
+        idle = [('screens.load {}'.format(name), screens.load, (name,))
+                for name in screens.likely_successors.get(current.__class__.__name__, ())]
+        idle.extend(('prebuild {}'.format(name), self._prebuild_screen, (name, screen_args))
+                    for name, screen_args in current.likely_next())
+
+        warmup.start(idle, [('read jellies', self._warmup_read_jellies, ())] if startup else ())
+
+    def _prebuild_screen(self, name, screen_args):
+        cache = screens.screen_cache
+        key = cache.key(name, screen_args)
+        if key is None or key in cache or cache.num_prebuilt >= self.max_prebuilt:
+            return
+
+        screen_class = screens.load(name)
+        if not screen_class.prebuild:
+            # Too slow to construct within a frame
+            return
+
+        s = screen_class(size=self.screen_manager.size, defer_setup=True, **screen_args)
+        s.suspend()
+        cache.add_prebuilt(key, s)
+        warmup.add_idle('setup {}'.format(name), self._prebuild_setup_step, name, s)
+
+    def _prebuild_setup_step(self, name, screen):
+        # One step per idle frame, open_screen finishes the rest if the screen is opened first
+        if screen.next_setup_step():
+            warmup.add_idle('setup {}'.format(name), self._prebuild_setup_step, name, screen)
+
+    def _warmup_read_jellies(self):
+        # Background thread: read the stores, then cache them and decode their images when idle
+        # The first screen may have loaded them all already (load_all_jellies)
+        jellies_dir = state_storage.get_jellies_dir()
+        for filename in os.listdir(jellies_dir):
+            creature_id, ext = P.splitext(filename)
+            if ext != '.json':
+                continue
+
+            if creature_id in state_storage.jelly_stores:
+                # Its data is only read on the main thread
+                warmup.add_idle('images {}'.format(creature_id), self._warmup_loaded_store, creature_id)
+                continue
+
+            try:
+                store = state_storage.read_jelly_storage(creature_id)
+            except ValueError:
+                Logger.exception('main: failed to read jelly %s', creature_id)
+                continue
+
+            image_filepaths = _image_filepaths([store[key] for key in store.keys()])
+            warmup.add_idle('store {}'.format(creature_id), self._warmup_store, store, image_filepaths)
+
+    def _warmup_loaded_store(self, creature_id):
+        store = state_storage.jelly_stores.get(creature_id)
+        if store is not None:
+            self._warmup_store(store, _image_filepaths([store[key] for key in store.keys()]))
+
+    def _warmup_store(self, store, image_filepaths):
+        from kivy.loader import Loader
+        state_storage.add_jelly_storage(store)
+        # Decoded on Loader threads. load_texture_async finds them in the Loader cache,
+        # which drops images unused for 60 seconds (Kivy's kv.loader timeout).
+        for path in image_filepaths:
+            Loader.image(path)
+
+    def on_keyboard(self, window, key, *args):
+        if key == self.profiler_key:
+            self.toggle_profiler()
+            return True
+
+        if key == self.recording_key:
+            self.toggle_recording()
+            return True
+
+    def toggle_profiler(self):
+        """Show or hide the per-frame timings overlay"""
+        overlay = self.profiler_overlay
+        if overlay is None:
+            from uix.elements import ProfilerOverlay
+            self.profiler_overlay = overlay = ProfilerOverlay()
+
+        if overlay.parent:
+            overlay.parent.remove_widget(overlay)
+        else:
+            Window.add_widget(overlay)
+
+    def toggle_recording(self):
+        """Start or stop recording the session to user_data_dir/recordings/"""
+        if recorder.recording:
+            recorder.stop()
+            return
+
+        directory = P.join(self.user_data_dir, 'recordings')
+        if not P.exists(directory):
+            os.makedirs(directory)
+
+        recorder.start(P.join(directory, datetime.now().strftime('session-%Y%m%d-%H%M%S.jsonl')))
+
     def on_pause(self):
         # try:
         Logger.debug('PAUSE, return True')
@@ -64,6 +217,9 @@ class MyJellyApp(App):
     def on_stop(self):
         # Called in Linux when closing window
         self.save_state()
+        recorder.stop()
+        warmup.cancel()
+        screens.screen_cache.clear()
 
 
     def save_state(self):
@@ -130,36 +286,75 @@ class MyJellyApp(App):
         # FIXME **kwargs make sure works in KV; then refactor
         "screen: instance or string, screen_state: dictionary"
         Logger.debug('Opening screen: %s {%s}', screen, screen_args)
-        screen_class = screens.load(screen)
+        # The user got here first
+        warmup.cancel()
+
+        with startup_tracer.phase('screens.load {}', screen):
+            screen_class = screens.load(screen)
 
         if not issubclass(screen_class, Screen):
             raise ValueError('%s is not a Screen!'%screen)
 
-        current_screen = self.screen_manager.current_screen
+        cache = screens.screen_cache
+        key = cache.key(screen, screen_args)
 
-        try:
-            s = screen_class(**screen_args) if screen_args else screen_class()
-        except:
-            Logger.exception('Failed to open_screen(%s, %s)'%(screen, screen_args))
-            raise
+        transition = self.screen_manager.transition
+        if transition.is_active:
+            # i.e. going back to the screen_out of the transition before it ended.
+            # Finish it, so the screen leaves into the cache and is taken again instead of built twice.
+            transition.stop()
+
+        s = cache.take(key) if key else None
+        # Prebuilt for the previous screen
+        cache.clear_prebuilt()
+
+        if s is not None:
+            Logger.debug('Showing cached or prebuilt screen: %s', screen)
+            # Prebuilt with setup steps left
+            s.finish_setup()
+            s.resume()
+
+        else:
+            try:
+                with startup_tracer.phase('construct {}', screen):
+                    s = screen_class(**screen_args) if screen_args else screen_class()
+            except:
+                Logger.exception('Failed to open_screen(%s, %s)'%(screen, screen_args))
+                raise
+
+        s.cache_key = key if getattr(screen_class, 'cacheable', False) else None
 
         # TODO left/right decision, sort screens?
         self.screen_manager.switch_to(s)
 
-if __name__ == '__main__':
-    app = MyJellyApp()
+        if startup_tracer.finished:
+            # Otherwise started after the first frame
+            self.start_warmup()
 
-    # Specify legal constructor classes
-    for member in inspect.getmembers(constructable):
-        if member[0].startswith('_'):
-            continue
+def _image_filepaths(store_node):
+    """:returns set of image_filepath values in the store data"""
+    paths = set()
+    if isinstance(store_node, dict):
+        for key, value in store_node.viewitems():
+            if key == 'image_filepath':
+                paths.add(value)
+            else:
+                paths.update(_image_filepaths(value))
 
-        clazz = member[1]
-        path = '{}.{}'.format(clazz.__module__, clazz.__name__)
-        state_storage.constructable_members[path] = clazz
+    elif isinstance(store_node, list):
+        for value in store_node:
+            paths.update(_image_filepaths(value))
+
+    return paths
+
+if __name__ == '__main__':
+    app = MyJellyApp()
 
     # Specify data storage directory
     # TODO better directory for android?
     state_storage.user_data_dir = app.user_data_dir
 
+    # Report objects that outlive destroy(), costs a garbage collection after leaving each screen
+    leak_tracker.enabled = bool(os.environ.get('MYJELLY_CHECK_LEAKS'))
+
     app.run()
@@ -0,0 +1,136 @@
+__author__ = 'awhite'
+
+# Adjusts the rates and fidelity of expensive stages to the measured frame time
+
+from kivy.logger import Logger
+from kivy.clock import Clock
+from kivy.event import EventDispatcher
+from kivy.properties import NumericProperty, BooleanProperty
+from kivy.weakmethod import WeakMethod
+
+
+class FrameGovernor(EventDispatcher):
+    """Measures frame time and moves between quality levels to keep frames within the budget
+    of target_fps. Each level decides the values of the decision properties, bind to them.
+    Use frame_governor instead of creating another.
+    """
+
+    target_fps = NumericProperty(60.0)
+
+    # Smoothed seconds between frames
+    frame_time = NumericProperty(0.0)
+
+    # 0 is full quality
+    level = NumericProperty(0)
+
+    ### Decisions ###
+    # Seconds between MeshAnimator vertex updates
+    animation_step = NumericProperty(1 / 30.0)
+    # Physics step of environments
+    simulation_interval = NumericProperty(1 / 60.0)
+    # Drag is applied every drag_interval updates (scaled to match, see apply_drag)
+    drag_interval = NumericProperty(1)
+    # Whether debug visuals are updated
+    debug_visuals = BooleanProperty(True)
+    # Number of creature previews simulated at once, None for all
+    preview_count = NumericProperty(None, allownone=True)
+
+    # Decisions of each level, lowest level first
+    # (animation_step, simulation_interval, drag_interval, debug_visuals, preview_count)
+    levels = (
+        (1 / 30.0, 1 / 60.0, 1, True, None),
+        (1 / 30.0, 1 / 60.0, 2, True, 8),
+        (1 / 20.0, 1 / 45.0, 2, False, 4),
+        (1 / 15.0, 1 / 30.0, 3, False, 2),
+        (1 / 10.0, 1 / 30.0, 4, False, 1),
+    )
+
+    # frame_time smoothing, weight of the newest frame
+    smoothing = 0.1
+    # Seconds between level decisions
+    decision_interval = 1.0
+    # Lower quality above budget * over_budget, raise below budget * under_budget
+    # Frames can't be faster than the budget when Clock limits fps, so under_budget is > 1
+    over_budget = 1.2
+    under_budget = 1.05
+    # Decisions to wait after lowering quality before raising it, to avoid oscillating
+    raise_delay = 10
+
+    def __init__(self, **kwargs):
+        super(FrameGovernor, self).__init__(**kwargs)
+        self.started = False
+        self._raise_wait = 0
+        # WeakMethod of callback(allowed) in the order previews were added
+        self._previews = []
+
+    @property
+    def budget(self):
+        """Target seconds per frame"""
+        return 1.0 / self.target_fps
+
+    def start(self):
+        if self.started:
+            return
+
+        self.started = True
+        self.frame_time = self.budget
+        Clock.schedule_interval(self._on_frame, 0)
+        Clock.schedule_interval(self._decide, self.decision_interval)
+
+    def stop(self):
+        self.started = False
+        Clock.unschedule(self._on_frame)
+        Clock.unschedule(self._decide)
+
+    def _on_frame(self, dt):
+        self.frame_time += (dt - self.frame_time) * self.smoothing
+
+    def _decide(self, dt):
+        budget = self.budget
+        level = self.level
+        if self._raise_wait:
+            self._raise_wait -= 1
+
+        if self.frame_time > budget * self.over_budget and level < len(self.levels) - 1:
+            self._raise_wait = self.raise_delay
+            self.set_level(level + 1)
+
+        elif self.frame_time < budget * self.under_budget and level > 0 and not self._raise_wait:
+            self.set_level(level - 1)
+
+    def set_level(self, level):
+        """Apply the decisions of level"""
+        self.level = level
+        (self.animation_step, self.simulation_interval, self.drag_interval,
+         self.debug_visuals, self.preview_count) = self.levels[level]
+
+        Logger.info('FrameGovernor: frame_time=%.4f level=%d %s', self.frame_time, level, self.decisions())
+
+    def decisions(self):
+        """:returns dict of the current decisions"""
+        return {'level': self.level,
+                'frame_time': self.frame_time,
+                'animation_step': self.animation_step,
+                'simulation_interval': self.simulation_interval,
+                'drag_interval': self.drag_interval,
+                'debug_visuals': self.debug_visuals,
+                'preview_count': self.preview_count,
+                'previews': len(self._previews)}
+
+    def add_preview(self, callback):
+        """Register a preview, callback(allowed) is called now and whenever it's allowed to animate changes"""
+        self._previews.append(WeakMethod(callback))
+        callback(self.preview_count is None or len(self._previews) <= self.preview_count)
+
+    def remove_preview(self, callback):
+        self._previews = [wm for wm in self._previews if not wm.is_dead() and wm() != callback]
+        self.on_preview_count(self, self.preview_count)
+
+    def on_preview_count(self, _, count):
+        # Remove garbage collected
+        self._previews = [wm for wm in self._previews if not wm.is_dead()]
+        for i, wm in enumerate(self._previews):
+            wm()(count is None or i < count)
+
+
+frame_governor = FrameGovernor()
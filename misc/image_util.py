@@ -1,13 +1,17 @@
 __author__ = 'awhite'
 
+import hashlib
+import os
+
 # Potential Issues:
 # If tentacle changes width rapidly, layout_circles could happen to land on a narrow width
 # and make a smaller circle than wanted. Fairly easy to read back and forth and create a better average
 # if needed.
 
-def determine_colored_rows(core_image):
+def determine_colored_rows(core_image, alpha_threshold=0.0):
     """Takes CoreImage, may fail if keep_data=False?
     Returns list of rows that have colored pixels.
+    :param alpha_threshold pixels with alpha above this value are colored
     :returns [(row_y, left_x, right_x), ...]
     Note: Image coordinates y=0 top
     """
@@ -17,8 +21,7 @@ def determine_colored_rows(core_image):
         right = None
         for x in range(core_image.width):
             pixel = core_image.read_pixel(x, y)
-            # alpha > 0
-            if pixel[3] > 0.0:
+            if pixel[3] > alpha_threshold:
                 # print('{0}, {1} pixel={2}'.format(x, y, pixel))
                 if left is None:
                     left = x
@@ -62,3 +65,100 @@ def layout_circles_on_rows(pixel_rows, radius_spacing=1.0):
         next_y = y + radius * radius_multiplier
 
     return circles
+
+
+def load_texture_async(image_filepath, callback):
+    """Decode image_filepath on a kivy Loader worker thread. The texture is created on the main
+    thread and passed to callback(texture) (during this call if the image was already loaded).
+    If loading fails, callback is passed the Loader's error image texture.
+    :returns the loaded texture or a placeholder texture to display until callback is called
+    """
+    from kivy.loader import Loader
+    from kivy.logger import Logger
+    proxy = Loader.image(image_filepath)
+
+    if proxy.loaded:
+        callback(proxy.texture)
+
+    else:
+        def on_load(proxy):
+            proxy.unbind(on_load=on_load, on_error=on_error)
+            callback(proxy.texture)
+
+        def on_error(proxy):
+            proxy.unbind(on_load=on_load, on_error=on_error)
+            Logger.error('image_util: failed to load %s', image_filepath)
+            callback(Loader.error_image.texture)
+
+        proxy.bind(on_load=on_load, on_error=on_error)
+
+    return proxy.texture
+
+# Layouts are cached by image content rather than filepath, so copies of the same image
+# and re-opened construction screens share the (slow) read_pixel scan.
+# Mapping of image hash -> dict in the same format as the persistent store values
+_layout_cache = {}
+# Mapping of filepath -> (mtime, size, hash), so unchanged files aren't hashed again
+_hash_cache = {}
+
+def image_content_hash(image_filepath):
+    """sha1 hex digest of the image file contents, remembered until the file's mtime or size changes"""
+    stat = os.stat(image_filepath)
+    cached = _hash_cache.get(image_filepath)
+    if cached is not None and cached[0] == stat.st_mtime and cached[1] == stat.st_size:
+        return cached[2]
+
+    sha = hashlib.sha1()
+    with open(image_filepath, 'rb') as f:
+        for chunk in iter(lambda: f.read(65536), b''):
+            sha.update(chunk)
+
+    image_hash = sha.hexdigest()
+    _hash_cache[image_filepath] = (stat.st_mtime, stat.st_size, image_hash)
+    return image_hash
+
+def cached_circle_layout(image_filepath, radius_spacing=1.0, alpha_threshold=0.0, store=None):
+    """Same as layout_circles_on_rows(determine_colored_rows(img)), but the rows and circles
+    are cached by image content hash, alpha_threshold and radius_spacing.
+    :param store optional dict-like store (i.e. LazyJsonStore) to persist layouts between runs.
+    Values are dicts keyed by 'rows/<alpha_threshold>' and 'circles/<alpha_threshold>/<radius_spacing>'
+    :returns [(x, y, radius), ...]
+    """
+    image_hash = image_content_hash(image_filepath)
+    rows_key = 'rows/{!r}'.format(float(alpha_threshold))
+    circles_key = 'circles/{!r}/{!r}'.format(float(alpha_threshold), float(radius_spacing))
+
+    layouts = _layout_cache.setdefault(image_hash, {})
+    stored = store[image_hash] if store is not None and image_hash in store else {}
+    for key in (rows_key, circles_key):
+        if key not in layouts and key in stored:
+            layouts[key] = stored[key]
+
+    if circles_key in layouts:
+        if store is not None and circles_key not in stored:
+            # Laid out before without this store
+            store[image_hash] = {key: layouts[key] for key in (rows_key, circles_key) if key in layouts}
+            store.store_sync()
+
+        # JSON turns tuples into lists
+        return [tuple(c) for c in layouts[circles_key]]
+
+    new_layouts = {}
+    if rows_key in layouts:
+        rows = [tuple(r) for r in layouts[rows_key]]
+    else:
+        # Avoid importing kivy unless the image actually needs to be read
+        from kivy.core.image import Image as CoreImage
+        rows = determine_colored_rows(CoreImage(image_filepath, keep_data=True), alpha_threshold)
+        new_layouts[rows_key] = rows
+
+    circles = layout_circles_on_rows(rows, radius_spacing=radius_spacing)
+    new_layouts[circles_key] = circles
+    layouts.update(new_layouts)
+
+    if store is not None:
+        # store merges the new keys into the existing image dict
+        store[image_hash] = new_layouts
+        store.store_sync()
+
+    return circles
@@ -0,0 +1,144 @@
+__author__ = 'awhite'
+
+# Memory accounting of Creatures and detection of objects that outlive destroy()
+
+import gc
+from types import FrameType
+from weakref import ref as weakref_ref
+
+from kivy.clock import Clock
+from kivy.logger import Logger
+
+
+def creature_report(creature):
+    """:returns dict of what a live Creature holds"""
+    # Not at module level, main imports this module before the first frame and cymunk is not needed then
+    from misc.physics_util import PhysicsRegistry
+
+    bodies, shapes, constraints = PhysicsRegistry.group(creature.phy_objects())
+
+    # objects whose methods may be scheduled on the Clock
+    owners = {id(creature)}
+    owners.update(id(bp) for bp in creature.body_parts)
+    animator = getattr(creature, 'mesh_animator', None)
+    if animator is not None:
+        owners.add(id(animator))
+
+    vertices = 0
+    vertex_bytes = 0
+    textures = set()
+    for vertex_buffer, _, _ in creature.batch_meshes():
+        owners.add(id(vertex_buffer))
+        vertices += len(vertex_buffer)
+        vertex_bytes += len(vertex_buffer.data) * vertex_buffer.data.itemsize
+        if vertex_buffer.mesh.texture is not None:
+            textures.add(vertex_buffer.mesh.texture)
+
+    return {'creature_id': creature.creature_id,
+            'class': creature.__class__.__name__,
+            'bodies': len(bodies),
+            'shapes': len(shapes),
+            'constraints': len(constraints),
+            'vertices': vertices,
+            'vertex_bytes': vertex_bytes,
+            'textures': len(textures),
+            'clock_callbacks': pending_clock_callbacks(owners)}
+
+def format_reports(reports):
+    """:returns text table of creature_report()s"""
+    columns = ('bodies', 'shapes', 'constraints', 'vertices', 'vertex_bytes', 'textures', 'clock_callbacks')
+    lines = ['{:<24} '.format('creature') + ' '.join('{:>15}'.format(c) for c in columns)]
+    for report in reports:
+        lines.append('{:<24} '.format(report['creature_id'])
+                     + ' '.join('{:>15}'.format(report[c]) for c in columns))
+
+    return '\n'.join(lines)
+
+def pending_clock_callbacks(owner_ids):
+    """Number of scheduled Clock events that call a method of (or closure over) an object in owner_ids
+    Uses Clock internals (Kivy 1.9), None if not available.
+    """
+    try:
+        events = [event for cid_events in Clock._events.values() for event in cid_events]
+    except AttributeError:
+        return None
+
+    count = 0
+    for event in events:
+        callback = event.get_callback()
+        if callback is None:
+            continue
+
+        owner = getattr(callback, '__self__', None)
+        if owner is not None:
+            if id(owner) in owner_ids:
+                count += 1
+
+        elif getattr(callback, '__closure__', None):
+            # i.e. lambda dt: self.start_animation()
+            if any(id(cell.cell_contents) in owner_ids for cell in callback.__closure__):
+                count += 1
+
+    return count
+
+
+class LeakTracker(object):
+    """Keeps weak references to destroyed objects. check() reports those still reachable.
+    Only tracks while enabled, check() collects garbage on the main thread so it's for debugging
+    (MyJellyApp enables it with the MYJELLY_CHECK_LEAKS environment variable).
+    Use leak_tracker instead of creating another.
+    """
+
+    # Referrer types listed for each leak
+    max_referrers = 5
+
+    def __init__(self):
+        self.enabled = False
+        # (weakref, description)
+        self._tracked = []
+
+    def track(self, obj, description):
+        """Track obj that should be garbage after it's destroyed"""
+        if not self.enabled:
+            return
+
+        try:
+            self._tracked.append((weakref_ref(obj), description))
+        except TypeError:
+            Logger.debug('LeakTracker: cannot weakref %s, not tracked', description)
+
+    def check(self):
+        """Collect garbage and stop tracking collected objects
+        :returns list of (description, [referrer type names]) still reachable"""
+        gc.collect()
+
+        leaks = []
+        tracked = []
+        for wref, description in self._tracked:
+            obj = wref()
+            if obj is None:
+                continue
+
+            tracked.append((wref, description))
+            referrers = [type(r).__name__ for r in gc.get_referrers(obj)
+                         if not isinstance(r, FrameType) and r is not tracked]
+            leaks.append((description, referrers[:self.max_referrers]))
+            del obj
+
+        self._tracked = tracked
+        return leaks
+
+    def log_check(self, *args):
+        for description, referrers in self.check():
+            Logger.warning('LeakTracker: %s still reachable after destroy, referred to by %s',
+                           description, ', '.join(referrers))
+
+    def schedule_check(self, delay=1.0):
+        """log_check() after delay, giving Clock callbacks time to be released. Nothing if not enabled."""
+        if not self.enabled:
+            return
+
+        Clock.schedule_once(self.log_check, delay)
+
+
+leak_tracker = LeakTracker()
@@ -1,7 +1,14 @@
 __author__ = 'awhite'
 
 # from math import radians
-from cymunk import Vec2d
+import csv
+import json
+from collections import OrderedDict
+from math import sqrt
+
+from cymunk import Vec2d, Body, Shape, Constraint, DampedSpring
+
+from misc.profiling import RingBuffer, timer
 
 def cleanup_space(space):
     """Remove all constraints, shapes, and bodies from a Cymunk Space
@@ -21,6 +28,213 @@ def cleanup_space(space):
     space.remove(*space.bodies)
     assert len(space.bodies) == 0
 
+class PhysicsRegistry(object):
+    """Adds and removes physics objects to a cymunk Space and tracks what was added.
+    Objects are grouped by type and passed to Space.add()/remove() in the order Body > Shape > Constraint
+    for add, reversed for remove. cymunk still adds each object separately, this is not a bulk operation.
+
+    Adding an object twice, removing an object that was not added, or removing a body while its
+    constraints stay in the Space raises ValueError (before the Space is modified).
+    """
+
+    def __init__(self, space):
+        self.space = space
+        self.bodies = set()
+        self.shapes = set()
+        self.constraints = set()
+        # Mapping of registered Body > set of registered constraints attached to it
+        self._body_constraints = {}
+
+    def __len__(self):
+        return len(self.bodies) + len(self.shapes) + len(self.constraints)
+
+    def __contains__(self, obj):
+        return obj in self.bodies or obj in self.shapes or obj in self.constraints
+
+    @staticmethod
+    def group(objects):
+        """:returns bodies, shapes, constraints lists"""
+        bodies = []
+        shapes = []
+        constraints = []
+        for o in objects:
+            if isinstance(o, Constraint):
+                constraints.append(o)
+            elif isinstance(o, Shape):
+                shapes.append(o)
+            elif isinstance(o, Body):
+                bodies.append(o)
+            else:
+                raise ValueError('Not a physics object: {!r}'.format(o))
+
+        return bodies, shapes, constraints
+
+    def add(self, objects):
+        """Add the physics objects (any iterable) to the Space"""
+        bodies, shapes, constraints = self.group(objects)
+
+        for group, registered in ((bodies, self.bodies), (shapes, self.shapes),
+                                  (constraints, self.constraints)):
+            if not registered.isdisjoint(group) or len(set(group)) != len(group):
+                raise ValueError('Physics object added twice')
+
+        space = self.space
+        space.add(*bodies)
+        space.add(*shapes)
+        space.add(*constraints)
+
+        self.bodies.update(bodies)
+        self.shapes.update(shapes)
+        self.constraints.update(constraints)
+
+        body_constraints = self._body_constraints
+        for body in bodies:
+            body_constraints[body] = set()
+
+        for constraint in constraints:
+            for body in (constraint.a, constraint.b):
+                if body in body_constraints:
+                    body_constraints[body].add(constraint)
+
+    def remove(self, objects):
+        """Remove the physics objects (any iterable) from the Space"""
+        bodies, shapes, constraints = self.group(objects)
+
+        for group, registered in ((bodies, self.bodies), (shapes, self.shapes),
+                                  (constraints, self.constraints)):
+            if not registered.issuperset(group):
+                raise ValueError('Physics object was not added')
+
+        body_constraints = self._body_constraints
+        removed_constraints = set(constraints)
+        for body in bodies:
+            if not body_constraints[body] <= removed_constraints:
+                raise ValueError('Removing body would leak {} constraints'
+                                 .format(len(body_constraints[body] - removed_constraints)))
+
+        space = self.space
+        space.remove(*constraints)
+        space.remove(*shapes)
+        space.remove(*bodies)
+
+        self.constraints.difference_update(constraints)
+        self.shapes.difference_update(shapes)
+        self.bodies.difference_update(bodies)
+
+        for constraint in constraints:
+            for body in (constraint.a, constraint.b):
+                if body in body_constraints:
+                    body_constraints[body].discard(constraint)
+
+        for body in bodies:
+            del body_constraints[body]
+
+    def clear(self):
+        """Remove all registered objects from the Space"""
+        self.remove(list(self.constraints) + list(self.shapes) + list(self.bodies))
+
+
+class PhysicsSampler(object):
+    """Steps a cymunk Space, sampling its statistics every interval seconds into ring buffers.
+    Samples can be written to CSV or JSON.
+    """
+
+    # time is seconds since the sampler was created
+    # step_duration is the mean seconds per step() since the previous sample
+    # max_spring_force is the largest DampedSpring force (stiffness * stretch)
+    fields = ('time', 'bodies', 'shapes', 'constraints', 'step_duration', 'max_velocity', 'max_spring_force')
+
+    def __init__(self, space, interval=1.0, size=600):
+        """:param interval: seconds between samples, None to never sample
+        :param size: number of samples kept"""
+        self.space = space
+        self.interval = interval
+        self.samples = OrderedDict((field, RingBuffer(size)) for field in self.fields)
+
+        self._start = self._last_sample = timer()
+        self._step_total = 0.0
+        self._steps = 0
+
+    def __len__(self):
+        return len(self.samples['time'])
+
+    def step(self, dt):
+        """Step the space
+        :returns seconds the step took"""
+        start = timer()
+        self.space.step(dt)
+        end = timer()
+
+        duration = end - start
+        self._step_total += duration
+        self._steps += 1
+        if self.interval is not None and end - self._last_sample >= self.interval:
+            self.sample()
+
+        return duration
+
+    def sample(self):
+        space = self.space
+        now = self._last_sample = timer()
+
+        max_velocity_sqd = 0.0
+        for body in space.bodies:
+            velocity_sqd = body.velocity.get_length_sqrd()
+            if velocity_sqd > max_velocity_sqd:
+                max_velocity_sqd = velocity_sqd
+
+        max_spring_force = 0.0
+        for constraint in space.constraints:
+            if isinstance(constraint, DampedSpring):
+                dist = world_pos_of_offset(constraint.a, constraint.anchr1)\
+                    .get_distance(world_pos_of_offset(constraint.b, constraint.anchr2))
+                force = abs(dist - constraint.rest_length) * constraint.stiffness
+                if force > max_spring_force:
+                    max_spring_force = force
+
+        values = (now - self._start, len(space.bodies), len(space.shapes), len(space.constraints),
+                  self._step_total / self._steps if self._steps else 0.0,
+                  sqrt(max_velocity_sqd), max_spring_force)
+        for buf, value in zip(self.samples.values(), values):
+            buf.append(value)
+
+        self._step_total = 0.0
+        self._steps = 0
+
+    def rows(self):
+        """:returns list of sample tuples (in fields order), oldest first"""
+        return zip(*[buf.values() for buf in self.samples.values()])
+
+    def write_csv(self, path):
+        with open(path, 'wb') as f:
+            writer = csv.writer(f)
+            writer.writerow(self.fields)
+            writer.writerows(self.rows())
+
+    def write_json(self, path):
+        with open(path, 'w') as f:
+            json.dump([dict(zip(self.fields, row)) for row in self.rows()], f)
+
+
+def apply_drag(body, drag_constant, multiplier=1.0, max_impulse=None):
+    """Apply the drag impulse -velocity * speed^2 * drag_constant to the body.
+
+    :param multiplier: scales the impulse, i.e. for skipped updates or longer time steps.
+    The scaled impulse is limited to stopping the body, so it never reverses the velocity.
+    :param max_impulse: impulses with a squared length above max_impulse get length max_impulse
+    before scaling (same as SoftBody.step max_drag), None for no limit
+    """
+    velocity = body.velocity
+    speed_sqrd = velocity.get_length_sqrd()
+    drag = speed_sqrd * drag_constant
+    if max_impulse is not None and speed_sqrd * drag * drag > max_impulse:
+        drag = max_impulse / sqrt(speed_sqrd)
+
+    drag = min(drag * multiplier, body.mass)
+    if drag:
+        body.apply_impulse(velocity * -drag)
+
+
 # TODO maybe contribute these to cymunk
 def world_pos_of_offset(body, offset_pos):
     """Calculates the world vector to the offset_pos relative to the body.
@@ -0,0 +1,124 @@
+__author__ = 'awhite'
+
+# Timing instrumentation of frame stages
+# Usage (check enabled first, so disabled instrumentation only costs an attribute lookup):
+#     if profiler.enabled:
+#         start = timer()
+#     ...
+#     if profiler.enabled:
+#         profiler.record('name', timer() - start)
+# The profiler is not thread-safe, record on the main thread only (see on_main_thread).
+
+import threading
+from array import array
+from timeit import default_timer as timer
+
+# Imported by main before any other thread starts
+_main_thread = threading.current_thread()
+
+def on_main_thread():
+    return threading.current_thread() is _main_thread
+
+
+class RingBuffer(object):
+    """Fixed size buffer of the most recent float values"""
+
+    __slots__ = ('_values', '_size', '_next', '_count')
+
+    def __init__(self, size):
+        if size < 1:
+            raise ValueError('size must be at least 1')
+
+        self._values = array('d', [0.0]) * size
+        self._size = size
+        self._next = 0
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    def append(self, value):
+        self._values[self._next] = value
+        self._next = (self._next + 1) % self._size
+        if self._count < self._size:
+            self._count += 1
+
+    def clear(self):
+        self._next = 0
+        self._count = 0
+
+    def values(self):
+        """:returns list of values, oldest first"""
+        if self._count < self._size:
+            return self._values[:self._count].tolist()
+
+        return (self._values[self._next:] + self._values[:self._next]).tolist()
+
+    def summary(self, percentiles=(50, 90, 99)):
+        """:returns dict of count, mean, max and p<percentile> (nearest rank), None if empty"""
+        if not self._count:
+            return None
+
+        values = sorted(self.values())
+        count = len(values)
+        summary = {'count': count,
+                   'mean': sum(values) / count,
+                   'max': values[-1]}
+        for p in percentiles:
+            # nearest rank
+            rank = max(1, int(-(-p * count // 100)))
+            summary['p{}'.format(p)] = values[rank - 1]
+
+        return summary
+
+
+class FrameProfiler(object):
+    """Ring buffers of durations (seconds) by section name.
+    Use profiler instead of creating another.
+    """
+
+    def __init__(self, size=300):
+        # Number of samples kept for each section
+        self.size = size
+        self.enabled = False
+        self.sections = {}
+
+    def record(self, name, duration):
+        try:
+            self.sections[name].append(duration)
+        except KeyError:
+            buf = self.sections[name] = RingBuffer(self.size)
+            buf.append(duration)
+
+    def call(self, name, func, *args):
+        """func(*args), recording its duration as name while enabled
+        :returns what func returns"""
+        if not self.enabled:
+            return func(*args)
+
+        start = timer()
+        try:
+            return func(*args)
+        finally:
+            self.record(name, timer() - start)
+
+    def clear(self):
+        self.sections.clear()
+
+    def summary(self):
+        """:returns dict of section name -> RingBuffer.summary()"""
+        return {name: buf.summary() for name, buf in self.sections.viewitems()}
+
+    def format_summary(self):
+        """:returns text table of the summary in milliseconds, slowest p90 first"""
+        summary = self.summary()
+        lines = ['{:<32} {:>6} {:>7} {:>7} {:>7}'.format('section', 'count', 'p50 ms', 'p90 ms', 'max ms')]
+        for name in sorted(summary, key=lambda n: summary[n]['p90'], reverse=True):
+            s = summary[name]
+            lines.append('{:<32} {:>6} {:>7.3f} {:>7.3f} {:>7.3f}'.format(
+                name, s['count'], s['p50'] * 1000, s['p90'] * 1000, s['max'] * 1000))
+
+        return '\n'.join(lines)
+
+
+profiler = FrameProfiler()
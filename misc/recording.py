@@ -0,0 +1,327 @@
+__author__ = 'awhite'
+
+# Recording of the inputs that drive creatures, so a session can be replayed deterministically
+# and as fast as possible (see replay.py).
+#
+# A recording is a header JSON object line followed by one JSON list per event:
+#     ['env', env_num, width, height, batch_rendering]
+#     ['construct', creature_num, creature_id, construct_kwargs, store_data]
+#       (store_data is the creature's store contents when first seen, null if it has no construct_store.
+#        Version 1 recordings have no store_data.)
+#     ['add', env_num, creature_num]
+#     ['remove', env_num, creature_num]
+#     ['destroy', env_num]
+#     ['dt', env_num, dt, update_interval]
+#     ['orient', creature_num, angle, throttle]
+#     ['tweak', creature_num, part_name, tweak_name, value]
+#     ['level', frame_governor level]
+#     ['touch', 'down'|'move'|'up', uid, sx, sy]  (position relative to the window size)
+#
+# Instrumented code checks recording first, so it costs an attribute lookup when not recording:
+#     if recorder.recording:
+#         recorder.orient(self, angle, throttle)
+
+import json
+import random
+from itertools import count
+from weakref import WeakKeyDictionary
+
+from kivy.clock import Clock
+from kivy.logger import Logger
+
+from misc.frame_governor import frame_governor
+from misc.profiling import timer
+
+format_name = 'myjelly-session'
+format_version = 2
+
+
+def _jsonable(obj):
+    # Vec2d, tuples of Vec2d, etc.
+    return list(obj)
+
+
+class SessionRecorder(object):
+    """Writes the events of environments and creatures to a file while recording.
+    Use recorder instead of creating another.
+
+    Environments and creatures are numbered the first time they're seen. Start recording before
+    the screen is opened, creatures seen later are recorded as constructed at that time.
+    """
+
+    def __init__(self):
+        self.recording = False
+        self.path = None
+        self._file = None
+        self._touches = False
+        self._envs = WeakKeyDictionary()
+        self._creatures = WeakKeyDictionary()
+        self._env_nums = count()
+        self._creature_nums = count()
+
+    def start(self, path, seed=None, touches=True):
+        """Start recording to path (overwritten).
+        random is seeded so replays get the same random values, in the same order.
+        :param touches: record the touches of the Window
+        """
+        if self.recording:
+            self.stop()
+
+        if seed is None:
+            seed = random.randint(0, 2 ** 31)
+
+        self._file = open(path, 'w')
+        self.path = path
+        self._write({'format': format_name, 'version': format_version, 'seed': seed,
+                     'level': frame_governor.level})
+
+        random.seed(seed)
+        frame_governor.bind(level=self._on_level)
+
+        self._touches = touches
+        if touches:
+            from kivy.core.window import Window
+            Window.bind(on_touch_down=self._on_touch_down, on_touch_move=self._on_touch_move,
+                        on_touch_up=self._on_touch_up)
+
+        self.recording = True
+        Logger.info('SessionRecorder: recording to %s', path)
+
+    def stop(self):
+        """:returns path of the recording"""
+        if not self.recording:
+            return self.path
+
+        self.recording = False
+        frame_governor.unbind(level=self._on_level)
+
+        if self._touches:
+            from kivy.core.window import Window
+            Window.unbind(on_touch_down=self._on_touch_down, on_touch_move=self._on_touch_move,
+                          on_touch_up=self._on_touch_up)
+
+        self._file.close()
+        self._file = None
+        self._envs.clear()
+        self._creatures.clear()
+        self._env_nums = count()
+        self._creature_nums = count()
+
+        Logger.info('SessionRecorder: stopped recording to %s', self.path)
+        return self.path
+
+    def _write(self, event):
+        self._file.write(json.dumps(event, default=_jsonable))
+        self._file.write('\n')
+
+    def _env_num(self, env):
+        num = self._envs.get(env)
+        if num is None:
+            num = self._envs[env] = next(self._env_nums)
+            self._write(('env', num, env.width, env.height, env.batch_rendering))
+            for creature in env.creatures:
+                self._write(('add', num, self._creature_num(creature)))
+
+        return num
+
+    def _creature_num(self, creature):
+        num = self._creatures.get(creature)
+        if num is None:
+            num = self._creatures[creature] = next(self._creature_nums)
+            store = getattr(creature, 'construct_store', None)
+            self._write(('construct', num, creature.creature_id, getattr(creature, 'construct_kwargs', {}),
+                         store.data if store is not None else None))
+
+        return num
+
+    ### Events ###
+    def construct(self, creature):
+        self._creature_num(creature)
+
+    def add_creature(self, env, creature):
+        """Call before creature is in env.creatures"""
+        self._write(('add', self._env_num(env), self._creature_num(creature)))
+
+    def remove_creature(self, env, creature):
+        self._write(('remove', self._env_num(env), self._creature_num(creature)))
+
+    def destroy(self, env):
+        num = self._envs.pop(env, None)
+        if num is not None:
+            self._write(('destroy', num))
+
+    def update_simulation(self, env, dt):
+        self._write(('dt', self._env_num(env), dt, env.update_interval))
+
+    def orient(self, creature, angle, throttle):
+        self._write(('orient', self._creature_num(creature), angle, throttle))
+
+    def tweak(self, creature, part_name, tweak_name, value):
+        self._write(('tweak', self._creature_num(creature), part_name, tweak_name, value))
+
+    def _on_level(self, _, level):
+        self._write(('level', level))
+
+    def _touch(self, kind, touch):
+        self._write(('touch', kind, touch.uid, touch.sx, touch.sy))
+
+    def _on_touch_down(self, window, touch):
+        self._touch('down', touch)
+
+    def _on_touch_move(self, window, touch):
+        self._touch('move', touch)
+
+    def _on_touch_up(self, window, touch):
+        self._touch('up', touch)
+
+
+recorder = SessionRecorder()
+
+
+def read_session(path):
+    """:returns (header dict, list of events)"""
+    with open(path) as f:
+        header = json.loads(f.readline())
+        if header.get('format') != format_name:
+            raise ValueError('{} is not a session recording'.format(path))
+
+        if header['version'] > format_version:
+            raise ValueError('{} has unsupported version {}'.format(path, header['version']))
+
+        events = [json.loads(line) for line in f if line.strip()]
+
+    return header, events
+
+
+class SessionReplayer(object):
+    """Replays a recording by calling the same methods the app called, without waiting between steps.
+
+    :param make_environment: callable(width, height, batch_rendering) returning an initialized
+    and paused BasicEnvironment; the replayer steps it with the recorded dt
+    :param construct: callable(creature_id, store_data, **construct_kwargs) returning a Creature,
+    store_data is the recorded store contents (None if not recorded)
+    :param tick: callable(dt) called after each step to advance the Clock (animations), i.e. VirtualClock.tick
+    :param on_touch: optional callable(kind, uid, sx, sy) for recorded touches
+    """
+
+    def __init__(self, path, make_environment, construct, tick=None, on_touch=None):
+        self.header, self.events = read_session(path)
+        self.make_environment = make_environment
+        self.construct = construct
+        self.tick = tick
+        self.on_touch = on_touch
+
+        # num -> object
+        self.environments = {}
+        self.creatures = {}
+
+    def run(self):
+        """Replay all events, destroying environments left at the end
+        :returns dict of steps, simulated seconds, wall seconds and event count
+        """
+        random.seed(self.header['seed'])
+        if frame_governor.level != self.header['level']:
+            frame_governor.set_level(self.header['level'])
+
+        environments = self.environments
+        creatures = self.creatures
+        tick = self.tick
+        steps = 0
+        simulated = 0.0
+        start = timer()
+
+        for event in self.events:
+            kind = event[0]
+            if kind == 'dt':
+                _, env_num, dt, update_interval = event
+                env = environments[env_num]
+                if env.update_interval != update_interval:
+                    env.update_interval = update_interval
+
+                env.update_simulation(dt)
+                if tick is not None:
+                    tick(dt)
+
+                steps += 1
+                simulated += dt
+
+            elif kind == 'orient':
+                _, creature_num, angle, throttle = event
+                creatures[creature_num].orient(angle, throttle)
+
+            elif kind == 'tweak':
+                _, creature_num, part_name, tweak_name, value = event
+                creatures[creature_num].adjust_part_tweak(part_name, tweak_name, value)
+
+            elif kind == 'construct':
+                creature_num, creature_id, construct_kwargs = event[1:4]
+                store_data = event[4] if len(event) > 4 else None
+                creatures[creature_num] = self.construct(creature_id, store_data, **construct_kwargs)
+
+            elif kind == 'add':
+                environments[event[1]].add_creature(creatures[event[2]])
+
+            elif kind == 'remove':
+                environments[event[1]].remove_creature(creatures.pop(event[2]))
+
+            elif kind == 'env':
+                _, env_num, width, height, batch_rendering = event
+                environments[env_num] = self.make_environment(width, height, batch_rendering)
+
+            elif kind == 'destroy':
+                environments.pop(event[1]).destroy()
+
+            elif kind == 'level':
+                frame_governor.set_level(event[1])
+
+            elif kind == 'touch':
+                if self.on_touch is not None:
+                    self.on_touch(*event[1:])
+
+            else:
+                Logger.warning('SessionReplayer: unknown event %s', kind)
+
+        for env in environments.values():
+            env.destroy()
+
+        environments.clear()
+        creatures.clear()
+
+        return {'steps': steps, 'simulated': simulated, 'wall': timer() - start, 'events': len(self.events)}
+
+
+class VirtualClock(object):
+    """Time source for Kivy's Clock that only advances by tick(dt), so Clock callbacks
+    (i.e. Animations) see the recorded timesteps instead of the wall clock and never sleep.
+    Replaces Clock internals (Kivy 1.9) between install() and uninstall().
+    """
+
+    def __init__(self):
+        self.now = 0.0
+        self._original = None
+
+    def __call__(self):
+        return self.now
+
+    def install(self):
+        import kivy.clock as kivy_clock
+        if not hasattr(kivy_clock, '_default_time'):
+            raise RuntimeError('VirtualClock does not support this version of Kivy')
+
+        self._original = (kivy_clock._default_time, Clock._max_fps)
+        self.now = Clock._last_tick
+        kivy_clock._default_time = self
+        # Don't sleep to limit fps
+        Clock._max_fps = 0
+
+    def uninstall(self):
+        if self._original is None:
+            return
+
+        import kivy.clock as kivy_clock
+        kivy_clock._default_time, Clock._max_fps = self._original
+        self._original = None
+
+    def tick(self, dt):
+        self.now += dt
+        Clock.tick()
@@ -0,0 +1,252 @@
+__author__ = 'awhite'
+
+# Mass-spring soft body simulated outside of the cymunk Space.
+# The spring and damping math mirrors Chipmunk's DampedSpring so tweaks behave similarly.
+
+from array import array
+from math import sqrt, exp, sin, cos
+
+
+class SoftBody(object):
+    """Point masses (nodes) connected by damped springs.
+    State is kept in flat arrays (structure of arrays) and each stage of step() is a single pass
+    over them, instead of one cymunk Body, Shape and Constraint per node in the Space.
+
+    Nodes do not collide with anything. External cymunk bodies are coupled only through
+    pins (a node held at a fixed distance from a point on the body) and body springs;
+    the reaction impulses are applied to the external body.
+    """
+
+    def __init__(self):
+        # Nodes
+        self.x = array('d')
+        self.y = array('d')
+        self.vx = array('d')
+        self.vy = array('d')
+        self.inv_mass = array('d')
+
+        # Springs between two nodes
+        self.spring_a = array('l')
+        self.spring_b = array('l')
+        self.rest_length = array('d')
+        self.stiffness = array('d')
+        self.damping = array('d')
+
+        # Couplings to external bodies, lists because they reference bodies
+        # [node, body, anchor, rest_length, stiffness, damping]
+        self.body_springs = []
+        # [node, body, anchor, distance]
+        self.pins = []
+
+    def __len__(self):
+        return len(self.x)
+
+    def add_node(self, pos, mass):
+        """:returns node index"""
+        self.x.append(pos[0])
+        self.y.append(pos[1])
+        self.vx.append(0.0)
+        self.vy.append(0.0)
+        self.inv_mass.append(1.0 / mass)
+        return len(self.x) - 1
+
+    def set_mass(self, node, mass):
+        self.inv_mass[node] = 1.0 / mass
+
+    def add_spring(self, a, b, stiffness, damping, rest_length=None):
+        """Spring between nodes a and b
+        :param rest_length: defaults to the current distance between the nodes
+        :returns spring index
+        """
+        if rest_length is None:
+            rest_length = sqrt((self.x[b] - self.x[a]) ** 2 + (self.y[b] - self.y[a]) ** 2)
+
+        self.spring_a.append(a)
+        self.spring_b.append(b)
+        self.rest_length.append(rest_length)
+        self.stiffness.append(stiffness)
+        self.damping.append(damping)
+        return len(self.spring_a) - 1
+
+    def set_spring_params(self, index, stiffness, damping):
+        self.stiffness[index] = stiffness
+        self.damping[index] = damping
+
+    def add_body_spring(self, node, body, anchor, rest_length, stiffness, damping):
+        """Spring between an anchor offset on an external body (as used in cymunk constraints)
+        and a node.
+        :returns body spring index
+        """
+        self.body_springs.append([node, body, (anchor[0], anchor[1]), rest_length, stiffness, damping])
+        return len(self.body_springs) - 1
+
+    def set_body_spring_params(self, index, stiffness, damping):
+        body_spring = self.body_springs[index]
+        body_spring[4] = stiffness
+        body_spring[5] = damping
+
+    def add_pin(self, node, body, anchor):
+        """Keep node at its current distance from the anchor offset on an external body
+        (like a cymunk PinJoint)
+        :returns pin index
+        """
+        ax, ay = _world_anchor(body, anchor)
+        distance = sqrt((self.x[node] - ax) ** 2 + (self.y[node] - ay) ** 2)
+        self.pins.append([node, body, (anchor[0], anchor[1]), distance])
+        return len(self.pins) - 1
+
+    def translate(self, dx, dy):
+        x = self.x
+        y = self.y
+        for i in range(len(x)):
+            x[i] += dx
+            y[i] += dy
+
+    def step(self, dt, drag_constant=0.0, max_drag=30.0, drag_scale=1.0):
+        """Advance the simulation dt seconds.
+        drag: impulse of -velocity * speed^2 * drag_constant, limited to max_drag, then scaled by drag_scale
+        but never more than stops the node (same as the cymunk GooeyBodyPart drag, see apply_drag)
+        """
+        x = self.x
+        y = self.y
+        vx = self.vx
+        vy = self.vy
+        inv_mass = self.inv_mass
+        num_nodes = len(x)
+
+        # Drag impulses
+        if drag_constant:
+            for i in range(num_nodes):
+                vxi = vx[i]
+                vyi = vy[i]
+                speed_sqd = vxi * vxi + vyi * vyi
+                drag = speed_sqd * drag_constant
+                if speed_sqd * drag * drag > max_drag:
+                    drag = max_drag / sqrt(speed_sqd)
+
+                drag *= inv_mass[i] * drag_scale
+                if drag > 1.0:
+                    drag = 1.0
+
+                vx[i] = vxi - vxi * drag
+                vy[i] = vyi - vyi * drag
+
+        # Node springs
+        spring_a = self.spring_a
+        spring_b = self.spring_b
+        rest_length = self.rest_length
+        stiffness = self.stiffness
+        damping = self.damping
+        for s in range(len(spring_a)):
+            a = spring_a[s]
+            b = spring_b[s]
+            dx = x[b] - x[a]
+            dy = y[b] - y[a]
+            dist = sqrt(dx * dx + dy * dy)
+            if dist == 0.0:
+                continue
+
+            nx = dx / dist
+            ny = dy / dist
+            inv_ma = inv_mass[a]
+            inv_mb = inv_mass[b]
+            k = inv_ma + inv_mb
+
+            # Spring impulse plus damping impulse that removes part of the relative normal velocity
+            vrn = (vx[b] - vx[a]) * nx + (vy[b] - vy[a]) * ny
+            j = (rest_length[s] - dist) * stiffness[s] * dt \
+                - vrn * (1.0 - exp(-damping[s] * dt * k)) / k
+
+            vx[a] -= nx * j * inv_ma
+            vy[a] -= ny * j * inv_ma
+            vx[b] += nx * j * inv_mb
+            vy[b] += ny * j * inv_mb
+
+        # Springs to external bodies
+        for node, body, anchor, rest, spring_stiffness, spring_damping in self.body_springs:
+            rx, ry, ax, ay, bvx, bvy = _anchor_state(body, anchor)
+            dx = x[node] - ax
+            dy = y[node] - ay
+            dist = sqrt(dx * dx + dy * dy)
+            if dist == 0.0:
+                continue
+
+            nx = dx / dist
+            ny = dy / dist
+            inv_mn = inv_mass[node]
+            rcn = rx * ny - ry * nx
+            k = inv_mn + 1.0 / body.mass + rcn * rcn / body.moment
+
+            vrn = (vx[node] - bvx) * nx + (vy[node] - bvy) * ny
+            j = (rest - dist) * spring_stiffness * dt \
+                - vrn * (1.0 - exp(-spring_damping * dt * k)) / k
+
+            vx[node] += nx * j * inv_mn
+            vy[node] += ny * j * inv_mn
+            body.apply_impulse((-nx * j, -ny * j), (rx, ry))
+
+        # Pins, remove relative velocity along the pin
+        for node, body, anchor, distance in self.pins:
+            rx, ry, ax, ay, bvx, bvy = _anchor_state(body, anchor)
+            dx = x[node] - ax
+            dy = y[node] - ay
+            dist = sqrt(dx * dx + dy * dy)
+            inv_mn = inv_mass[node]
+            if dist == 0.0:
+                # Follow anchor in both directions
+                body_inv_mass = 1.0 / body.mass
+                jx = (bvx - vx[node]) / (inv_mn + body_inv_mass)
+                jy = (bvy - vy[node]) / (inv_mn + body_inv_mass)
+
+            else:
+                nx = dx / dist
+                ny = dy / dist
+                rcn = rx * ny - ry * nx
+                k = inv_mn + 1.0 / body.mass + rcn * rcn / body.moment
+                j = -((vx[node] - bvx) * nx + (vy[node] - bvy) * ny) / k
+                jx = nx * j
+                jy = ny * j
+
+            vx[node] += jx * inv_mn
+            vy[node] += jy * inv_mn
+            body.apply_impulse((-jx, -jy), (rx, ry))
+
+        # Integrate positions
+        for i in range(num_nodes):
+            x[i] += vx[i] * dt
+            y[i] += vy[i] * dt
+
+        # Correct pin drift by moving the node (external bodies are assumed much heavier)
+        for node, body, anchor, distance in self.pins:
+            ax, ay = _world_anchor(body, anchor)
+            dx = x[node] - ax
+            dy = y[node] - ay
+            dist = sqrt(dx * dx + dy * dy)
+            if dist == 0.0:
+                continue
+
+            correction = distance / dist
+            x[node] = ax + dx * correction
+            y[node] = ay + dy * correction
+
+
+def _world_anchor(body, anchor):
+    """World position of the anchor offset on body (see physics_util.world_pos_of_offset)"""
+    angle = body.angle
+    c = cos(angle)
+    s = sin(angle)
+    pos = body.position
+    return pos.x + anchor[0] * c - anchor[1] * s, pos.y + anchor[0] * s + anchor[1] * c
+
+def _anchor_state(body, anchor):
+    """:returns rx, ry, x, y, vx, vy of the anchor offset on body
+    where r is the rotated offset from the body center (as used by apply_impulse)"""
+    angle = body.angle
+    c = cos(angle)
+    s = sin(angle)
+    rx = anchor[0] * c - anchor[1] * s
+    ry = anchor[0] * s + anchor[1] * c
+    pos = body.position
+    vel = body.velocity
+    w = body.angular_velocity
+    return rx, ry, pos.x + rx, pos.y + ry, vel.x - w * ry, vel.y + w * rx
@@ -0,0 +1,201 @@
+__author__ = 'awhite'
+
+# Spatial indexes for nearest point queries
+
+from heapq import heappush, heapreplace
+from math import floor, sqrt
+
+# Node fields (nodes are tuples to keep them small)
+_X, _Y, _ITEM, _AXIS, _LEFT, _RIGHT = range(6)
+
+
+class KDTree(object):
+    """Static 2D k-d tree for k-nearest point queries.
+    Points are copied when building, so create a new tree if the points move.
+    """
+
+    __slots__ = ('_root', '_size')
+
+    def __init__(self, points, items=None):
+        """
+        :param points: sequence of positions (any object where pos[0], pos[1] denotes x, y)
+        :param items: objects associated with each point, returned by queries.
+        Defaults to the index of the point.
+        """
+        if items is None:
+            items = range(len(points))
+        elif len(items) != len(points):
+            raise ValueError('Number of items ({}) != number of points ({})'.format(len(items), len(points)))
+
+        nodes = [(float(p[0]), float(p[1]), item) for p, item in zip(points, items)]
+        self._size = len(nodes)
+        self._root = self._build(nodes, 0)
+
+    def __len__(self):
+        return self._size
+
+    @classmethod
+    def _build(cls, nodes, axis):
+        if not nodes:
+            return None
+
+        nodes.sort(key=lambda n: n[axis])
+        median = len(nodes) // 2
+        x, y, item = nodes[median]
+        next_axis = 1 - axis
+        return (x, y, item, axis,
+                cls._build(nodes[:median], next_axis),
+                cls._build(nodes[median + 1:], next_axis))
+
+    def nearest(self, pos, k=1):
+        """Find the k nearest points to pos.
+        :returns list of (distance, item) closest first (less than k if the tree is smaller)
+        """
+        if k < 1 or self._root is None:
+            return []
+
+        x = float(pos[0])
+        y = float(pos[1])
+
+        # max-heap of (-distance_squared, order, item), order avoids comparing items
+        best = []
+        order = 0
+        # (squared distance to region lower bound, node)
+        stack = [(0.0, self._root)]
+        while stack:
+            bound_sqd, node = stack.pop()
+            if node is None or (len(best) == k and bound_sqd >= -best[0][0]):
+                # region can't contain anything closer than the current kth
+                continue
+
+            dx = node[_X] - x
+            dy = node[_Y] - y
+            dist_sqd = dx * dx + dy * dy
+            if len(best) < k:
+                heappush(best, (-dist_sqd, order, node[_ITEM]))
+                order += 1
+            elif dist_sqd < -best[0][0]:
+                heapreplace(best, (-dist_sqd, order, node[_ITEM]))
+                order += 1
+
+            # Signed distance to the splitting line
+            diff = dx if node[_AXIS] == 0 else dy
+            if diff > 0:
+                near, far = node[_LEFT], node[_RIGHT]
+            else:
+                near, far = node[_RIGHT], node[_LEFT]
+
+            # near is pushed last so it's searched first
+            stack.append((diff * diff, far))
+            stack.append((bound_sqd, near))
+
+        best.sort(reverse=True)
+        return [(sqrt(-neg_dist_sqd), item) for neg_dist_sqd, _, item in best]
+
+
+class PointGrid(object):
+    """Uniform grid of moving points for nearest point queries within a distance.
+    Items must be hashable. Queries visit the cells within max_distance, so choose cell_size
+    around the usual max_distance.
+    """
+
+    def __init__(self, cell_size):
+        if cell_size <= 0:
+            raise ValueError('cell_size must be > 0, given {}'.format(cell_size))
+
+        self.cell_size = float(cell_size)
+        # (i, j) -> [item]
+        self._cells = {}
+        # item -> (x, y, cell)
+        self._points = {}
+
+    def __len__(self):
+        return len(self._points)
+
+    def __contains__(self, item):
+        return item in self._points
+
+    def _cell(self, x, y):
+        size = self.cell_size
+        return int(floor(x / size)), int(floor(y / size))
+
+    def insert(self, item, pos):
+        """Add item at pos, or move it if already added"""
+        x = float(pos[0])
+        y = float(pos[1])
+        cell = self._cell(x, y)
+        old = self._points.get(item)
+        if old is not None and old[2] != cell:
+            self._remove_from_cell(item, old[2])
+            old = None
+
+        self._points[item] = (x, y, cell)
+        if old is None:
+            self._cells.setdefault(cell, []).append(item)
+
+    move = insert
+
+    def remove(self, item):
+        """Remove item, KeyError if not added"""
+        _, _, cell = self._points.pop(item)
+        self._remove_from_cell(item, cell)
+
+    def _remove_from_cell(self, item, cell):
+        items = self._cells[cell]
+        items.remove(item)
+        if not items:
+            del self._cells[cell]
+
+    def clear(self):
+        self._cells.clear()
+        self._points.clear()
+
+    def nearest(self, pos, max_distance, accept=None):
+        """Find the nearest item closer than max_distance to pos.
+        :param accept: optional callable(item) returning whether the item may be returned
+        :returns (distance, item) or None
+        """
+        x = float(pos[0])
+        y = float(pos[1])
+        size = self.cell_size
+        cells = self._cells
+        points = self._points
+        ci, cj = self._cell(x, y)
+
+        best = None
+        best_sqd = float(max_distance) ** 2
+        for ring in range(int(max_distance / size) + 2):
+            # Cells of this ring are at least this far from pos
+            bound = (ring - 1) * size
+            if ring > 1 and bound * bound >= best_sqd:
+                break
+
+            for cell in self._ring_cells(ci, cj, ring):
+                for item in cells.get(cell, ()):
+                    px, py, _ = points[item]
+                    dx = px - x
+                    dy = py - y
+                    dist_sqd = dx * dx + dy * dy
+                    if dist_sqd < best_sqd and (accept is None or accept(item)):
+                        best = item
+                        best_sqd = dist_sqd
+
+        if best is None:
+            return None
+
+        return sqrt(best_sqd), best
+
+    @staticmethod
+    def _ring_cells(ci, cj, ring):
+        """Cells whose Chebyshev distance from (ci, cj) is ring"""
+        if ring == 0:
+            yield ci, cj
+            return
+
+        for i in range(ci - ring, ci + ring + 1):
+            yield i, cj - ring
+            yield i, cj + ring
+
+        for j in range(cj - ring + 1, cj + ring):
+            yield ci - ring, j
+            yield ci + ring, j
@@ -0,0 +1,123 @@
+__author__ = 'awhite'
+
+# Timeline of the phases between process start and the first rendered frame.
+# Import as early as possible, the timeline starts at import.
+
+import json
+import os.path as P
+from contextlib import contextmanager
+from datetime import datetime
+
+from misc.profiling import timer
+
+
+class StartupTracer(object):
+    """Records startup phases (name, start, duration) relative to when it was created.
+    Phases may nest and repeat. After finish() phases are ignored.
+    """
+
+    # Files written to the report directory
+    report_filename = 'startup_timeline.txt'
+    # One JSON line per startup, to compare releases
+    history_filename = 'startup_history.jsonl'
+    # Startups kept in the history, oldest are dropped
+    max_history = 100
+
+    def __init__(self):
+        self.start = timer()
+        self.finished = False
+        self.total = None
+        # [name, start, duration, depth] in start order
+        self.phases = []
+        # Stack of the phases begun and not ended, innermost last
+        self._open = []
+
+    def begin(self, name):
+        """:returns the phase, None if finished"""
+        if self.finished:
+            return None
+
+        phase = [name, timer() - self.start, None, len(self._open)]
+        self.phases.append(phase)
+        self._open.append(phase)
+        return phase
+
+    def end(self, name):
+        """End the innermost open phase with name, and the phases begun within it"""
+        for i in range(len(self._open) - 1, -1, -1):
+            if self._open[i][0] == name:
+                self._end_open(i)
+                return
+
+    def _end_open(self, index):
+        now = timer() - self.start
+        for phase in self._open[index:]:
+            phase[2] = now - phase[1]
+
+        del self._open[index:]
+
+    @contextmanager
+    def phase(self, name, *args):
+        """Time the with block as a phase. name is formatted with args, unless finished."""
+        if self.finished:
+            yield
+            return
+
+        phase = self.begin(name.format(*args) if args else name)
+        try:
+            yield
+        finally:
+            # By identity, phases with the same name may be open (unless finish() ended it)
+            for i, open_phase in enumerate(self._open):
+                if open_phase is phase:
+                    self._end_open(i)
+                    break
+
+    def finish(self, name='first frame'):
+        """Mark the end of startup"""
+        if self.finished:
+            return
+
+        self.begin(name)
+        # It and unfinished phases end now
+        self._end_open(0)
+
+        self.total = timer() - self.start
+        self.finished = True
+
+    def report(self):
+        """:returns text timeline, milliseconds"""
+        lines = ['{:>9} {:>9}  phase'.format('start ms', 'took ms')]
+        for name, start, duration, depth in self.phases:
+            lines.append('{:>9.1f} {:>9.1f}  {}{}'.format(start * 1000, (duration or 0.0) * 1000,
+                                                        '  ' * depth, name))
+
+        if self.total is not None:
+            lines.append('{:>9.1f} {:>9}  total'.format(self.total * 1000, ''))
+
+        return '\n'.join(lines)
+
+    def write(self, directory, version=None):
+        """Write the report and append to the history in directory"""
+        with open(P.join(directory, self.report_filename), 'w') as f:
+            f.write(self.report())
+            f.write('\n')
+
+        record = {'date': datetime.now().isoformat(),
+                  'version': version,
+                  'total': self.total,
+                  'phases': [{'name': name, 'start': start, 'duration': duration}
+                             for name, start, duration, _ in self.phases]}
+
+        path = P.join(directory, self.history_filename)
+        lines = []
+        if P.exists(path):
+            with open(path) as f:
+                lines = f.readlines()[-(self.max_history - 1):]
+
+        lines.append(json.dumps(record) + '\n')
+        with open(path, 'w') as f:
+            f.writelines(lines)
+
+
+startup_tracer = StartupTracer()
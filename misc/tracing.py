@@ -0,0 +1,174 @@
+__author__ = 'awhite'
+
+# Named probes around hot path methods that can be switched on at runtime.
+# Disabled probes leave the original method in place, so they cost nothing.
+#
+#     sink = AggregateSink()
+#     probes.enable(sink)
+#     ...
+#     probes.disable()
+#     sink.summary()
+
+import json
+import os
+import thread
+from collections import OrderedDict
+from functools import wraps
+
+from misc.profiling import timer
+
+
+class AggregateSink(object):
+    """Counts and durations by probe name in memory"""
+
+    def __init__(self):
+        # name -> [count, total, max]
+        self.stats = {}
+
+    def record(self, name, start, duration):
+        stat = self.stats.get(name)
+        if stat is None:
+            self.stats[name] = [1, duration, duration]
+        else:
+            stat[0] += 1
+            stat[1] += duration
+            if duration > stat[2]:
+                stat[2] = duration
+
+    def summary(self):
+        """:returns dict of name -> {count, total, mean, max} (seconds)"""
+        return {name: {'count': count, 'total': total, 'mean': total / count, 'max': max_duration}
+                for name, (count, total, max_duration) in self.stats.viewitems()}
+
+    def close(self):
+        pass
+
+
+class ChromeTraceSink(object):
+    """Records complete events of the Trace Event Format, written to path on close().
+    Open the file in chrome://tracing
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.events = []
+        self._pid = os.getpid()
+
+    def record(self, name, start, duration):
+        # microseconds
+        self.events.append({'name': name, 'ph': 'X', 'ts': start * 1e6, 'dur': duration * 1e6,
+                            'pid': self._pid, 'tid': thread.get_ident()})
+
+    def close(self):
+        with open(self.path, 'w') as f:
+            json.dump({'traceEvents': self.events, 'displayTimeUnit': 'ms'}, f)
+
+
+class ProbeRegistry(object):
+    """Registry of named probes. Enabling a probe replaces the method on its class
+    with one that records the duration of each call to the sink.
+
+    Note: Kivy binds event handlers (i.e. on_<property>, handlers passed to bind())
+    when they're bound, so probes of handlers need a rebind function (see register())
+    to apply to objects bound before the probe is toggled.
+    """
+
+    def __init__(self):
+        # name -> (cls, method_name, subclasses, rebind)
+        self.probes = OrderedDict()
+        # name -> [(cls, method_name, original function, traced function)]
+        self._patched = {}
+        self.sink = None
+
+    def register(self, name, cls, method_name, subclasses=False, rebind=None):
+        """:param subclasses: also probe subclasses that override the method,
+        each class recorded as name:ClassName
+        :param rebind: for event handlers, called as rebind(old, new) with the functions
+        when the probe is enabled or disabled, to re-bind the handler of live objects"""
+        if name in self.probes:
+            raise ValueError('Probe {} already registered'.format(name))
+
+        if method_name not in cls.__dict__:
+            raise ValueError('{} does not define {}'.format(cls.__name__, method_name))
+
+        self.probes[name] = (cls, method_name, subclasses, rebind)
+
+    @property
+    def enabled(self):
+        """names of the enabled probes"""
+        return self._patched.keys()
+
+    def enable(self, sink, names=None):
+        """Enable the named probes (default all) recording to sink.
+        The sink replaces the sink of already enabled probes."""
+        self.sink = sink
+        for name in (self.probes.keys() if names is None else names):
+            if name in self._patched:
+                continue
+
+            cls, method_name, subclasses, rebind = self.probes[name]
+            classes = [cls]
+            if subclasses:
+                classes.extend(_all_subclasses(cls))
+
+            patched = self._patched[name] = []
+            for klass in classes:
+                original = klass.__dict__.get(method_name)
+                if original is None:
+                    # inherits the probed method
+                    continue
+
+                probe_name = '{}:{}'.format(name, klass.__name__) if klass is not cls else name
+                traced = self._traced(probe_name, original)
+                setattr(klass, method_name, traced)
+                patched.append((klass, method_name, original, traced))
+                if rebind is not None:
+                    rebind(original, traced)
+
+    def disable(self, names=None):
+        """Restore the methods of the named probes (default all).
+        Closes the sink if no probes remain enabled.
+        :returns the sink"""
+        for name in (self._patched.keys() if names is None else names):
+            for klass, method_name, original, traced in self._patched.pop(name, ()):
+                setattr(klass, method_name, original)
+                rebind = self.probes[name][3]
+                if rebind is not None:
+                    rebind(traced, original)
+
+        sink = self.sink
+        if not self._patched and sink is not None:
+            self.sink = None
+            sink.close()
+
+        return sink
+
+    def _traced(self, name, func):
+        registry = self
+
+        @wraps(func)
+        def traced(*args, **kwargs):
+            sink = registry.sink
+            if sink is None:
+                # disabled, but bound before it was
+                return func(*args, **kwargs)
+
+            start = timer()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                sink.record(name, start, timer() - start)
+
+        return traced
+
+
+def _all_subclasses(cls):
+    subclasses = []
+    for sub in cls.__subclasses__():
+        subclasses.append(sub)
+        subclasses.extend(_all_subclasses(sub))
+
+    return subclasses
+
+
+probes = ProbeRegistry()
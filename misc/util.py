@@ -1,6 +1,8 @@
 __author__ = 'awhite'
 
+from bisect import bisect_left
 from functools import wraps
+from math import hypot
 
 import types
 import warnings
@@ -18,6 +20,14 @@ def evaluate_thing(thing):
     raise ValueError('Unknown thing: '+str(type(thing))+str(thing))
 
 
+def window_scale(widget):
+    """Scale from widget coordinates to window pixels,
+    including the transforms of the widget and its ancestors (i.e. Scatter)"""
+    x0, y0 = widget.to_window(0, 0, initial=False)
+    x1, y1 = widget.to_window(1, 0, initial=False)
+    return hypot(x1 - x0, y1 - y0)
+
+
 def not_none_keywords(*not_none_args):
     """Checks that the specified keyword arguments are not None"""
     def check_not_none(f):
@@ -45,3 +55,39 @@ def not_none_keywords(*not_none_args):
 
     return check_not_none
 
+
+class UpperEnvelope(object):
+    """Maximum of lines (y = slope * t + intercept) at any t in O(log lines)"""
+
+    __slots__ = ('_lines', '_breaks')
+
+    def __init__(self, lines):
+        """:param lines: sequence of (slope, intercept)"""
+        if not lines:
+            raise ValueError('No lines')
+
+        # Sorted by slope the maximum line goes from first to last as t increases
+        hull = []
+        for line in sorted(lines):
+            if hull and hull[-1][0] == line[0]:
+                # Parallel, the later line has the larger intercept
+                hull.pop()
+
+            # Remove the last line if it's never the maximum
+            while len(hull) >= 2 and _intersect_t(hull[-2], hull[-1]) >= _intersect_t(hull[-1], line):
+                hull.pop()
+
+            hull.append(line)
+
+        self._lines = hull
+        # t at which each line stops being the maximum
+        self._breaks = [_intersect_t(hull[i], hull[i + 1]) for i in range(len(hull) - 1)]
+
+    def __call__(self, t):
+        slope, intercept = self._lines[bisect_left(self._breaks, t)]
+        return slope * t + intercept
+
+
+def _intersect_t(line1, line2):
+    """t where lines intersect, slope of line1 < slope of line2"""
+    return (line1[1] - line2[1]) / float(line2[0] - line1[0])
@@ -0,0 +1,120 @@
+__author__ = 'awhite'
+
+# Prefetching after startup, without delaying frames
+
+import threading
+from collections import deque
+
+from kivy.clock import Clock
+from kivy.logger import Logger
+
+from misc.frame_governor import frame_governor
+from misc.profiling import timer
+
+
+class WarmupScheduler(object):
+    """Runs warm-up tasks (name, func, args) in order. Idle tasks run on the main thread, one per frame
+    and only while frames are within budget. Background tasks run on a thread and may add idle tasks.
+    cancel() drops the remaining tasks, i.e. when the user navigates before warm-up finishes.
+    Use warmup instead of creating another.
+    """
+
+    def __init__(self):
+        # (name, func, args)
+        self._idle = deque()
+        self._background = deque()
+        # Each start() has its own deques and cancelled Event, a cancelled thread may still be finishing its task
+        self._cancelled = threading.Event()
+        # The background thread's run: cancelled and idle
+        self._local = threading.local()
+        self._thread = None
+        self.running = False
+
+    def add_idle(self, name, func, *args):
+        """Add an idle task while running (i.e. from a background task). Thread-safe.
+        Ignored if the run of the calling background task was cancelled.
+        """
+        run_idle = getattr(self._local, 'idle', None)
+        if run_idle is not None:
+            # Background thread, the deque of a cancelled run is no longer run
+            if not self._local.cancelled.is_set():
+                run_idle.append((name, func, args))
+
+        elif self.running:
+            self._idle.append((name, func, args))
+
+    def start(self, idle=(), background=()):
+        """Start running the tasks, cancelling those of a previous start.
+        Background task functions must not touch Kivy objects, they add idle tasks for that instead.
+        """
+        self.cancel()
+
+        self.running = True
+        self._cancelled = threading.Event()
+        self._idle = deque(idle)
+        self._background = deque(background)
+        Clock.schedule_interval(self._run_idle, 0)
+
+        if self._background:
+            self._thread = thread = threading.Thread(target=self._run_background, name='warmup',
+                                                     args=(self._cancelled, self._idle, self._background))
+            thread.daemon = True
+            thread.start()
+
+    def cancel(self):
+        """Drop remaining tasks. A background task already running finishes, but adds no idle tasks."""
+        if not self.running:
+            return
+
+        Logger.debug('Warmup: cancelled, %d idle and %d background tasks dropped',
+                     len(self._idle), len(self._background))
+        self._finish()
+
+    def _finish(self):
+        self._cancelled.set()
+        self.running = False
+        Clock.unschedule(self._run_idle)
+        self._idle.clear()
+        self._background.clear()
+        self._thread = None
+
+    def _run_idle(self, dt):
+        if frame_governor.started and frame_governor.frame_time > frame_governor.budget * frame_governor.over_budget:
+            # Busy, wait for an idle frame
+            return
+
+        try:
+            task = self._idle.popleft()
+        except IndexError:
+            thread = self._thread
+            if thread is None or not thread.is_alive():
+                # Unless the thread adds more idle tasks after all
+                if not self._idle:
+                    Logger.debug('Warmup: finished')
+                    self._finish()
+            return
+
+        self._run(*task)
+
+    def _run_background(self, cancelled, idle, background):
+        self._local.cancelled = cancelled
+        self._local.idle = idle
+        while not cancelled.is_set():
+            try:
+                task = background.popleft()
+            except IndexError:
+                return
+
+            self._run(*task)
+
+    def _run(self, name, func, args):
+        start = timer()
+        try:
+            func(*args)
+        except Exception:
+            Logger.exception('Warmup: %s failed', name)
+        else:
+            Logger.debug('Warmup: %s took %.1f ms', name, (timer() - start) * 1000)
+
+
+warmup = WarmupScheduler()
@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+"""Replay a session recorded with F11 (see misc.recording) as fast as possible, without running the app.
+Prints the replay timing, profiler sections and physics statistics of each environment.
+
+    python replay.py ~/.config/myjelly/recordings/session-20160301-120000.jsonl --profile
+
+Creatures are constructed from the store contents recorded with them (recordings of format version 1
+have none, their creatures are constructed from the jellies in user_data_dir).
+"""
+
+__author__ = 'awhite'
+
+import argparse
+import json
+import os
+import os.path as P
+import shutil
+import tempfile
+
+# Kivy must not parse our arguments
+os.environ['KIVY_NO_ARGS'] = '1'
+
+from kivy.config import Config
+# The Window is needed for the GL context (textures), but not shown
+Config.set('graphics', 'window_state', 'hidden')
+
+from main import MyJellyApp
+from data import state_storage
+from data.state_storage import load_jelly_storage, construct_creature, CreatureStore
+from misc.profiling import profiler
+from misc.recording import SessionReplayer, VirtualClock
+from uix.environment import BasicEnvironment
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Replay a recorded session headless at maximum speed')
+    parser.add_argument('recording')
+    parser.add_argument('--user-data-dir', help='directory of the jellies (default: the app user_data_dir)')
+    parser.add_argument('--profile', action='store_true', help='enable the frame profiler')
+    parser.add_argument('--stats-dir', help='write physics statistics CSV of each environment to this directory')
+    parser.add_argument('--stats-interval', type=float, default=1.0,
+                        help='seconds between physics statistics samples (default: 1)')
+    args = parser.parse_args()
+
+    state_storage.user_data_dir = args.user_data_dir or MyJellyApp().user_data_dir
+    profiler.enabled = args.profile
+
+    samplers = []
+
+    def make_environment(width, height, batch_rendering):
+        env = BasicEnvironment(paused=True, batch_rendering=batch_rendering,
+                               physics_stats_interval=args.stats_interval)
+        env.size = (width, height)
+        if not env.initialized:
+            # size was the default
+            env.initialize()
+
+        samplers.append(env.phy_sampler)
+        return env
+
+    # Recorded store contents are written here to load them as CreatureStores
+    store_dir = tempfile.mkdtemp(prefix='replay-stores-')
+
+    def construct(creature_id, store_data, **construct_kwargs):
+        if store_data is None:
+            store = load_jelly_storage(creature_id)
+        else:
+            path = P.join(store_dir, '{}.json'.format(creature_id))
+            with open(path, 'w') as f:
+                json.dump(store_data, f)
+
+            store = CreatureStore(path)
+
+        return construct_creature(store, **construct_kwargs)
+
+    clock = VirtualClock()
+    clock.install()
+    try:
+        result = SessionReplayer(args.recording, make_environment, construct, clock.tick).run()
+    finally:
+        clock.uninstall()
+        shutil.rmtree(store_dir, ignore_errors=True)
+
+    print('{events} events, {steps} steps, {simulated:.2f}s simulated in {wall:.2f}s'.format(**result))
+
+    if args.profile:
+        print(profiler.format_summary())
+
+    for i, sampler in enumerate(samplers):
+        print('environment {}: {} physics samples'.format(i, len(sampler)))
+        if args.stats_dir:
+            sampler.write_csv(P.join(args.stats_dir, 'physics_env{}.csv'.format(i)))
+
+if __name__ == '__main__':
+    main()
@@ -1,10 +1,14 @@
 __author__ = 'awhite'
 
+import os
+import tempfile
 import unittest
 
 from kivy.core.image import Image as CoreImage
 
-from image_util import determine_colored_rows, layout_circles_on_rows
+from misc.image_util import determine_colored_rows, layout_circles_on_rows, cached_circle_layout, \
+    image_content_hash
+from data.state_storage import LazyJsonStore
 
 class TestAnimationConstructor(unittest.TestCase):
 
@@ -24,6 +28,46 @@ class TestAnimationConstructor(unittest.TestCase):
         for c in circles:
             self.assertGreater(c[2], 0, 'Radius not greater than zero! {}'.format(c))
 
+    def test_cached_circle_layout(self):
+        rows = [(0, 0, 2), (1, 0, 2), (2, 1, 1), (3, 1, 1), (4, 1, 1)]
+        tmp_dir = tempfile.mkdtemp()
+        img_filename = os.path.join(tmp_dir, 'not_really_an_image.png')
+        with open(img_filename, 'wb') as f:
+            f.write(b'tentacle')
+
+        # Rows already in store, so image is never read
+        store = LazyJsonStore(os.path.join(tmp_dir, 'layout_cache.json'))
+        image_hash = image_content_hash(img_filename)
+        store[image_hash] = {'rows/0.0': rows}
+
+        circles = cached_circle_layout(img_filename, radius_spacing=0.2, store=store)
+        self.assertEqual(layout_circles_on_rows(rows, radius_spacing=0.2), circles)
+        self.assertIn('circles/0.0/0.2', store[image_hash])
+
+        # Reloaded store returns same layout
+        store = LazyJsonStore(os.path.join(tmp_dir, 'layout_cache.json'))
+        self.assertEqual(circles, cached_circle_layout(img_filename, radius_spacing=0.2, store=store))
+
+        # Laid out in memory is written to a store given later
+        other_store = LazyJsonStore(os.path.join(tmp_dir, 'other_layout_cache.json'))
+        self.assertEqual(circles, cached_circle_layout(img_filename, radius_spacing=0.2, store=other_store))
+        self.assertIn('circles/0.0/0.2', other_store[image_hash])
+
+    def test_image_content_hash_cached(self):
+        tmp_dir = tempfile.mkdtemp()
+        img_filename = os.path.join(tmp_dir, 'image.png')
+        with open(img_filename, 'wb') as f:
+            f.write(b'tentacle')
+
+        image_hash = image_content_hash(img_filename)
+        self.assertEqual(image_hash, image_content_hash(img_filename))
+
+        # Size changed
+        with open(img_filename, 'wb') as f:
+            f.write(b'tentacles')
+
+        self.assertNotEqual(image_hash, image_content_hash(img_filename))
+
 
 if __name__ == '__main__':
     unittest.main()
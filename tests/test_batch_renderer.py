@@ -0,0 +1,78 @@
+__author__ = 'awhite'
+
+from array import array
+from math import sqrt
+
+from kivy.graphics.instructions import InstructionGroup
+from kivy.graphics.texture import Texture
+
+from visuals.batch_renderer import BatchRenderer, triangulate, rotate_scale_translate
+
+def test_triangulate():
+    assert triangulate([0, 1, 2, 3, 4], 'triangle_fan') == [0, 1, 2, 0, 2, 3, 0, 3, 4]
+    assert triangulate([0, 1, 2, 3], 'triangle_strip') == [0, 1, 2, 1, 2, 3]
+    assert triangulate((5, 6, 7), 'triangles') == [5, 6, 7]
+
+def test_rotate_scale_translate():
+    a, b, c, d, tx, ty = rotate_scale_translate(90, 2.0, (10, 20))
+    x, y = 1.0, 0.0
+    # rotated to (0, 1), translated to (10, 21) and scaled
+    assert abs(a * x + b * y + tx - 20.0) < 1e-9
+    assert abs(c * x + d * y + ty - 42.0) < 1e-9
+    assert abs(sqrt(a * a + c * c) - 2.0) < 1e-9
+
+class FakeMesh(object):
+    mode = 'triangle_fan'
+
+    def __init__(self, texture):
+        self.texture = texture
+
+class FakeVertexBuffer(object):
+    def __init__(self, vertices, texture):
+        self.data = array('f', vertices)
+        self.mesh = FakeMesh(texture)
+        self.version = 0
+        self.upload = True
+
+    def replace(self, vertices):
+        self.data = array('f', vertices)
+
+class FakeCreature(object):
+    debug_visuals = False
+
+    def __init__(self, vertex_buffer):
+        self.vertex_buffer = vertex_buffer
+        self.indices = [0, 1, 2]
+        self.pos = (10, 0)
+
+    def draw_transform(self):
+        return rotate_scale_translate(0, 1.0, self.pos)
+
+    def batch_meshes(self):
+        yield self.vertex_buffer, self.indices, (0, 0)
+
+def test_batch_renderer_reuses_batches():
+    vertex_buffer = FakeVertexBuffer([0, 0, 0, 0, 1, 0, 1, 0, 0, 1, 0, 1], Texture.create(size=(4, 4)))
+    creature = FakeCreature(vertex_buffer)
+    renderer = BatchRenderer(InstructionGroup())
+    renderer.add(creature)
+    assert not vertex_buffer.upload
+
+    renderer.update()
+    batch = renderer._batches[0]
+    transformed = renderer._transformed[id(vertex_buffer)][3]
+    assert list(batch[1][:2]) == [10.0, 0.0]
+
+    # Didn't move, the batch and transformed vertices are re-used
+    renderer.update()
+    assert renderer._batches[0] is batch
+    assert renderer._transformed[id(vertex_buffer)][3] is transformed
+
+    creature.pos = (20, 0)
+    renderer.update()
+    assert renderer._batches[0] is batch
+    assert list(batch[1][:2]) == [20.0, 0.0]
+
+    renderer.remove(creature)
+    renderer.update()
+    assert renderer._meshes == []
@@ -0,0 +1,49 @@
+__author__ = 'awhite'
+
+from kivy.factory import Factory
+from kivy.lang import Builder
+from kivy.uix.label import Label
+
+from uix.kv_loader import KvLoader
+
+kv = """
+<KvLoaderTestLabel@Label>:
+    text: 'a' + 'b'
+"""
+
+def test_cache(tmpdir):
+    kv_path = tmpdir.join('test.kv')
+    kv_path.write(kv)
+    cache_dir = tmpdir.join('cache')
+
+    loader = KvLoader(str(cache_dir))
+    assert loader.load_file(str(kv_path)) is None
+    # once
+    assert loader.load_file(str(kv_path)) is None
+    assert len(cache_dir.listdir()) == 1
+    Builder.unload_file(str(kv_path))
+
+    # New launch, loaded from the cache
+    loader = KvLoader(str(cache_dir))
+    loader.load_file(str(kv_path))
+    label = Factory.KvLoaderTestLabel()
+    assert isinstance(label, Label)
+    assert label.text == 'ab'
+    Builder.unload_file(str(kv_path))
+
+def test_failed_load_retried(tmpdir):
+    kv_path = tmpdir.join('bad.kv')
+    kv_path.write('<KvLoaderBadLabel@Label>:\n    text: [\n')
+
+    loader = KvLoader()
+    try:
+        loader.load_file(str(kv_path))
+    except Exception:
+        pass
+    assert not loader.is_loaded(str(kv_path))
+
+    kv_path.write('<KvLoaderBadLabel@Label>:\n    text: "fixed"\n')
+    loader.load_file(str(kv_path))
+    assert loader.is_loaded(str(kv_path))
+    assert Factory.KvLoaderBadLabel().text == 'fixed'
+    Builder.unload_file(str(kv_path))
@@ -0,0 +1,89 @@
+__author__ = 'awhite'
+
+from cymunk import Body, Circle
+
+from kivy.clock import Clock
+
+from misc.memory import LeakTracker, creature_report, pending_clock_callbacks
+
+class Owner(object):
+    def callback(self, dt):
+        pass
+
+def test_leak_tracker_disabled():
+    tracker = LeakTracker()
+    tracker.track(Owner(), 'owner')
+    assert tracker.check() == []
+    assert tracker._tracked == []
+
+def test_leak_tracker():
+    tracker = LeakTracker()
+    tracker.enabled = True
+
+    kept = Owner()
+    tracker.track(kept, 'kept')
+    tracker.track(Owner(), 'collected')
+    # Not weak referenceable
+    tracker.track(1, 'int')
+
+    leaks = tracker.check()
+    assert [description for description, _ in leaks] == ['kept']
+
+    del kept
+    assert tracker.check() == []
+
+def test_pending_clock_callbacks():
+    owner, other = Owner(), Owner()
+    Clock.schedule_once(owner.callback, 10)
+    closure = lambda dt: owner.callback(dt)
+    Clock.schedule_once(closure, 10)
+    Clock.schedule_once(other.callback, 10)
+    try:
+        assert pending_clock_callbacks({id(owner)}) == 2
+    finally:
+        Clock.unschedule(owner.callback)
+        Clock.unschedule(closure)
+        Clock.unschedule(other.callback)
+
+    assert pending_clock_callbacks({id(owner)}) == 0
+
+class FakeCreature(object):
+    creature_id = 'fake'
+    body_parts = ()
+
+    def __init__(self):
+        body = Body(1, 1)
+        self._objects = [body, Circle(body, 5)]
+
+    def phy_objects(self):
+        return self._objects
+
+    def batch_meshes(self):
+        return []
+
+def test_creature_report():
+    report = creature_report(FakeCreature())
+    assert report['class'] == 'FakeCreature'
+    assert (report['bodies'], report['shapes'], report['constraints']) == (1, 1, 0)
+    assert report['vertices'] == 0
+    assert report['clock_callbacks'] == 0
+
+def test_part_geometry_shared():
+    # Not at module level, jelly imports all of the part classes
+    from visuals.creatures.jelly import PartGeometry
+
+    computed = []
+    def compute():
+        computed.append(True)
+        return {'offsets': ((0.0, 1.0), (1.0, 0.0))}
+
+    first = PartGeometry.shared(('test', 1), compute)
+    copy = PartGeometry.shared(('test', 1), compute)
+    assert copy is first
+    assert first.offsets == ((0.0, 1.0), (1.0, 0.0))
+    assert len(computed) == 1
+
+    # Only kept while in use
+    del first, copy
+    PartGeometry.shared(('test', 1), compute)
+    assert len(computed) == 2
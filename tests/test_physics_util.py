@@ -0,0 +1,88 @@
+__author__ = 'awhite'
+
+import pytest
+
+from cymunk import Space, Body, Circle, DampedSpring
+
+from misc.physics_util import PhysicsRegistry, PhysicsSampler, apply_drag
+
+@pytest.fixture
+def registry():
+    return PhysicsRegistry(Space())
+
+def create_objects():
+    a = Body(1, 1)
+    b = Body(1, 1)
+    shape = Circle(a, 5)
+    spring = DampedSpring(a, b, (0, 0), (0, 0), 10, 1, 1)
+    return a, b, shape, spring
+
+def test_add_remove(registry):
+    a, b, shape, spring = create_objects()
+    registry.add([spring, shape, a, b])
+    assert len(registry) == 4
+    assert spring in registry
+    assert len(registry.space.bodies) == 2
+    assert len(registry.space.constraints) == 1
+
+    registry.remove([a, b, shape, spring])
+    assert len(registry) == 0
+    assert len(registry.space.bodies) == 0
+    assert len(registry.space.constraints) == 0
+
+def test_double_add(registry):
+    a, b, shape, spring = create_objects()
+    registry.add([a, b])
+    with pytest.raises(ValueError):
+        registry.add([a])
+
+    with pytest.raises(ValueError):
+        registry.add([shape, shape])
+
+def test_leaked_constraint(registry):
+    a, b, shape, spring = create_objects()
+    registry.add([a, b, spring])
+    with pytest.raises(ValueError):
+        registry.remove([a])
+
+    # Space not modified
+    assert len(registry.space.bodies) == 2
+
+    registry.clear()
+    assert len(registry) == 0
+
+def test_physics_sampler(registry, tmpdir):
+    a, b, shape, spring = create_objects()
+    b.position = (20, 0)
+    a.velocity = (3, 4)
+    registry.add([a, b, shape, spring])
+
+    sampler = PhysicsSampler(registry.space, interval=None, size=2)
+    sampler.step(1 / 60.0)
+    assert len(sampler) == 0
+
+    for _ in range(3):
+        sampler.sample()
+
+    assert len(sampler) == 2
+    row = dict(zip(PhysicsSampler.fields, sampler.rows()[-1]))
+    assert row['bodies'] == 2
+    assert row['shapes'] == 1
+    assert row['constraints'] == 1
+    assert row['max_velocity'] > 0
+    assert row['max_spring_force'] > 0
+
+    path = tmpdir.join('stats.csv')
+    sampler.write_csv(str(path))
+    assert path.readlines()[0].strip() == ','.join(PhysicsSampler.fields)
+
+def test_apply_drag():
+    body = Body(2.0, 1)
+    body.velocity = (3.0, 0)
+    apply_drag(body, 0.01)
+    # impulse 3 * 9 * 0.01 on mass 2
+    assert abs(body.velocity.x - (3.0 - 0.27 / 2.0)) < 1e-6
+
+    # A large multiplier stops the body instead of reversing it
+    apply_drag(body, 0.01, multiplier=1000.0)
+    assert abs(body.velocity.x) < 1e-6
@@ -0,0 +1,49 @@
+__author__ = 'awhite'
+
+from misc.profiling import RingBuffer, FrameProfiler
+
+def test_ring_buffer_wraps():
+    buf = RingBuffer(3)
+    assert len(buf) == 0
+    assert buf.summary() is None
+
+    for value in range(5):
+        buf.append(float(value))
+
+    assert len(buf) == 3
+    assert buf.values() == [2.0, 3.0, 4.0]
+
+def test_ring_buffer_summary():
+    buf = RingBuffer(100)
+    for value in range(1, 101):
+        buf.append(float(value))
+
+    summary = buf.summary()
+    assert summary['count'] == 100
+    assert summary['mean'] == 50.5
+    assert summary['p50'] == 50.0
+    assert summary['p90'] == 90.0
+    assert summary['p99'] == 99.0
+    assert summary['max'] == 100.0
+
+def test_profiler_sections():
+    profiler = FrameProfiler(size=2)
+    profiler.record('physics', 0.001)
+    profiler.record('physics', 0.003)
+    profiler.record('physics', 0.002)
+    profiler.record('mesh', 0.5)
+
+    summary = profiler.summary()
+    assert summary['physics']['count'] == 2
+    assert summary['physics']['max'] == 0.003
+    # slowest first
+    assert profiler.format_summary().splitlines()[1].startswith('mesh')
+
+def test_profiler_call():
+    profiler = FrameProfiler()
+    assert profiler.call('add', lambda a, b: a + b, 1, 2) == 3
+    assert profiler.sections == {}
+
+    profiler.enabled = True
+    assert profiler.call('add', lambda a, b: a + b, 1, 2) == 3
+    assert profiler.summary()['add']['count'] == 1
@@ -0,0 +1,92 @@
+__author__ = 'awhite'
+
+from misc.recording import SessionRecorder, SessionReplayer, read_session
+
+class Environment(object):
+    def __init__(self, width, height, batch_rendering):
+        self.width = width
+        self.height = height
+        self.batch_rendering = batch_rendering
+        self.update_interval = 1 / 60.0
+        self.creatures = []
+        self.steps = []
+        self.destroyed = False
+
+    def add_creature(self, creature):
+        self.creatures.append(creature)
+
+    def remove_creature(self, creature):
+        self.creatures.remove(creature)
+
+    def update_simulation(self, dt):
+        self.steps.append(dt)
+
+    def destroy(self):
+        self.destroyed = True
+
+class Store(object):
+    def __init__(self, data):
+        self.data = data
+
+class Creature(object):
+    def __init__(self, creature_id, store_data=None, **construct_kwargs):
+        self.creature_id = creature_id
+        self.construct_kwargs = construct_kwargs
+        self.construct_store = Store(store_data)
+        self.calls = []
+
+    def orient(self, angle, throttle=1.0):
+        self.calls.append(('orient', angle, throttle))
+
+    def adjust_part_tweak(self, part_name, tweak_name, value):
+        self.calls.append(('tweak', part_name, tweak_name, value))
+
+def test_record_replay(tmpdir):
+    path = str(tmpdir.join('session.jsonl'))
+    recorder = SessionRecorder()
+    recorder.start(path, seed=7, touches=False)
+
+    env = Environment(400, 300, True)
+    creature = Creature('jelly1', {'_info': {'id': 'jelly1'}}, pos=(200, 150), animation_phase=0.5)
+    recorder.construct(creature)
+    # Changing the store afterwards doesn't change the recording
+    creature.construct_store.data['_info']['id'] = 'changed'
+    recorder.orient(creature, 90, 1.0)
+    recorder.add_creature(env, creature)
+    env.add_creature(creature)
+    recorder.update_simulation(env, 0.017)
+    recorder.tweak(creature, 'bell', 'drag_constant', 0.2)
+    recorder.update_simulation(env, 0.016)
+    recorder.destroy(env)
+    assert recorder.stop() == path
+    assert not recorder.recording
+
+    header, events = read_session(path)
+    assert header['seed'] == 7
+    assert [e[0] for e in events] == ['construct', 'orient', 'env', 'add', 'dt', 'tweak', 'dt', 'destroy']
+
+    environments = []
+    def make_environment(width, height, batch_rendering):
+        environments.append(Environment(width, height, batch_rendering))
+        return environments[-1]
+
+    ticks = []
+    replayer = SessionReplayer(path, make_environment, Creature, ticks.append)
+    # Keep the replayed creature after run() clears its references
+    creatures = []
+    replayer.construct = lambda creature_id, store_data, **kwargs: \
+        creatures.append(Creature(creature_id, store_data, **kwargs)) or creatures[-1]
+    result = replayer.run()
+
+    assert result['steps'] == 2
+    assert ticks == [0.017, 0.016]
+    replayed_env, = environments
+    assert (replayed_env.width, replayed_env.height, replayed_env.batch_rendering) == (400, 300, True)
+    assert replayed_env.steps == [0.017, 0.016]
+    assert replayed_env.destroyed
+
+    replayed, = creatures
+    assert replayed.construct_kwargs == {'pos': [200, 150], 'animation_phase': 0.5}
+    assert replayed.construct_store.data == {'_info': {'id': 'jelly1'}}
+    assert replayed_env.creatures == [replayed]
+    assert replayed.calls == [('orient', 90, 1.0), ('tweak', 'bell', 'drag_constant', 0.2)]
@@ -0,0 +1,92 @@
+__author__ = 'awhite'
+
+from uix.screens import ScreenCache
+
+class Screen(object):
+    def __init__(self, stale=False):
+        self.stale = stale
+        self.destroyed = False
+
+    def is_stale(self):
+        return self.stale
+
+    def destroy(self):
+        self.destroyed = True
+
+def test_key():
+    assert ScreenCache.key('A', {'b': 1, 'a': 2}) == ScreenCache.key('A', {'a': 2, 'b': 1})
+    assert ScreenCache.key('A', {'then': []}) is None
+
+def test_lru():
+    cache = ScreenCache(size=2)
+    a, b, c = Screen(), Screen(), Screen()
+    cache.put('a', a)
+    cache.put('b', b)
+    # a most recently used
+    cache.put('a', a)
+    cache.put('c', c)
+
+    assert b.destroyed
+    assert not a.destroyed
+    assert cache.take('b') is None
+    assert cache.take('a') is a
+    assert 'a' not in cache
+    assert len(cache) == 1
+
+def test_stale():
+    cache = ScreenCache()
+    screen = Screen(stale=True)
+    cache.put('a', screen)
+    assert cache.take('a') is None
+    assert screen.destroyed
+
+def test_prebuilt():
+    cache = ScreenCache(size=1)
+    prebuilt, unused = Screen(), Screen()
+    cache.add_prebuilt('a', prebuilt)
+    cache.add_prebuilt('b', unused)
+    cache.put('c', Screen())
+    assert 'a' in cache
+    assert len(cache) == 1
+    assert cache.num_prebuilt == 2
+
+    assert cache.take('a') is prebuilt
+    cache.clear_prebuilt()
+    assert unused.destroyed
+    assert not prebuilt.destroyed
+
+def test_put_replaces():
+    cache = ScreenCache()
+    old, new = Screen(), Screen()
+    cache.put('a', old)
+    cache.put('a', old)
+    assert not old.destroyed
+
+    # Built again while the old one was leaving
+    cache.put('a', new)
+    assert old.destroyed
+    assert cache.take('a') is new
+
+def test_deferred_setup():
+    from uix.screens.main_screens import AppScreen
+
+    class StepsScreen(AppScreen):
+        def __init__(self, **kwargs):
+            self.steps = []
+            super(StepsScreen, self).__init__(**kwargs)
+            self.start_setup()
+
+        def setup_steps(self):
+            self.steps.append(1)
+            yield
+            self.steps.append(2)
+
+    assert StepsScreen().steps == [1, 2]
+
+    screen = StepsScreen(defer_setup=True)
+    assert screen.steps == []
+    assert screen.next_setup_step()
+    assert screen.steps == [1]
+    screen.finish_setup()
+    assert screen.steps == [1, 2]
+    assert not screen.next_setup_step()
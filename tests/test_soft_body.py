@@ -0,0 +1,39 @@
+__author__ = 'awhite'
+
+from misc.soft_body import SoftBody
+
+
+def test_spring_relaxes_to_rest_length():
+    soft = SoftBody()
+    a = soft.add_node((0, 0), 1.0)
+    b = soft.add_node((15, 0), 1.0)
+    soft.add_spring(a, b, 50.0, 2.0, rest_length=10.0)
+
+    for _ in range(1200):
+        soft.step(1 / 60.0)
+
+    assert abs((soft.x[b] - soft.x[a]) - 10.0) < 0.1
+    # Internal forces only, center of mass doesn't move
+    assert abs((soft.x[a] + soft.x[b]) / 2.0 - 7.5) < 1e-6
+
+
+def test_translate():
+    soft = SoftBody()
+    soft.add_node((1, 2), 1.0)
+    soft.translate(3, -2)
+    assert (soft.x[0], soft.y[0]) == (4, 0)
+
+
+def test_scaled_drag_never_reverses():
+    soft = SoftBody()
+    soft.add_node((0, 0), 1.0)
+    soft.vx[0] = 2.0
+
+    soft.step(1 / 60.0, drag_constant=0.1, drag_scale=2.0)
+    # 2 - 2 * (2^2 * 0.1 * 2)
+    assert abs(soft.vx[0] - 0.4) < 1e-9
+
+    # Would more than stop it
+    soft.vx[0] = 2.0
+    soft.step(1 / 60.0, drag_constant=1.0, drag_scale=4.0)
+    assert soft.vx[0] == 0.0
@@ -0,0 +1,68 @@
+__author__ = 'awhite'
+
+import random
+from math import sqrt
+
+from misc.spatial import KDTree, PointGrid
+
+def brute_force_nearest(points, pos, k):
+    dists = sorted((sqrt((p[0] - pos[0]) ** 2 + (p[1] - pos[1]) ** 2), i) for i, p in enumerate(points))
+    return dists[:k]
+
+def test_kdtree_empty():
+    tree = KDTree([])
+    assert len(tree) == 0
+    assert tree.nearest((0, 0), k=3) == []
+
+def test_kdtree_items():
+    tree = KDTree([(0, 0), (10, 0), (0, 10)], items=['a', 'b', 'c'])
+    assert tree.nearest((9, 1)) == [(sqrt(2), 'b')]
+    assert [item for _, item in tree.nearest((1, 2), k=5)] == ['a', 'c', 'b']
+
+def test_kdtree_matches_brute_force():
+    rand = random.Random(42)
+    points = [(rand.uniform(-500, 500), rand.uniform(-500, 500)) for _ in range(300)]
+    # Include duplicates
+    points.extend(points[:10])
+    tree = KDTree(points)
+
+    for _ in range(50):
+        pos = (rand.uniform(-600, 600), rand.uniform(-600, 600))
+        for k in (1, 2, 7):
+            result = tree.nearest(pos, k=k)
+            expected = brute_force_nearest(points, pos, k)
+            assert len(result) == k
+            assert [d for d, _ in result] == [d for d, _ in expected]
+
+def test_point_grid_matches_brute_force():
+    rand = random.Random(7)
+    points = [(rand.uniform(-500, 500), rand.uniform(-500, 500)) for _ in range(300)]
+    grid = PointGrid(cell_size=30)
+    for i, p in enumerate(points):
+        grid.insert(i, p)
+
+    # Move some points (sometimes within the same cell) and remove others
+    for i in range(0, 300, 3):
+        points[i] = (points[i][0] + rand.uniform(-50, 50), points[i][1] + rand.uniform(-5, 5))
+        grid.move(i, points[i])
+
+    removed = set(range(1, 300, 7))
+    for i in removed:
+        grid.remove(i)
+
+    assert len(grid) == 300 - len(removed)
+    assert 1 not in grid and 0 in grid
+
+    remaining = [(p, i) for i, p in enumerate(points) if i not in removed]
+    for _ in range(100):
+        pos = (rand.uniform(-600, 600), rand.uniform(-600, 600))
+        for max_distance in (10, 45, 200):
+            for accept in (None, lambda i: i % 2 == 0):
+                candidates = [(sqrt((p[0] - pos[0]) ** 2 + (p[1] - pos[1]) ** 2), i) for p, i in remaining
+                              if accept is None or accept(i)]
+                candidates = [c for c in candidates if c[0] < max_distance]
+                result = grid.nearest(pos, max_distance, accept)
+                if candidates:
+                    assert result[0] == min(candidates)[0]
+                else:
+                    assert result is None
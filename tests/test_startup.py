@@ -0,0 +1,53 @@
+__author__ = 'awhite'
+
+import json
+
+from misc.startup import StartupTracer
+
+def test_startup_timeline(tmpdir):
+    tracer = StartupTracer()
+    with tracer.phase('restore_state'):
+        with tracer.phase('load_all_jellies'):
+            pass
+
+    tracer.begin('never ended')
+    tracer.finish()
+    tracer.begin('after startup')
+
+    names = [phase[0] for phase in tracer.phases]
+    assert names == ['restore_state', 'load_all_jellies', 'never ended', 'first frame']
+    # nested
+    assert tracer.phases[1][3] == 1
+    assert all(phase[2] is not None for phase in tracer.phases)
+
+    tracer.write(str(tmpdir), '0.1')
+    tracer.write(str(tmpdir), '0.2')
+    assert 'load_all_jellies' in tmpdir.join(StartupTracer.report_filename).read()
+    history = [json.loads(line) for line in tmpdir.join(StartupTracer.history_filename).readlines()]
+    assert [record['version'] for record in history] == ['0.1', '0.2']
+
+def test_repeated_phases():
+    tracer = StartupTracer()
+    with tracer.phase('construct_creature {}', 'a'):
+        with tracer.phase('construct_creature {}', 'a'):
+            pass
+
+        assert len(tracer._open) == 1
+
+    tracer.begin('outer')
+    tracer.begin('inner')
+    # Ends the phases begun within too
+    tracer.end('outer')
+    assert tracer._open == []
+    assert [phase[3] for phase in tracer.phases] == [0, 1, 0, 1]
+    assert all(phase[2] is not None for phase in tracer.phases)
+
+def test_history_capped(tmpdir):
+    tracer = StartupTracer()
+    tracer.finish()
+    tracer.max_history = 3
+    for version in range(5):
+        tracer.write(str(tmpdir), str(version))
+
+    history = [json.loads(line) for line in tmpdir.join(StartupTracer.history_filename).readlines()]
+    assert [record['version'] for record in history] == ['2', '3', '4']
@@ -229,3 +229,41 @@ def test_deleted_part(creature_store):
     key = s.add_part(name)
     assert key == 'foo/3'
 
+
+def test_constructable_registry():
+    registry = ConstructableRegistry(['collections.OrderedDict'])
+    assert 'collections.OrderedDict' in registry
+    assert 'collections.deque' not in registry
+    assert list(registry) == ['collections.OrderedDict']
+
+    from collections import OrderedDict
+    assert registry['collections.OrderedDict'] is OrderedDict
+
+    with pytest.raises(KeyError):
+        registry['collections.deque']
+
+def test_constructable_members():
+    # Paths must be module path and class name
+    for class_path in constructable_members:
+        assert constructable_members[class_path].__name__ == class_path.rpartition('.')[2]
+
+def test_jelly_generations(creature_store):
+    store = creature_store
+    store.store_sync()
+    generation = jelly_generations['test']
+
+    # Nothing changed
+    store.store_sync()
+    store['_info'] = dict(store['_info'])
+    store.store_sync()
+    assert jelly_generations['test'] == generation
+
+    store['foo'] = {'x': 5}
+    store.store_sync()
+    assert jelly_generations['test'] == generation + 1
+
+    store['foo']['x'] = 6
+    store.mark_changed()
+    store.store_sync()
+    assert jelly_generations['test'] == generation + 2
+    assert 'other' not in jelly_generations
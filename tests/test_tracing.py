@@ -0,0 +1,79 @@
+__author__ = 'awhite'
+
+import json
+
+from misc.tracing import ProbeRegistry, AggregateSink, ChromeTraceSink
+
+class Part(object):
+    def update(self):
+        return 'part'
+
+class Tentacle(Part):
+    def update(self):
+        return 'tentacle'
+
+class Gooey(Part):
+    pass
+
+def test_probes_enable_disable():
+    registry = ProbeRegistry()
+    registry.register('part.update', Part, 'update', subclasses=True)
+    original = Part.__dict__['update']
+
+    sink = AggregateSink()
+    registry.enable(sink)
+    assert Part().update() == 'part'
+    assert Tentacle().update() == 'tentacle'
+    assert Tentacle().update() == 'tentacle'
+    assert Gooey().update() == 'part'
+
+    assert registry.disable() is sink
+    assert Part.__dict__['update'] is original
+    assert registry.sink is None
+
+    summary = sink.summary()
+    assert summary['part.update']['count'] == 2
+    assert summary['part.update:Tentacle']['count'] == 2
+
+def test_probe_rebind():
+    registry = ProbeRegistry()
+    part = Tentacle()
+    # handler bound before the probe is toggled, like Kivy's on_<property>
+    handlers = [part.update]
+
+    def rebind(old, new):
+        handlers.remove(old.__get__(part, Tentacle))
+        handlers.append(new.__get__(part, Tentacle))
+
+    registry.register('tentacle.update', Tentacle, 'update', rebind=rebind)
+    sink = AggregateSink()
+    registry.enable(sink)
+    assert handlers[0]() == 'tentacle'
+    assert sink.summary()['tentacle.update']['count'] == 1
+
+    registry.disable()
+    assert handlers == [part.update]
+    assert handlers[0].__func__ is Tentacle.__dict__['update']
+
+def test_register_missing_method():
+    registry = ProbeRegistry()
+    try:
+        registry.register('gooey.update', Gooey, 'update')
+    except ValueError:
+        pass
+    else:
+        assert False, 'Expected ValueError'
+
+def test_chrome_trace_sink(tmpdir):
+    path = str(tmpdir.join('trace.json'))
+    registry = ProbeRegistry()
+    registry.register('tentacle.update', Tentacle, 'update')
+    registry.enable(ChromeTraceSink(path))
+    Tentacle().update()
+    registry.disable()
+
+    with open(path) as f:
+        events = json.load(f)['traceEvents']
+
+    assert [e['name'] for e in events] == ['tentacle.update']
+    assert events[0]['ph'] == 'X'
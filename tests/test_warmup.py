@@ -0,0 +1,68 @@
+__author__ = 'awhite'
+
+import threading
+
+from misc.warmup import WarmupScheduler
+
+def run_idle_tasks(scheduler):
+    # As the Clock would, one per frame
+    for _ in range(10):
+        scheduler._run_idle(0)
+
+def test_idle_tasks_in_order():
+    scheduler = WarmupScheduler()
+    done = []
+    scheduler.start(idle=[('a', done.append, ('a',)), ('b', done.append, ('b',))])
+    run_idle_tasks(scheduler)
+    assert done == ['a', 'b']
+    assert not scheduler.running
+
+def test_cancel_during_background_task():
+    scheduler = WarmupScheduler()
+    started = threading.Event()
+    release = threading.Event()
+    done = []
+
+    def read():
+        started.set()
+        release.wait(5)
+        scheduler.add_idle('after cancel', done.append, 'idle')
+
+    scheduler.start(background=[('read', read, ()), ('never', done.append, ('background',))])
+    thread = scheduler._thread
+    assert started.wait(5)
+
+    # The user navigated
+    scheduler.cancel()
+    release.set()
+    thread.join(5)
+
+    assert not scheduler.running
+    run_idle_tasks(scheduler)
+    assert done == []
+
+def test_add_idle_from_cancelled_run():
+    scheduler = WarmupScheduler()
+    started = threading.Event()
+    release = threading.Event()
+    done = []
+
+    def read():
+        started.set()
+        release.wait(5)
+        scheduler.add_idle('stale', done.append, 'stale')
+
+    scheduler.start(background=[('read', read, ())])
+    old_thread = scheduler._thread
+    assert started.wait(5)
+
+    # Next screen's warm-up, while the old run's task is still running
+    scheduler.start(idle=[('fresh', done.append, ('fresh',))],
+                    background=[('new', done.append, ('new background',))])
+    release.set()
+    old_thread.join(5)
+    if scheduler._thread is not None:
+        scheduler._thread.join(5)
+
+    run_idle_tasks(scheduler)
+    assert sorted(done) == ['fresh', 'new background']
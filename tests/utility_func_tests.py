@@ -5,6 +5,21 @@ __author__ = 'awhite'
 import unittest
 
 from visuals.creatures import fix_angle
+from misc.util import UpperEnvelope, window_scale
+
+
+class FakeWidget(object):
+    """to_window() of a Widget with an optional Scatter-like scale"""
+    def __init__(self, parent=None, scale=1.0):
+        self.parent = parent
+        self.scale = scale
+
+    def to_window(self, x, y, initial=True):
+        if not initial:
+            x, y = x * self.scale + 5, y * self.scale + 5
+        if self.parent:
+            return self.parent.to_window(x, y, initial=False)
+        return x, y
 
 class TestNumericalFunctions(unittest.TestCase):
 
@@ -21,3 +36,17 @@ class TestNumericalFunctions(unittest.TestCase):
         self.assertEqual(fix_angle(180+90+45), -45)
         self.assertEqual(fix_angle(-184), 176)
         self.assertEqual(fix_angle(-180 - 179), 1)
+
+    def test_upper_envelope(self):
+        lines = [(1.0, 0.0), (-1.0, 0.0), (0.0, 0.5), (0.0, -1.0), (0.25, 0.1), (1.0, -2.0)]
+        envelope = UpperEnvelope(lines)
+        for i in range(-30, 31):
+            t = i / 10.0
+            self.assertAlmostEqual(envelope(t), max(s * t + c for s, c in lines))
+
+        self.assertEqual(UpperEnvelope([(2.0, 3.0)])(2.0), 7.0)
+        self.assertRaises(ValueError, UpperEnvelope, [])
+
+    def test_window_scale(self):
+        self.assertEqual(window_scale(FakeWidget()), 1.0)
+        self.assertEqual(window_scale(FakeWidget(FakeWidget(scale=2.0), scale=1.5)), 3.0)
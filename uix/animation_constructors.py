@@ -1,9 +1,11 @@
+from functools import partial
+
 from kivy import Logger
 from kivy.animation import Animation
 from kivy.clock import Clock
-from kivy.core.image import Image as CoreImage
 from kivy.graphics.context_instructions import Color
 from kivy.graphics.vertex_instructions import Rectangle, Mesh
+from kivy.metrics import cm
 from kivy.properties import ListProperty, BoundedNumericProperty, BooleanProperty, StringProperty
 from kivy.uix.scatter import Scatter
 from kivy.vector import Vector
@@ -11,8 +13,11 @@ from kivy.utils import deprecated
 
 from visuals.animations import MeshAnimator, setup_step
 from visuals.drawn_visual import ControlPoint
+from visuals.vertex_buffer import VertexBuffer
 
 from data.state_storage import construct_value
+from misc.image_util import load_texture_async
+from misc.spatial import PointGrid
 
 __author__ = 'awhite'
 
@@ -34,6 +39,8 @@ class AnimationConstructor(Scatter):
     control_points_disabled = BooleanProperty(False)
     control_points_opacity = BoundedNumericProperty(1.0, min=0.0, max=1.0)
     image_filepath = StringProperty()
+    # Whether the image_filepath texture is loaded and self.size is the image size
+    image_loaded = BooleanProperty(False)
     image_opacity = BoundedNumericProperty(1.0, min=0.0, max=1.0)
     mesh_mode = StringProperty('triangle_fan')
 
@@ -44,11 +51,15 @@ class AnimationConstructor(Scatter):
         self.mesh_attached = False
         self._image_size_set = False
         self.mesh = None
+        self.mesh_animator = None
         self.animation_steps_order = []
 
         self.faded_image_opacity = 0.5
         self._moved_control_point_trigger = Clock.create_trigger(self.on_control_point_moved)
         self._control_point_opacity_trigger = Clock.create_trigger(self._animate_control_point_opacity)
+        # ControlPoint positions (local coordinates) for touch hit testing, cells about ControlPoint.natural_size
+        self._control_point_grid = PointGrid(cell_size=cm(1.0))
+        self._num_enabled_control_points = 0
 
         super(AnimationConstructor, self).__init__(**kwargs)
         self._previous_step = self.animation_step
@@ -62,6 +73,8 @@ class AnimationConstructor(Scatter):
             self.mesh_color = Color(rgba=(1, 1, 1, 1))
             self.mesh = Mesh(mode=self.mesh_mode)
 
+        self.vertex_buffer = VertexBuffer(self.mesh)
+
     def on_mesh_mode(self, _, mode):
         self.mesh.mode = str(mode)
 
@@ -205,19 +218,22 @@ class AnimationConstructor(Scatter):
 
     def on_image_filepath(self, _, image_filepath):
         # self has default size at this point, sizing must be done in on_size
+        # Image is decoded in the background, show a placeholder until on_image_texture
+        self.image_loaded = False
+        texture = load_texture_async(image_filepath, partial(self.on_image_texture, image_filepath))
 
-        try:
-            self.canvas.remove(self._core_image)
-            Logger.debug('%s: removed old _core_image', self.__class__.__name__)
-        except:
-            pass
+        if not self.image_loaded:
+            self.image.texture = texture
+            self.image.size = texture.size
 
-        with self.canvas:
-            # mipmap=True changes tex_coords and screws up calculations
-            # TODO Research mipmap more
-            self._core_image = cimage = CoreImage(image_filepath, mipmap=False)
+    def on_image_texture(self, image_filepath, texture):
+        if image_filepath != self.image_filepath:
+            # image_filepath changed while loading
+            return
 
-        texture = cimage.texture
+        # mipmap=True changes tex_coords and screws up calculations
+        # (Loader does not mipmap by default)
+        # TODO Research mipmap more
 
         self.image.texture = texture
         self.mesh.texture = texture
@@ -234,7 +250,19 @@ class AnimationConstructor(Scatter):
         # Just set Scatter and Rectangle to texture size
         self.image.size = texture.size
         self.size = texture.size
-        # Will be positioned and scalled in on_parent_size
+        self.image_loaded = True
+
+        # Texture may arrive after parent was sized
+        if self.parent:
+            self.on_parent_size(self.parent, self.parent.size)
+
+        # Mesh vertices (u, v) depend on size, so calculate now that it's known
+        if self.control_points:
+            if self.animation_step != setup_step:
+                # u, v come from the setup_step positions
+                self.calc_mesh_vertices(step=setup_step, preserve_uv=False)
+
+            self._moved_control_point_trigger()
 
     def on_size(self, _, size):
         Logger.debug(self.__class__.__name__ + '.on_size %s', size)
@@ -259,6 +287,10 @@ class AnimationConstructor(Scatter):
 
     def on_control_point_moved(self, _):
         # one or more ControlPoints moved
+        if not self.image_loaded:
+            # on_image_texture triggers this again
+            return
+
         self.calc_mesh_vertices(preserve_uv=self.animation_step!=setup_step)
 
     def on_animation_step(self, widget, step):
@@ -291,7 +323,7 @@ class AnimationConstructor(Scatter):
 
             mesh = self.mesh
 
-            if self._previous_step == setup_step:
+            if self._previous_step == setup_step and self.image_loaded:
                 # Redo base vertices when moving from 0 to other
                 Logger.debug('Recalculating vertices/indices during transition from step 0')
                 self.calc_mesh_vertices(step=setup_step, preserve_uv=False)
@@ -390,7 +422,8 @@ class AnimationConstructor(Scatter):
             indices = range(num)
 
         if update_mesh:
-            mesh_verts = self.mesh.vertices
+            vertex_buffer = self.vertex_buffer
+            mesh_verts = vertex_buffer.data
             num_mesh_verts = len(mesh_verts)
 
             # preserve_uv: Do not overwrite the uv coordinates in the current Mesh.vertices
@@ -414,10 +447,12 @@ class AnimationConstructor(Scatter):
                     mesh_verts[x] = verts[x]
                     mesh_verts[x+1] = verts[x+1]
 
-                self.mesh.vertices = mesh_verts
+                # Editing, update now rather than before the next frame
+                vertex_buffer.mark_dirty()
+                vertex_buffer.flush()
 
             else:
-                self.mesh.vertices = verts
+                vertex_buffer.replace(verts)
 
             self.mesh.indices = indices
 
@@ -437,7 +472,13 @@ class AnimationConstructor(Scatter):
         "Start/Stop animation preview"
 
         if activate_preview:
+            if not self.image_loaded:
+                Logger.debug('%s: image not loaded, not previewing animation', self.__class__.__name__)
+                return
+
             self.mesh_animator = a = construct_value(self.create_mesh_animator_construction())
+            # Both write the same Mesh, share its VertexBuffer
+            a.vertex_buffer = self.vertex_buffer
             a.mesh = self.mesh
             self.animating = True
             a.start_animation()
@@ -452,6 +493,30 @@ class AnimationConstructor(Scatter):
             self.animating = False
 
 
+    def add_widget(self, widget, index=0):
+        super(AnimationConstructor, self).add_widget(widget, index)
+        if isinstance(widget, ControlPoint):
+            self._control_point_grid.insert(widget, widget.pos)
+            if not widget.disabled:
+                self._num_enabled_control_points += 1
+
+            widget.bind(pos=self._on_control_point_pos, disabled=self._on_control_point_disabled)
+
+    def remove_widget(self, widget):
+        super(AnimationConstructor, self).remove_widget(widget)
+        if widget in self._control_point_grid:
+            self._control_point_grid.remove(widget)
+            if not widget.disabled:
+                self._num_enabled_control_points -= 1
+
+            widget.unbind(pos=self._on_control_point_pos, disabled=self._on_control_point_disabled)
+
+    def _on_control_point_pos(self, cp, pos):
+        self._control_point_grid.move(cp, pos)
+
+    def _on_control_point_disabled(self, cp, disabled):
+        self._num_enabled_control_points += -1 if disabled else 1
+
     def collide_point(self, x, y):
         # Make it behave like ScatterPlane, but restricted to parent
         return self.parent.collide_point(x, y)
@@ -512,6 +577,10 @@ class AnimationConstructor(Scatter):
             # Defer to Scatter
             return super(AnimationConstructor, self).on_touch_down(touch)
 
+        if not self.image_loaded:
+            # ControlPoint positions are relative to the image size
+            return False
+
 
         # Otherwise, find nearest ControlPoint
         # We must take over children's on_touch_down since having them check who's closest instead of the parent
@@ -522,27 +591,17 @@ class AnimationConstructor(Scatter):
             touch.apply_transform_2d(self.to_local)
             transformed_x, transformed_y = touch.x, touch.y
 
-            if self.children:
-                touch_vec = Vector(transformed_x, transformed_y)
-
-                closest = None
-                closest_dist = 0
-                for child in self.children:
-                    if child.disabled:
-                        continue
-
-                    # Distance from touch to child
-                    dist = touch_vec.distance(child.pos)
-                    if closest is None or dist < closest_dist:
-                        closest = child
-                        closest_dist = dist
-
-                if closest is None:
-                    # All children disabled
+            if self.control_points:
+                if not self._num_enabled_control_points:
                     return False
 
-                # Grab closest if within certain distance
-                elif closest_dist < closest.width/1.5:
+                # Grab closest enabled if within certain distance
+                # ControlPoints share natural_size, their size is scaled to stay the same on screen
+                grab_distance = self.control_points[0].natural_size / self.scale / 1.5
+                nearest = self._control_point_grid.nearest((transformed_x, transformed_y), grab_distance,
+                                                           lambda cp: not cp.disabled)
+                if nearest is not None and nearest[0] < nearest[1].width/1.5:
+                    closest = nearest[1]
                     closest.pos = transformed_x, transformed_y
                     touch.grab(closest)
                     return True
@@ -577,6 +636,14 @@ class AnimationConstructor(Scatter):
 
 
 
+    def on_touch_move(self, touch):
+        if touch.grab_current is None and not self.move_resize:
+            # Only a grabbed ControlPoint moves, grabbed touches are dispatched to it directly,
+            # so skip dispatching to every ControlPoint. Stop propagating like Scatter.
+            return self.collide_point(touch.x, touch.y)
+
+        return super(AnimationConstructor, self).on_touch_move(touch)
+
         # Using Scatter now, need to think about, not needed I think
     # def on_touch_move(self, touch):
     #     x, y = touch.x, touch.y
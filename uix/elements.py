@@ -9,6 +9,7 @@ __author__ = 'awhite'
 from kivy.logger import Logger
 from kivy.uix.widget import Widget
 from kivy.uix.button import Button
+from kivy.uix.label import Label
 from kivy.uix.spinner import Spinner
 from kivy.uix.boxlayout import BoxLayout
 from kivy.properties import ListProperty, StringProperty
@@ -16,28 +17,61 @@ from kivy.clock import Clock
 
 import cymunk as phy
 
-from visuals.creatures.jelly import JellyBell
 from misc.exceptions import InsufficientData
 from data.state_storage import construct_creature
-from misc.physics_util import cleanup_space
+from misc.physics_util import cleanup_space, PhysicsRegistry, PhysicsSampler
+from misc.frame_governor import frame_governor
+from misc.profiling import profiler
+from misc.memory import leak_tracker
+from misc.util import window_scale
 
 
 class CreatureWidget(Widget):
     """Contains and centers a Creature"""
 
+    # Seconds between phy_sampler samples, None to not sample
+    physics_stats_interval = None
+
     def set_creature(self, creature):
         self.update_interval = 1/60.0
         self.creature = creature
         creature.pos = self.center
+        creature.view_scale = window_scale(self)
 
         self.phy_space = phy.Space()
+        self.phy_registry = PhysicsRegistry(self.phy_space)
+        self.phy_sampler = PhysicsSampler(self.phy_space, self.physics_stats_interval)
         creature.bind_environment(self)
         self.canvas.add(creature.canvas)
 
-        Clock.schedule_interval(self.update_simulation, self.update_interval)
+        # Simulated when the FrameGovernor allows
+        frame_governor.add_preview(self.on_preview_allowed)
+
+    def on_preview_allowed(self, allowed):
+        Clock.unschedule(self.update_simulation)
+        if allowed:
+            Clock.schedule_interval(self.update_simulation, self.update_interval)
+
+    def suspend(self):
+        """Stop simulating and animating until resume()"""
+        if hasattr(self, 'phy_space'):
+            frame_governor.remove_preview(self.on_preview_allowed)
+            Clock.unschedule(self.update_simulation)
+            self.creature.suspend()
+
+    def resume(self):
+        if hasattr(self, 'phy_space'):
+            self.creature.resume()
+            frame_governor.add_preview(self.on_preview_allowed)
 
     def update_simulation(self, dt):
-        self.phy_space.step(self.update_interval)
+        creature = self.creature
+        # Follow zooming of Scatter ancestors
+        view_scale = window_scale(self)
+        if view_scale != creature.view_scale:
+            creature.view_scale = view_scale
+
+        self.phy_sampler.step(self.update_interval)
         self.creature.update(dt)
         # Reset position to center
         self.creature.pos = self.center
@@ -50,10 +84,15 @@ class CreatureWidget(Widget):
         Logger.debug('%s: destroy() unschedule update_simulation and cleanup space', self.__class__.__name__)
         Clock.unschedule(self.update_simulation)
 
-        # if set_creature was called and phy_space set
-        if hasattr(self, 'phy_space'):
+        # if set_creature was called and phy_space set (not destroyed yet)
+        if getattr(self, 'phy_space', None) is not None:
+            frame_governor.remove_preview(self.on_preview_allowed)
+            self.phy_registry.clear()
             cleanup_space(self.phy_space)
+            leak_tracker.track(self.phy_space, 'Space of {}'.format(self.__class__.__name__))
             self.phy_space = None
+            self.phy_registry = None
+            self.phy_sampler.space = None
 
     # def on_size(self):
     #     pass
@@ -100,6 +139,24 @@ class JellySelectButton(Button):
         #print(self.last_touch)
         pass
 
+class ProfilerOverlay(Label):
+    """Shows the profiler summary on top of the app.
+    The profiler is enabled while the overlay has a parent."""
+
+    refresh_interval = 0.5
+
+    def on_parent(self, _, parent):
+        if parent:
+            profiler.enabled = True
+            self.refresh(0)
+            Clock.schedule_interval(self.refresh, self.refresh_interval)
+        else:
+            profiler.enabled = False
+            Clock.unschedule(self.refresh)
+
+    def refresh(self, dt):
+        self.text = profiler.format_summary()
+
 class FloatLayoutStencilView(FloatLayout, StencilView):
     pass
 
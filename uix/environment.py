@@ -9,7 +9,13 @@ from kivy.clock import Clock
 
 import cymunk as phy
 
-from misc.physics_util import cleanup_space
+from misc.physics_util import cleanup_space, PhysicsRegistry, PhysicsSampler
+from misc.frame_governor import frame_governor
+from misc.profiling import profiler, timer
+from misc.memory import leak_tracker, creature_report
+from misc.recording import recorder
+from misc.util import window_scale
+from visuals.batch_renderer import BatchRenderer
 
 
 class BasicEnvironment(RelativeLayout):
@@ -21,8 +27,40 @@ class BasicEnvironment(RelativeLayout):
     paused = BooleanProperty(False)
     creatures = ListProperty()
 
+    # Seconds between phy_sampler samples, None to not sample (i.e. replay.py sets it)
+    physics_stats_interval = BoundedNumericProperty(None, min=0.01, max=3600, allownone=True)
+
+    # Draw creatures with a BatchRenderer instead of their own canvas (except creatures with debug_visuals)
+    # Must be set when constructing
+    batch_rendering = BooleanProperty(False)
+
     # TODO maybe add_creature, remove_creature events
 
+    def __init__(self, **kwargs):
+        super(BasicEnvironment, self).__init__(**kwargs)
+        self.batch_renderer = BatchRenderer(self.canvas) if self.batch_rendering else None
+        # Creatures added while suspended are suspended too
+        self.suspended = False
+
+        self.update_interval = frame_governor.simulation_interval
+        frame_governor.bind(simulation_interval=self.on_governor_interval)
+
+        # window_scale() creatures were last given
+        self._view_scale = 1.0
+
+    def on_governor_interval(self, _, interval):
+        self.update_interval = interval
+
+    def on_update_interval(self, _, interval):
+        if self.initialized and not self.paused:
+            # Reschedule at the new interval
+            Clock.unschedule(self.update_simulation)
+            Clock.schedule_interval(self.update_simulation, interval)
+
+    def on_physics_stats_interval(self, _, interval):
+        if self.initialized:
+            self.phy_sampler.interval = interval
+
     def on_size(self, _, size):
         if size == [1, 1]:
             return
@@ -40,27 +78,78 @@ class BasicEnvironment(RelativeLayout):
 
     def add_creature(self, creature):
         Logger.debug('%s: add_creature %s', self.__class__.__name__, creature.creature_id)
-        self.canvas.add(creature.canvas)  # TODO is this right?
+        if recorder.recording:
+            recorder.add_creature(self, creature)
+
+        if self.batch_renderer:
+            self.batch_renderer.add(creature)
+        else:
+            self.canvas.add(creature.canvas)  # TODO is this right?
+
         self.creatures.append(creature)
+        creature.view_scale = self._view_scale
         if self.initialized:
             creature.bind_environment(self)
 
+        if self.suspended:
+            creature.suspend()
+
     def remove_creature(self, creature):
+        if recorder.recording:
+            recorder.remove_creature(self, creature)
+
         self.creatures.remove(creature)
-        self.canvas.remove(creature.canvas)
+        if self.batch_renderer:
+            self.batch_renderer.remove(creature)
+        else:
+            self.canvas.remove(creature.canvas)
+
         creature.destroy()
 
+    def suspend(self):
+        """Pause the simulation and creature animations until resume()"""
+        self.suspended = True
+        self._paused_before_suspend = self.paused
+        self.paused = True
+        for creature in self.creatures:
+            creature.suspend()
+
+    def resume(self):
+        self.suspended = False
+        self.paused = self._paused_before_suspend
+        for creature in self.creatures:
+            creature.resume()
+
     def destroy(self):
         Logger.debug('{}: on_leave() unscheduling update_simulation and cleaning-up physics space'
                      .format(self.__class__.__name__))
 
         self.paused = True
+        frame_governor.unbind(simulation_interval=self.on_governor_interval)
+        if recorder.recording:
+            recorder.destroy(self)
+
+        if self.batch_renderer:
+            self.batch_renderer.clear()
+
+        if not self.initialized or self.phy_space is None:
+            # No physics space, or already destroyed
+            return
 
         # Clean-up physics space
+        # registry first, then anything added to the space directly
+        self.phy_registry.clear()
         cleanup_space(self.phy_space)
+        leak_tracker.track(self.phy_space, 'Space of {}'.format(self.__class__.__name__))
 
         # This seems to force garbage collection immediately
         self.phy_space = None
+        self.phy_registry = None
+        self.phy_sampler.space = None
+
+    def memory_report(self):
+        """:returns list of misc.memory.creature_report() of each creature"""
+        return [creature_report(c) for c in self.creatures]
 
     def update_simulation(self, dt):
         # Could pass dt, but docs state:
@@ -68,10 +157,32 @@ class BasicEnvironment(RelativeLayout):
         # highly recommended. Doing so will increase the efficiency of the contact
         # persistence, requiring an order of magnitude fewer iterations to resolve
         # the collisions in the usual case.
-        self.phy_space.step(self.update_interval)
+        if recorder.recording:
+            recorder.update_simulation(self, dt)
+
+        # profiler.call() only times while the profiler is enabled
+        call = profiler.call
+        frame_start = timer()
+        self.update_view_scale()
+        call('environment.physics_step', self.phy_sampler.step, self.update_interval)
 
         for c in self.creatures:
-            c.update(dt)
+            call(c.update_section, c.update, dt)
+
+        if self.batch_renderer:
+            call('environment.batch_render', self.batch_renderer.update)
+
+        if profiler.enabled:
+            profiler.record('environment.update_simulation', timer() - frame_start)
+
+    def update_view_scale(self):
+        """Give creatures the current scale to window pixels when it changed,
+        so their level of detail follows zooming of Scatter ancestors"""
+        view_scale = window_scale(self)
+        if view_scale != self._view_scale:
+            self._view_scale = view_scale
+            for c in self.creatures:
+                c.view_scale = view_scale
 
     def initialize(self):
         "called after size set once"
@@ -82,6 +193,9 @@ class BasicEnvironment(RelativeLayout):
         # http://niko.in.ua/blog/using-physics-with-kivy/
         # kw - is some key-word arguments for configuting Space
         self.phy_space = space = phy.Space()
+        self.phy_registry = PhysicsRegistry(space)
+        # Statistics are kept after destroy
+        self.phy_sampler = PhysicsSampler(space, self.physics_stats_interval)
         # space.damping = 0.9
 
         # wall = phy.Segment(phy.Body(), (0, 1), (3000, 1), 0.0)
@@ -0,0 +1,16 @@
+__author__ = 'awhite'
+
+# Registers the classes that KV rules create by name with the Factory,
+# so their modules are imported when a rule first creates one instead of at startup.
+
+from kivy.factory import Factory
+
+r = Factory.register
+r('CreatureWidget', module='uix.elements')
+r('JellySelectButton', module='uix.elements')
+r('ProfilerOverlay', module='uix.elements')
+r('FloatLayoutStencilView', module='uix.elements')
+r('LabeledSpinner', module='uix.elements')
+r('TweakSetting', module='uix.elements')
+r('FixedCarousel', module='uix.hacks_fixes')
+r('AnimationConstructor', module='uix.animation_constructors')
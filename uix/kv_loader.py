@@ -0,0 +1,148 @@
+__author__ = 'awhite'
+
+# Loads KV files with the Builder, caching the parsed rules between launches.
+# Files are loaded once; load before creating the first widget that uses their rules.
+
+import copy_reg
+import cPickle as pickle
+import hashlib
+import marshal
+import os
+import os.path as P
+import sys
+from functools import partial
+from types import CodeType
+
+import kivy
+from kivy.factory import Factory
+from kivy.lang import Builder, Parser
+from kivy.logger import Logger
+
+from misc.profiling import timer
+
+# KV paths are relative to the project directory
+project_dir = P.dirname(P.dirname(P.abspath(__file__)))
+
+# Rule values are compiled by the Parser
+copy_reg.pickle(CodeType, lambda code: (marshal.loads, (marshal.dumps(code),)))
+
+
+class KvLoader(object):
+    """Loads KV files, pickling the kivy.lang.Parser of each file in cache_dir keyed by
+    the content hash (and Kivy/Python versions). A cached Parser skips parsing and compiling,
+    its directives are executed again.
+    Relies on Builder internals (Kivy 1.9), falls back to Builder.load_file on errors.
+    Use kv_loader instead of creating another.
+    """
+
+    def __init__(self, cache_dir=None):
+        # None to not cache
+        self.cache_dir = cache_dir
+        self.loaded = set()
+
+    def load_file(self, filename):
+        """Load the KV file once. Relative filenames are relative to the project directory.
+        :returns root widget of the file or None
+        """
+        filename = P.join(project_dir, filename)
+        if filename in self.loaded:
+            return None
+
+        start = timer()
+        with open(filename) as f:
+            content = f.read()
+
+        cache_path = self._cache_path(content)
+        parser = self._read_cache(cache_path) if cache_path else None
+        cached = parser is not None
+        try:
+            if parser is None:
+                parser = Parser(content=content, filename=filename)
+                if cache_path:
+                    self._write_cache(cache_path, parser)
+
+            else:
+                parser.execute_directives()
+
+            root = self._apply(parser, filename)
+
+        except Exception:
+            # Rules applied before the failure would be applied again
+            Builder.unload_file(filename)
+            if not cached:
+                raise
+
+            Logger.exception('KvLoader: cached %s failed, loading %s', cache_path, filename)
+            os.remove(cache_path)
+            root = Builder.load_file(filename)
+
+        self.loaded.add(filename)
+        Logger.debug('KvLoader: loaded %s in %.1f ms%s', filename, (timer() - start) * 1000,
+                     ' (cached)' if cached else '')
+        return root
+
+    def is_loaded(self, filename):
+        return P.join(project_dir, filename) in self.loaded
+
+    def _cache_path(self, content):
+        if self.cache_dir is None:
+            return None
+
+        sha = hashlib.sha1(content)
+        sha.update(kivy.__version__)
+        sha.update(sys.version)
+        return P.join(self.cache_dir, sha.hexdigest() + '.pickle')
+
+    def _read_cache(self, cache_path):
+        if not P.exists(cache_path):
+            return None
+
+        try:
+            with open(cache_path, 'rb') as f:
+                return pickle.load(f)
+
+        except Exception:
+            Logger.exception('KvLoader: removing unreadable %s', cache_path)
+            os.remove(cache_path)
+            return None
+
+    def _write_cache(self, cache_path, parser):
+        try:
+            if not P.exists(self.cache_dir):
+                os.makedirs(self.cache_dir)
+
+            with open(cache_path, 'wb') as f:
+                pickle.dump(parser, f, pickle.HIGHEST_PROTOCOL)
+
+        except Exception:
+            Logger.exception('KvLoader: failed to cache %s', parser.filename)
+            if P.exists(cache_path):
+                os.remove(cache_path)
+
+    def _apply(self, parser, filename):
+        """Same as Builder.load_string() after parsing"""
+        Builder._current_filename = filename
+        try:
+            Builder.rules.extend(parser.rules)
+            Builder._clear_matchcache()
+
+            for name, cls, template in parser.templates:
+                Builder.templates[name] = (cls, template, filename)
+                Factory.register(name, cls=partial(Builder.template, name), is_template=True, warn=True)
+
+            for name, baseclasses in parser.dynamic_classes.items():
+                Factory.register(name, baseclasses=baseclasses, filename=filename, warn=True)
+
+            if parser.templates or parser.dynamic_classes or parser.rules:
+                Builder.files.append(filename)
+
+            if parser.root:
+                widget = Factory.get(parser.root.name)()
+                Builder._apply_rule(widget, parser.root, parser.root)
+                return widget
+
+        finally:
+            Builder._current_filename = None
+
+
+kv_loader = KvLoader()
@@ -6,13 +6,40 @@ __author__ = 'awhite'
 # __all__ = []
 
 # types.ClassType is for old style
+from collections import OrderedDict
 from types import TypeType
 from kivy.logger import Logger
 from kivy.uix.widget import Widget
 
+from uix.kv_loader import kv_loader
+
 # loaded and loadable objects
 _loaded = {}
 
+# KV files with the rules of screens (other than myjelly.kv), loaded before the screen is first constructed
+construction_kv = 'kv/creature_construction.kv'
+tweaks_kv = 'kv/tweaks.kv'
+_screen_kv_files = {
+    'JellyDesignScreen': (construction_kv,),
+    'AnimationConstructorScreen': (construction_kv,),
+    'JellyBellConstructorScreen': (construction_kv,),
+    'TentaclesConstructorScreen': (construction_kv,),
+    'CreatureTweakScreen': (tweaks_kv,),
+}
+
+# Screens likely opened next from each screen, most likely first
+likely_successors = {
+    'JellySelectionScreen': ('JellyDesignScreen', 'JellyEnvironmentScreen'),
+    'JellyEnvironmentScreen': ('JellySelectionScreen',),
+    'JellyDesignScreen': ('JellyBellConstructorScreen', 'CreatureTweakScreen', 'TentaclesConstructorScreen',
+                          'AnimationConstructorScreen', 'JellySelectionScreen'),
+    'JellyBellConstructorScreen': ('JellyDesignScreen',),
+    'AnimationConstructorScreen': ('JellyDesignScreen',),
+    'TentaclesConstructorScreen': ('JellyDesignScreen',),
+    'CreatureTweakScreen': ('JellyDesignScreen',),
+    'KivyImageSelectScreen': ('JellySelectionScreen',),
+}
+
 def _add_loaded(module):
     for name, cls in module.__dict__.viewitems():
         if isinstance(cls, TypeType) and issubclass(cls, Widget):
@@ -47,4 +74,91 @@ def load(name):
         import_func()
 
     # found name or ran out of imports
-    return _loaded[name]
+    obj = _loaded[name]
+
+    for kv_file in _screen_kv_files.get(name, ()):
+        kv_loader.load_file(kv_file)
+
+    return obj
+
+
+class ScreenCache(object):
+    """LRU of screens kept suspended after leaving, to be shown again by open_screen,
+    and suspended screens prebuilt before they're opened.
+    Keyed by screen name and arguments. Evicted and out of date screens are destroyed.
+    Use screen_cache instead of creating another.
+    """
+
+    def __init__(self, size=3):
+        self.size = size
+        self._screens = OrderedDict()
+        # Not counted in size, destroyed by clear_prebuilt()
+        self._prebuilt = {}
+
+    def __len__(self):
+        return len(self._screens)
+
+    def __contains__(self, key):
+        return key in self._screens or key in self._prebuilt
+
+    @property
+    def num_prebuilt(self):
+        return len(self._prebuilt)
+
+    @staticmethod
+    def key(name, screen_args):
+        """:returns key of the screen, None if an argument isn't hashable"""
+        key = (name, tuple(sorted(screen_args.viewitems())))
+        try:
+            hash(key)
+        except TypeError:
+            return None
+
+        return key
+
+    def take(self, key):
+        """Remove the screen from the cache
+        :returns the screen, None if not cached or out of date"""
+        screen = self._prebuilt.pop(key, None)
+        if screen is None:
+            screen = self._screens.pop(key, None)
+
+        if screen is not None and screen.is_stale():
+            Logger.debug('screens: cached %s is out of date', key[0])
+            screen.destroy()
+            return None
+
+        return screen
+
+    def put(self, key, screen):
+        """Add the suspended screen, evicting the least recently used"""
+        replaced = self._screens.pop(key, None)
+        if replaced is not None and replaced is not screen:
+            # Opened again while it was leaving, a new one was built
+            Logger.debug('screens: replacing cached %s', key[0])
+            replaced.destroy()
+
+        self._screens[key] = screen
+        while len(self._screens) > self.size:
+            evicted_key, evicted = self._screens.popitem(last=False)
+            Logger.debug('screens: evicting %s from cache', evicted_key[0])
+            evicted.destroy()
+
+    def add_prebuilt(self, key, screen):
+        """Add the suspended screen that was built before being opened"""
+        self._prebuilt[key] = screen
+
+    def clear_prebuilt(self):
+        """Destroy the prebuilt screens that weren't opened"""
+        while self._prebuilt:
+            key, screen = self._prebuilt.popitem()
+            Logger.debug('screens: destroying unused prebuilt %s', key[0])
+            screen.destroy()
+
+    def clear(self):
+        self.clear_prebuilt()
+        while self._screens:
+            self._screens.popitem()[1].destroy()
+
+
+screen_cache = ScreenCache()
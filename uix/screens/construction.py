@@ -9,19 +9,22 @@ from kivy.clock import Clock
 from kivy.utils import platform
 from kivy.logger import Logger, LOG_LEVELS
 from kivy.properties import StringProperty, ObjectProperty, BooleanProperty, BoundedNumericProperty, \
-    ListProperty
+    ListProperty, NumericProperty
 from kivy.animation import Animation
 from kivy.uix.actionbar import ActionButton
+from kivy.uix.scatter import Scatter
 
 from .main_screens import AppScreen
 from visuals.animations import setup_step
-from visuals.creatures.jelly import JellyBell, GooeyBodyPart, Tentacle, Parts
+from visuals.creatures.jelly import JellyBell, GooeyBodyPart, Tentacle
+from visuals.creatures.parts import Parts
 from uix.environment import BasicEnvironment
 from uix.elements import LabeledSpinner
 from uix.animation_constructors import AnimationConstructor
 from data.state_storage import load_jelly_storage, \
     construct_creature, constructable_members, new_jelly, lookup_constructable
 from misc.util import not_none_keywords
+from misc.memory import leak_tracker
 
 # Map Parts part_names to their constructors
 _parts_to_constructors = {
@@ -42,6 +45,9 @@ class AnimationConstructorScreen(AppScreen):
     Provides UI to switch between animation_steps if set."""
     state_attributes = ('creature_id', 'animation_step', 'part_name')
 
+    # The AnimationConstructor is set up in setup_steps()
+    prebuild = True
+
     animation_step = StringProperty(setup_step)
     # Selectable Animation Steps [(value, label), ...]
     animation_steps = ListProperty()
@@ -60,26 +66,34 @@ class AnimationConstructorScreen(AppScreen):
         # self.image_filepath is set from store if exists there, otherwise must be provided
         self.image_filepath = image_filepath  # may be None right now
 
-        # TODO Kivy docs recommend using a property instead of ids?
-        anim_const = self.ids.animation_constructor
-        assert isinstance(anim_const, AnimationConstructor)
-
         # Part classes know how to setup AnimationConstructor from JSON structure
-        # Determine the part class and call setup_anim_constr()
+        # Determine the part class, setup_steps() calls setup_anim_constr()
         # Note: this is actually a part_instance_name
         part_name = self.part_name
-        class_path = None
+        self._part_structure = self._part_class_path = None
         try:
-            part_structure = store[part_name]
-            class_path = part_structure.keys()[0]
+            self._part_structure = store[part_name]
+            self._part_class_path = self._part_structure.keys()[0]
         except (KeyError, IndexError):
             # part was never edited before
             if self.image_filepath is None:
                 raise AssertionError('part store is missing, but not provided image_filepath!')
 
+        # GUI state to restore
+        self._screen_state = kwargs
+        self.start_setup()
+
+    def setup_steps(self):
+        # TODO Kivy docs recommend using a property instead of ids?
+        anim_const = self.ids.animation_constructor
+        assert isinstance(anim_const, AnimationConstructor)
+
+        # Image decoding and ControlPoints
+        class_path = self._part_class_path
+        if class_path is None:
             anim_const.image_filepath = self.image_filepath
 
-        if class_path:
+        else:
             # Currently JellyBell and Gooey have this class method, but not Tentacles.
             # So the current assumption is that if the part is constructed with an
             # AnimationConstructorScreen (this class), the part class implements this.
@@ -87,11 +101,14 @@ class AnimationConstructorScreen(AppScreen):
             # class seems as good as any other place. If implemented in this class,
             # the code would either make major assumptions about parts taking the same
             # kwargs, or have a switch statement for Parts. A bit ugly no matter what.
-            constructable_members[class_path].setup_anim_constr(self, part_structure)
+            constructable_members[class_path].setup_anim_constr(self, self._part_structure)
             assert self.image_filepath
 
+        yield
+
         # Restore AnimationConstructor GUI state
         # FIXME Want to remember scale and pos even when opening Jelly fresh?
+        kwargs = self._screen_state
         try:
             anim_const.animate_changes = False
             anim_const.scale = kwargs['scatter_scale']  # must set scale before pos, otherwise pos changes
@@ -153,6 +170,11 @@ class AnimationConstructorScreen(AppScreen):
         store = self.store
         part_name = self.part_name
 
+        if not ac.image_loaded:
+            # ControlPoints could not have been edited and vertices can't be calculated yet
+            Logger.debug('%s: save_state() image not loaded, store unchanged', self.__class__.__name__)
+            return
+
         # TODO Is this the appropriate place to hard-code this?
         # Probably refactor body part constructor GUI in reef game
         creature_constructors = store.creature_constructors
@@ -169,19 +191,24 @@ class AnimationConstructorScreen(AppScreen):
         # For example, will something modify MeshAnimator kwargs?
         # Would be cleaner and safer to have this GUI set those.
 
-        # For now KIS and just pull out tweaks and insert it again.
-        tweaks = None
+        # For now KIS and just pull out tweaks (and other preserved keys) and insert them again.
+        preserved_keys = getattr(constructor_class, 'preserved_structure_keys', ('tweaks',))
+        preserved = {}
         try:
-            tweaks = store[part_name][constructor_class.class_path]['tweaks']
+            old_structure = store[part_name][constructor_class.class_path]
         except KeyError:
-            # tweaks not set or class_path not set
-            pass
+            # class_path not set
+            old_structure = {}
+
+        for key in preserved_keys:
+            if key in old_structure:
+                preserved[key] = old_structure[key]
 
         store[part_name] = constructor_class.create_construction_structure(self)
-        if tweaks:
-            # Make sure this code didn't add tweaks, in which case merging is necessary
-            assert 'tweaks' not in store[part_name][constructor_class.class_path]
-            store[part_name][constructor_class.class_path]['tweaks'] = tweaks
+        for key, value in preserved.viewitems():
+            # Make sure this code didn't add key, in which case merging is necessary
+            assert key not in store[part_name][constructor_class.class_path]
+            store[part_name][constructor_class.class_path][key] = value
 
         Logger.debug('{}: save_state() "{}" {}'
                      .format(self.__class__.__name__, part_name, store[part_name]))
@@ -204,52 +231,180 @@ class JellyBellConstructorScreen(AnimationConstructorScreen):
         self.animation_steps = zip(('__setup__', 'open_bell', 'closed_bell'),
                                    ('Setup', 'Open bell', 'Closed bell'))
 
-class TentacleConstruction(Tentacle):
-    """Provide UI to drag tentacle around and scale it.
-    Calculates the circles on scale, etc TODO
-
-    Blend in Scatter? no rotate
-    Focus, which makes Scatter bigger, or enables? pulse?
+class TentacleConstruction(Scatter):
+    """Provide UI to drag a tentacle image around and scale it.
+    Coordinates are in the parent TentaclesLayout, which are the creature (bell) texture coordinates.
     """
 
+    image_filepath = StringProperty(None, allownone=True)
+    radius_spacing = NumericProperty(1.0)
+    selected = BooleanProperty(False)
+    # part instance name in the store, None if not saved yet
+    part_instance_name = StringProperty(None, allownone=True)
+
+    __events__ = ('on_select',)
+
+    def on_image_filepath(self, _, image_filepath):
+        image = self.ids.image
+        image.source = image_filepath
+        # Image loads synchronously, size to the natural image size
+        self.size = image.texture_size
+
+    def on_touch_down(self, touch):
+        if self.collide_point(*touch.pos):
+            self.dispatch('on_select')
+
+        return super(TentacleConstruction, self).on_touch_down(touch)
+
+    def on_select(self):
+        pass
+
+
 class TentaclesConstructorScreen(AppScreen):
     """UI for defining a bunch of Tentacle positions and scales.
-    Select part to anchor to.
-
+    Each tentacle is a part in the tentacles group (part_name), drawn over the creature's bell image.
 
     Drag out more tentacle copies, stretch
-    Trash drag button
     """
-    # Implementation?
-    # Just use Tentacle part
-    # Want to precalculate circles i think but the main issue is with scaling
-    # - When scaled, more bodies should be added, this can be calculated now and saved in structure for each
-    #copy
-
-    # So what can they share? just tweaks? Probelm is circle_spacing tweak modifies another parameter, not
-    # a simple tweak so need new code? Actually adjust tweak can do it...However, a part now needs more
-    # knowledge about its store...which I wanted to avoid.
-
     # Anchor choice
     # Fixed to creature, default
 
     ### Anchoring to bell ###
-    # Find closest two vertices in Mesh, in update interpolate between them and move Body
+    # TODO Find closest two vertices in Mesh, in update interpolate between them and move Body
 
-    def __init__(self, image_filename=None, part_name=None, creature_id=None):
+    state_attributes = ('creature_id', 'part_name')
 
-        # Again, we have this if not loading from structure, require image_filename
-        # Consolidate this code/pattern
+    selected = ObjectProperty(None, allownone=True)
 
-        store = load_jelly_storage(creature_id)
-        # May be an empty dictionary
-        part_structure = store[part_name]
+    def __init__(self, image_filepath=None, **kwargs):
+        self.creature_id = kwargs['creature_id']
+        # group instance name i.e. tentacles/0/
+        self.part_name = kwargs['part_name']
+        self.store = store = load_jelly_storage(self.creature_id)
 
+        # part instance names removed by the user, deleted from the store on save
+        self._removed_parts = []
 
+        super(TentaclesConstructorScreen, self).__init__(**kwargs)
 
+        layout = self.ids.tentacles_layout
 
+        # Bell image defines the texture coordinates tentacles are positioned in
+        bell_image_filepath = None
+        for name in store.creature_constructors:
+            if name in store:
+                bell_image_filepath = store[name].values()[0].get('image_filepath')
+                break
 
+        if bell_image_filepath:
+            bell_image = self.ids.bell_image
+            bell_image.source = bell_image_filepath
+            bell_image.size = layout.size = bell_image.texture_size
+
+        part_names = store.parts.get(self.part_name, [])
+        for part_instance_name in part_names:
+            if part_instance_name not in store:
+                continue
 
+            tentacle = self.add_tentacle()
+            tentacle.part_instance_name = part_instance_name
+            Tentacle.setup_tentacle_constr(tentacle, store[part_instance_name])
+
+        if not layout.tentacles:
+            # New group
+            if image_filepath is None:
+                raise AssertionError('tentacles group is empty, but not provided image_filepath!')
+
+            tentacle = self.add_tentacle(image_filepath)
+            # Hang from the middle of the bell
+            tentacle.center_x = layout.width / 2.0
+            tentacle.top = layout.height * 0.5
+
+        self.selected = layout.tentacles[-1]
+
+    def add_tentacle(self, image_filepath=None):
+        """Add a TentacleConstruction to the layout
+        :returns TentacleConstruction
+        """
+        tentacle = TentacleConstruction()
+        if image_filepath:
+            tentacle.image_filepath = image_filepath
+
+        tentacle.bind(on_select=self.on_tentacle_select)
+        self.ids.tentacles_layout.add_widget(tentacle)
+        return tentacle
+
+    def on_tentacle_select(self, tentacle):
+        self.selected = tentacle
+
+    def copy_selected(self):
+        """Add a copy of the selected tentacle next to it"""
+        selected = self.selected
+        if selected is None:
+            return
+
+        tentacle = self.add_tentacle(selected.image_filepath)
+        tentacle.radius_spacing = selected.radius_spacing
+        tentacle.scale = selected.scale
+        tentacle.pos = selected.x + selected.bbox[1][0], selected.y
+        self.selected = tentacle
+
+    def remove_selected(self):
+        selected = self.selected
+        layout = self.ids.tentacles_layout
+        if selected is None or len(layout.tentacles) < 2:
+            # Delete the whole group from JellyDesignScreen instead
+            return
+
+        if selected.part_instance_name:
+            self._removed_parts.append(selected.part_instance_name)
+
+        layout.remove_widget(selected)
+        self.selected = layout.tentacles[-1]
+
+    def on_selected(self, _, selected):
+        for tentacle in self.ids.tentacles_layout.tentacles:
+            tentacle.selected = tentacle is selected
+
+    def save_state(self):
+        store = self.store
+
+        for part_instance_name in self._removed_parts:
+            del store[part_instance_name]
+
+        self._removed_parts = []
+
+        for tentacle in self.ids.tentacles_layout.tentacles:
+            part_instance_name = tentacle.part_instance_name
+            if part_instance_name is None:
+                part_instance_name = tentacle.part_instance_name = store.add_part(self.part_name)
+
+            # Keep tweaks set by CreatureTweakScreen
+            tweaks = None
+            try:
+                tweaks = store[part_instance_name][Tentacle.class_path]['tweaks']
+            except KeyError:
+                pass
+
+            structure = Tentacle.create_construction_structure(tentacle)
+            if tweaks:
+                structure[Tentacle.class_path]['tweaks'] = tweaks
+
+            store[part_instance_name] = structure
+
+        Logger.debug('%s: save_state() "%s" %s', self.__class__.__name__, self.part_name,
+                     store.parts.get(self.part_name))
+
+        store.store_sync()
+
+
+class TentaclesLayout(Scatter):
+    """Contains the bell Image and TentacleConstructions in bell texture coordinates"""
+
+    @property
+    def tentacles(self):
+        """TentacleConstructions in the order they were added"""
+        return [w for w in reversed(self.children) if isinstance(w, TentacleConstruction)]
 
 
 # TODO maybe native linux selector and other OSes too
@@ -620,6 +775,7 @@ class CreatureTweakScreen(AppScreen):
 
         # Update structure in store
         tweaks[tweak_name] = value
+        self.creature_store.mark_changed()
 
         if self.creature:
             self.creature.adjust_part_tweak(part_name, tweak_name, value)
@@ -657,6 +813,7 @@ class CreatureTweakScreen(AppScreen):
 
         if self.creature:
             env.remove_creature(self.creature)
+            leak_tracker.schedule_check()
 
         creature_id = self.creature_id
         store = load_jelly_storage(creature_id)
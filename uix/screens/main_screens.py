@@ -10,12 +10,14 @@ from kivy.logger import Logger
 from kivy.properties import StringProperty, ObjectProperty
 from kivy.uix.popup import Popup
 
-from uix.elements import JellySelectButton
-from uix.environment import BasicEnvironment
+from uix.kv_loader import kv_loader
+from uix.screens import construction_kv, screen_cache
+from data import state_storage
 from data.state_storage import load_all_jellies, load_jelly_storage, delete_jelly, \
     construct_creature, new_jelly
-from visuals.creatures.jelly import Parts
+from visuals.creatures.parts import Parts
 from misc.util import not_none_keywords
+from misc.memory import leak_tracker
 
 class AppScreen(Screen):
     """Provides state capturing methods and calls destroy on child widgets with
@@ -23,8 +25,73 @@ class AppScreen(Screen):
 
     If Screens have state to manage and store themselves, they should do it in save_state()
     Screens should check the state they saved in the constructor.
+
+    cacheable screens are kept in the screen_cache after leaving (see MyJellyApp.open_screen),
+    calling suspend() and resume() on child widgets with those methods instead.
     """
 
+    # Whether open_screen may cache the screen. It's out of date when its jelly (the screen's creature_id,
+    # otherwise any jelly) was changed or deleted since construction.
+    cacheable = False
+    # Whether open_screen may prebuild the screen in idle frames (see likely_next). Prebuilt screens are
+    # constructed with defer_setup=True, then each of their setup_steps() runs in its own idle frame.
+    # Only screens whose __init__ is cheap, with expensive work in setup_steps(), should be prebuilt.
+    prebuild = False
+
+    def __init__(self, **kwargs):
+        # Set by open_screen when cacheable
+        self.cache_key = None
+        self.jelly_generations = dict(state_storage.jelly_generations)
+        # Whether start_setup() leaves the setup steps to next_setup_step() calls
+        self._defer_setup = kwargs.pop('defer_setup', False)
+        self._setup = None
+        super(AppScreen, self).__init__(**kwargs)
+
+    def setup_steps(self):
+        """Generator of the construction work after __init__, each step small enough for a frame.
+        Screens with steps call start_setup() at the end of __init__."""
+        return iter(())
+
+    def start_setup(self):
+        """Run setup_steps(), unless constructed with defer_setup=True"""
+        self._setup = self.setup_steps()
+        if not self._defer_setup:
+            self.finish_setup()
+
+    def next_setup_step(self):
+        """Run the next setup step
+        :returns whether steps remain"""
+        if self._setup is None:
+            return False
+
+        try:
+            next(self._setup)
+        except StopIteration:
+            self._setup = None
+            return False
+
+        return True
+
+    def finish_setup(self):
+        """Run the remaining setup steps (open_screen calls this before showing a prebuilt screen)"""
+        while self.next_setup_step():
+            pass
+
+    def is_stale(self):
+        current = state_storage.jelly_generations
+        creature_id = getattr(self, 'creature_id', None)
+        if creature_id:
+            return self.jelly_generations.get(creature_id) != current.get(creature_id)
+
+        return self.jelly_generations != current
+
+    def likely_next(self):
+        """:returns [(screen name, screen args), ...] of the screens likely opened next, most likely first.
+        open_screen prebuilds those with prebuild set. Default is the JellyDesignScreen of creature_id, if the screen has one.
+        """
+        creature_id = getattr(self, 'creature_id', None)
+        return [('JellyDesignScreen', {'creature_id': creature_id})] if creature_id else []
+
     def get_state(self):
         """Returns a dict of state_attributes that can be passed to the Screen's
         constructor to establish the same state in the future.
@@ -50,14 +117,36 @@ class AppScreen(Screen):
         if hasattr(self, 'save_state'):
             self.save_state()
 
+        if self.cache_key is not None:
+            self.suspend()
+            screen_cache.put(self.cache_key, self)
+            return
+
+        self.destroy()
+
+    def suspend(self):
+        for widget in self.walk(restrict=True):
+            if widget is not self and hasattr(widget, 'suspend'):
+                widget.suspend()
+
+    def resume(self):
+        """Called by open_screen when shown again from the cache"""
+        self.jelly_generations = dict(state_storage.jelly_generations)
+        for widget in self.walk(restrict=True):
+            if widget is not self and hasattr(widget, 'resume'):
+                widget.resume()
+
+    def destroy(self):
         # Check for widgets with destroy methods
         for widget in self.walk(restrict=True):
-            if hasattr(widget, 'destroy'):
+            if widget is not self and hasattr(widget, 'destroy'):
                 widget.destroy()
 
         # We always switch_to, which destroys old screens
         self.clear_widgets()
 
+        leak_tracker.schedule_check()
+
 def import_photo_then(title, obj, **kwargs):
     """Show Import photo UI, then open screen or call callback if image selected.
     :param callable or string function will be called with image_filepath argument. A string is assumed to
@@ -97,6 +186,8 @@ class ImportImagePopup(Popup):
         :param title: Text to display to user that provides context
         :param then: callable to call with selected image_filepath
         """
+        # Rules are in the construction KV, loaded when the first construction screen opened
+        kv_loader.load_file(construction_kv)
 
         super(ImportImagePopup, self).__init__(**kwargs)
         self.then = then
@@ -121,28 +212,40 @@ class JellyEnvironmentScreen(AppScreen):
     """
     # FIXME for now we're crazy and showing all Jellies
 
+    cacheable = True
+
+    # Number of each Jelly species
+    copies = 1
+
     def __init__(self, **kwargs):
         self.creatures = []
         super(JellyEnvironmentScreen, self).__init__(**kwargs)
 
-        self.creature_env = env = BasicEnvironment()
+        # Imported when first used, it imports cymunk
+        from uix.environment import BasicEnvironment
+
+        # Potentially many creatures, draw them batched
+        self.creature_env = env = BasicEnvironment(batch_rendering=True)
         env.bind(initialized=self.create_creatures)
         self.add_widget(env)
 
     def create_creatures(self, _, initialized):
         creature_env = self.creature_env
 
+        copies = self.copies
         jelly_num = 1
         for store in load_all_jellies():
-            # Number of each Jelly species
-            for x in range(1):
+            # Copies share their animation table and part geometry (see AnimationTable, PartGeometry)
+            # and pulse out of phase
+            for x in range(copies):
                 Logger.debug('Creating Jelly %s', store.creature_id)
                 # FIXME Random position code needs to verify width > margin
                 #pos = random.randint(110, self.width - 110), random.randint(110, self.height - 110)
                 pos = self.width/2.0, self.height/2.0
                 # angle = random.randint(-180, 180)
                 angle = 90
-                j = construct_creature(store, pos=pos, angle=angle, phy_group_num=jelly_num)
+                j = construct_creature(store, pos=pos, angle=angle, phy_group_num=jelly_num,
+                                       animation_phase=x / float(copies))
                 jelly_num += 1
                 # j.speed = random.uniform(0, 10.0)
                 # j.scale = random.uniform(0.75, 2.0)
@@ -155,6 +258,9 @@ class JellyEnvironmentScreen(AppScreen):
                 # self.add_widget(j)
                 creature_env.add_creature(j)
 
+    def likely_next(self):
+        return [('JellySelectionScreen', {})]
+
     # FIXME Did I bind App to this?
     def pause(self):
         Logger.debug('{}: pause() unscheduling update_simulation'.format(self.__class__.__name__))
@@ -171,14 +277,25 @@ class JellyEnvironmentScreen(AppScreen):
 class JellySelectionScreen(AppScreen):
     "Displays all user's Jellies and option to create new ones"
 
+    cacheable = True
+    # Buttons only, their images load asynchronously
+    prebuild = True
+
     def __init__(self, **kwargs):
         super(JellySelectionScreen, self).__init__(**kwargs)
 
         self.display_jellies(load_all_jellies())
 
+    def likely_next(self):
+        # The JellyDesignScreen for new_jelly() is prebuilt without a creature_id
+        return [('JellyEnvironmentScreen', {}), ('JellyDesignScreen', {'creature_id': None})]
+
     def display_jellies(self, jelly_stores):
         # TODO List adapter stuff
         # TODO StackLayout instead?
+        # Imported when first used, it imports cymunk
+        from uix.elements import JellySelectButton
+
         grid = self.ids.jelly_grid
         for jdata in jelly_stores:
             grid.add_widget(JellySelectButton(jdata))
@@ -186,7 +303,14 @@ class JellySelectionScreen(AppScreen):
     def new_jelly(self):
         """Create a new jelly and open the design screen.
         """
+        # Taken before new_jelly() changes the jelly generations
+        blank = screen_cache.take(screen_cache.key('JellyDesignScreen', {'creature_id': None}))
         creature_id = new_jelly()
+        if blank is not None:
+            # open_screen takes it like any prebuilt screen
+            blank.creature_id = creature_id
+            screen_cache.add_prebuilt(screen_cache.key('JellyDesignScreen', {'creature_id': creature_id}), blank)
+
         App.get_running_app().open_screen('JellyDesignScreen', creature_id=creature_id)
 
 
@@ -199,6 +323,10 @@ class JellyDesignScreen(AppScreen):
 
     state_attributes = ('creature_id',)
 
+    cacheable = True
+    # Buttons only
+    prebuild = True
+
     _screen_for_part = {
         Parts.jelly_bell: 'JellyBellConstructorScreen',
         Parts.gooey_body: 'AnimationConstructorScreen',
@@ -208,9 +336,14 @@ class JellyDesignScreen(AppScreen):
     group_parts = (Parts.tentacles_group, )
 
     def __init__(self, **kwargs):
+        # None when prebuilt for the next new jelly, which JellySelectionScreen.new_jelly sets
         self.creature_id = kwargs['creature_id']
         super(JellyDesignScreen, self).__init__(**kwargs)
 
+        if self.creature_id is None:
+            # A new jelly has no parts
+            return
+
         # Load list of existing parts
         # TODO in future cool visual part selection screen
         from kivy.uix.button import Button
@@ -221,6 +354,21 @@ class JellyDesignScreen(AppScreen):
             b.part_instance_name = part_instance_name
             self.parts_layout.add_widget(b)
 
+    def is_stale(self):
+        if self.creature_id is None:
+            # Shows no jelly yet
+            return False
+
+        return super(JellyDesignScreen, self).is_stale()
+
+    def likely_next(self):
+        # Constructors of the existing parts, as opened by open_part_constructor
+        store = load_jelly_storage(self.creature_id)
+        likely = [(self.screen_for_part(pin), {'creature_id': self.creature_id, 'part_name': pin})
+                  for pin in store.creature_constructors if pin in store or store.parts.get(pin)]
+        likely.append(('CreatureTweakScreen', {'creature_id': self.creature_id}))
+        return likely
+
     def screen_for_part(self, part_name):
         for name, screen_name in self._screen_for_part.viewitems():
             if part_name.startswith(name):
@@ -2,6 +2,7 @@ __author__ = 'awhite'
 
 from collections import namedtuple
 from array import array
+from weakref import WeakValueDictionary, WeakSet
 
 from kivy.clock import Clock
 from kivy.animation import Animation
@@ -10,8 +11,12 @@ from kivy.properties import NumericProperty, ObjectProperty
 from kivy.graphics import Mesh
 from kivy.utils import deprecated
 
-from misc.util import evaluate_thing, not_none_keywords
+from misc.util import evaluate_thing, not_none_keywords, UpperEnvelope
+from visuals.vertex_buffer import VertexBuffer
 from misc.exceptions import InsufficientData
+from misc.frame_governor import frame_governor
+from misc.profiling import profiler, timer
+from misc.tracing import probes
 
 # RelativeLayout or Scatter seems overcomplicated and causes issues
 # just do it myself, don't really need to add_widget()
@@ -22,6 +27,72 @@ setup_step='__setup__'
 
 VerticesState = namedtuple('VerticesState', 'vertices, duration, delay, horizontal_transition, vertical_transition')
 
+
+def fan_indices(num_perimeter):
+    """Mesh indices for triangle_fan vertices: centroid followed by num_perimeter vertices"""
+    indices = range(num_perimeter + 1)
+    indices.append(1)
+    return indices
+
+def decimate_fan_vertices(vertices, stride):
+    """Keep the centroid and every stride'th perimeter vertex of triangle_fan Mesh vertices
+    :returns new vertices list
+    """
+    decimated = list(vertices[:4])
+    for i in range(4, len(vertices), 4 * stride):
+        decimated.extend(vertices[i:i + 4])
+
+    return decimated
+
+
+class AnimationTable(object):
+    """Immutable geometry and steps of a MeshAnimator.
+    Equal tables are shared (see shared()), so copies of a Creature only hold their own animation state.
+    """
+
+    __slots__ = ('mesh_mode', 'initial_vertices', 'initial_indices', 'step_names', 'vertices_states',
+                 'lod_data', 'max_x_envelopes', '__weakref__')
+
+    # key() -> AnimationTable, while used by a MeshAnimator
+    _shared = WeakValueDictionary()
+
+    def __init__(self, mesh_mode, initial_vertices, initial_indices, step_names=(), vertices_states=()):
+        self.mesh_mode = mesh_mode
+        self.initial_vertices = tuple(initial_vertices)
+        self.initial_indices = tuple(initial_indices)
+        self.step_names = tuple(step_names)
+        self.vertices_states = tuple(vertices_states)
+        # Mapping of level > (initial_vertices, indices, [vertices for each step])
+        # calculated when first used
+        self.lod_data = {}
+        # (previous_step, step) or None (not animating) > UpperEnvelope of x by horizontal_fraction
+        self.max_x_envelopes = {}
+
+    def with_step(self, step_name, state):
+        """:returns new AnimationTable with the VerticesState added"""
+        return AnimationTable(self.mesh_mode, self.initial_vertices, self.initial_indices,
+                              self.step_names + (step_name,), self.vertices_states + (state,))
+
+    def key(self):
+        return self.mesh_mode, self.initial_vertices, self.initial_indices, self.step_names, self.vertices_states
+
+    @classmethod
+    def shared(cls, table):
+        """:returns the table in use equal to table, otherwise table, which is then shared"""
+        key = table.key()
+        try:
+            existing = cls._shared.get(key)
+        except TypeError:
+            # duration or delay that can't be compared (i.e. list)
+            return table
+
+        if existing is None:
+            cls._shared[key] = table
+            return table
+
+        return existing
+
+
 # TODO Need to serialize this into JellyData somehow
 class MeshAnimator(EventDispatcher):
     """Animates a Mesh's vertices from one set to another in a loop.
@@ -29,10 +100,10 @@ class MeshAnimator(EventDispatcher):
     """
 
     # This class shouldn't ever need dictionary functionality and is instantiated fairly often
-    __slots__ = ('step', 'step_names', 'mesh', 'mesh_mode', 'previous_step',
-                 'vertices_states', 'initial_vertices', 'initial_indices',
+    __slots__ = ('step', 'mesh', 'previous_step', 'table',
                  '_animation', '_start_animation_lambda',
-                 '_previous_step_vertices', '_next_step_vertices')
+                 '_previous_step_vertices', '_next_step_vertices',
+                 '_lod_level', 'vertex_buffer', 'mesh_indices')
 
     class_path = 'visuals.animations.MeshAnimator'
 
@@ -46,6 +117,15 @@ class MeshAnimator(EventDispatcher):
 
     mesh = ObjectProperty(None)
 
+    # Level of detail, every 2**lod perimeter vertex is animated (triangle_fan only)
+    lod = NumericProperty(0)
+
+    # Fewest perimeter vertices for a lower level of detail
+    min_lod_vertices = 6
+
+    # Live MeshAnimators, see _rebind_vertical_fraction()
+    _live = WeakSet()
+
     @not_none_keywords('steps', 'initial_vertices', 'initial_indices')
     def __init__(self, steps=None, mesh_mode='triangle_fan',
                  initial_vertices=None, initial_indices=None, **kwargs):
@@ -60,15 +140,18 @@ class MeshAnimator(EventDispatcher):
         canvas?
         """
 
-        self.step_names = []
-        self.vertices_states = []
         self.previous_step = 0
         self._animation = None
+        # VertexBuffer of mesh and the indices set on mesh, set in on_mesh
+        self.vertex_buffer = None
+        self.mesh_indices = None
+
+        # level of detail in use, may be less than lod if there are too few vertices
+        self._lod_level = 0
 
-        # will be set on mesh in on_mesh()
-        self.initial_vertices = initial_vertices
-        self.initial_indices = initial_indices
-        self.mesh_mode = str(mesh_mode)  # Mesh.mode refuses unicode
+        # initial vertices will be set on mesh in on_mesh()
+        # Mesh.mode refuses unicode
+        self.table = AnimationTable(str(mesh_mode), initial_vertices, initial_indices)
 
         # Needed to Clock schedule this function
         self._start_animation_lambda = lambda dt: self.start_animation()
@@ -79,6 +162,29 @@ class MeshAnimator(EventDispatcher):
             for step in steps:
                 self.add_step(**step)
 
+        # Share with other MeshAnimators of the same Creature store
+        self.table = AnimationTable.shared(self.table)
+        MeshAnimator._live.add(self)
+
+    @property
+    def mesh_mode(self):
+        return self.table.mesh_mode
+
+    @property
+    def initial_vertices(self):
+        return self.table.initial_vertices
+
+    @property
+    def initial_indices(self):
+        return self.table.initial_indices
+
+    @property
+    def step_names(self):
+        return self.table.step_names
+
+    @property
+    def vertices_states(self):
+        return self.table.vertices_states
 
     def add_step(self, step_name=None, vertices=None, duration=1.0, delay=None,
                      horizontal_transition='linear', vertical_transition='linear', uv_change=False):
@@ -94,8 +200,9 @@ class MeshAnimator(EventDispatcher):
         if num > 0 and len(self.vertices_states[0].vertices) != len(vertices):
             raise ValueError('Mismatched number of vertices: %d vs %d'%(num, len(vertices)))
 
-        self.step_names.append(step_name)
-        self.vertices_states.append(VerticesState(vertices, duration, delay, horizontal_transition, vertical_transition) )
+        # Table is immutable, replace it
+        state = VerticesState(tuple(vertices), duration, delay, horizontal_transition, vertical_transition)
+        self.table = self.table.with_step(step_name, state)
 
 
     # TODO Maybe remove if not used much
@@ -127,9 +234,9 @@ class MeshAnimator(EventDispatcher):
             prev = num_states - 1
 
         self.previous_step = prev
-        self._previous_step_vertices = self.vertices_states[prev].vertices
+        self._previous_step_vertices = self._step_vertices(prev)
         self.step = step
-        self._next_step_vertices = self.vertices_states[step].vertices
+        self._next_step_vertices = self._step_vertices(step)
 
         state = self.vertices_states[self.step]
         dur = evaluate_thing(state.duration)
@@ -141,12 +248,20 @@ class MeshAnimator(EventDispatcher):
         # Go from 0 to 1 each time, try saving Animation
         # PERF try keeping Animation instance, need to change transition/duration each time
         a = Animation(horizontal_fraction=1.0, transition=state.horizontal_transition, duration=dur)
-        a &= Animation(vertical_fraction=1.0, transition=state.vertical_transition, duration=dur, step=1/30.0)
+        a &= Animation(vertical_fraction=1.0, transition=state.vertical_transition, duration=dur,
+                       step=frame_governor.animation_step)
         a.bind(on_complete=self.on_animation_complete)
         self._animation = a
         a.start(self)
 
+    def start_animation_delayed(self, delay):
+        """start_animation() after delay seconds"""
+        Clock.schedule_once(self._start_animation_lambda, delay)
+
     def stop_animation(self):
+        # Delayed start
+        Clock.unschedule(self._start_animation_lambda)
+
         if not self._animation:
             return
 
@@ -154,8 +269,6 @@ class MeshAnimator(EventDispatcher):
         self._animation.cancel(self)
         self._animation = None
 
-        # FIXME Clock.unschedule start_lambda?
-
 
     def on_animation_complete(self, anim, widget):
         # Delay after current step
@@ -176,14 +289,16 @@ class MeshAnimator(EventDispatcher):
 
         # Do all work in one event function for efficency (horizontal should have been updated before this because of creation order.
         # TODO: Measure performance. Numpy math? Kivy Matrix math?
+        if profiler.enabled:
+            start = timer()
 
         horiz = self.horizontal_fraction
 
         in_verts = self._previous_step_vertices
         out_verts = self._next_step_vertices
 
-        mesh = self.mesh
-        verts = mesh.vertices
+        vertex_buffer = self.vertex_buffer
+        verts = vertex_buffer.data
         # Skip central point, Go through by 4's
         # Vertex lists conform to Mesh.vertices
         # Perf: NumyPy able to calculate faster?
@@ -195,16 +310,97 @@ class MeshAnimator(EventDispatcher):
             verts[x] = x_coord
             verts[y] = y_coord
 
-        mesh.vertices = verts
+        vertex_buffer.mark_dirty()
+
+        if profiler.enabled:
+            profiler.record('mesh_animator.interpolate', timer() - start)
 
     def on_mesh(self, _, mesh):
         # TODO float or double array?
         # FIXME array doesn't seem to make a difference, posted about it
         #mesh.vertices = array('f', self.initial_vertices)
-        mesh.vertices = self.initial_vertices
-        mesh.indices = self.initial_indices
+        if self._lod_level:
+            initial_vertices, indices, _ = self._get_lod_data(self._lod_level)
+        else:
+            initial_vertices = self.initial_vertices
+            indices = self.initial_indices
+
+        # vertex_buffer may be set to the mesh's existing VertexBuffer before setting mesh, to share it
+        if self.vertex_buffer is None or self.vertex_buffer.mesh is not mesh:
+            self.vertex_buffer = VertexBuffer(mesh, initial_vertices)
+        else:
+            self.vertex_buffer.replace(initial_vertices)
+
+        self.mesh_indices = indices
+        mesh.indices = indices
+
         mesh.mode = self.mesh_mode
 
+    def _step_vertices(self, step):
+        """vertices of step at the current level of detail"""
+        if self._lod_level:
+            return self._get_lod_data(self._lod_level)[2][step]
+
+        return self.vertices_states[step].vertices
+
+    def _get_lod_data(self, level):
+        lod_data = self.table.lod_data
+        try:
+            return lod_data[level]
+        except KeyError:
+            pass
+
+        stride = 2 ** level
+        initial_vertices = decimate_fan_vertices(self.initial_vertices, stride)
+        data = (initial_vertices, fan_indices(len(initial_vertices) // 4 - 1),
+                [decimate_fan_vertices(state.vertices, stride) for state in self.vertices_states])
+        lod_data[level] = data
+        return data
+
+    def max_x(self):
+        """Largest x of the (full detail) vertices at the current horizontal_fraction.
+        x of each vertex is linear in horizontal_fraction, so the maximum is precomputed as an envelope
+        for each pair of steps instead of checking every vertex.
+        """
+        key = (self.previous_step, self.step) if self._animation else None
+        envelopes = self.table.max_x_envelopes
+        envelope = envelopes.get(key)
+        if envelope is None:
+            if key is None:
+                verts = self.initial_vertices
+                lines = [(0.0, verts[x]) for x in range(0, len(verts), 4)]
+            else:
+                in_verts = self.vertices_states[key[0]].vertices
+                out_verts = self.vertices_states[key[1]].vertices
+                lines = [(out_verts[x] - in_verts[x], in_verts[x]) for x in range(0, len(in_verts), 4)]
+
+            envelope = envelopes[key] = UpperEnvelope(lines)
+
+        return envelope(self.horizontal_fraction)
+
+    def on_lod(self, _, lod):
+        level = 0
+        if self.mesh_mode == 'triangle_fan':
+            num_perimeter = len(self.initial_vertices) // 4 - 1
+            while level < lod and num_perimeter // 2 ** (level + 1) >= self.min_lod_vertices:
+                level += 1
+
+        if level == self._lod_level:
+            return
+
+        self._lod_level = level
+        mesh = self.mesh
+        if mesh is None:
+            return
+
+        # Sets vertices (including u, v) of the level
+        self.on_mesh(self, mesh)
+
+        if self._animation:
+            self._previous_step_vertices = self._step_vertices(self.previous_step)
+            self._next_step_vertices = self._step_vertices(self.step)
+            self.on_vertical_fraction(self, self.vertical_fraction)
+
     def check_sufficient_data(self):
         """Check if there is sufficient data to render the Mesh"""
         if len(self.initial_vertices) == 0:
@@ -244,6 +440,19 @@ class MeshAnimator(EventDispatcher):
         return a
 
 
+    @staticmethod
+    def _rebind_vertical_fraction(old, new):
+        """Kivy bound on_vertical_fraction when each MeshAnimator was created,
+        replace it on the live ones (i.e. when its probe is toggled)"""
+        for animator in list(MeshAnimator._live):
+            animator.unbind(vertical_fraction=old.__get__(animator, MeshAnimator))
+            animator.bind(vertical_fraction=new.__get__(animator, MeshAnimator))
+
+
+probes.register('mesh_animator.vertical_fraction', MeshAnimator, 'on_vertical_fraction',
+                rebind=MeshAnimator._rebind_vertical_fraction)
+
+
 # Issues:
 # Idea: Currently, ControlPoints scale with Scatter, could reverse/reduce this with an opposite Scale maybe.
 # ScatterPlane works by changing collide_point,
@@ -0,0 +1,224 @@
+__author__ = 'awhite'
+
+from array import array
+from math import radians, sin, cos
+
+from kivy.graphics import Color, Mesh
+from kivy.graphics.instructions import InstructionGroup
+
+
+def triangulate(indices, mode):
+    """Convert indices of a triangle_fan, triangle_strip or triangles Mesh to triangles indices"""
+    if mode == 'triangles':
+        return list(indices)
+
+    triangles = []
+    if mode == 'triangle_fan':
+        center = indices[0]
+        for i in range(1, len(indices) - 1):
+            triangles.extend((center, indices[i], indices[i + 1]))
+
+    elif mode == 'triangle_strip':
+        for i in range(len(indices) - 2):
+            triangles.extend((indices[i], indices[i + 1], indices[i + 2]))
+
+    else:
+        raise ValueError('Unsupported mesh mode: {}'.format(mode))
+
+    return triangles
+
+
+class BatchRenderer(object):
+    """Draws the meshes of many Creatures with one Mesh per texture.
+
+    Every frame the vertices of each Creature's meshes (Creature.batch_meshes()) are
+    transformed into environment coordinates and merged, instead of each Creature
+    drawing its own transforms and meshes. The Creatures' own canvases must not be drawn otherwise.
+    Only meshes with an offset are transformed, and only when the Creature moved or their vertices changed.
+    The batch vertices and indices are kept between frames, indices are only rebuilt when
+    meshes are added, removed, resized or change texture.
+
+    Meshes of the same texture are drawn in order; different textures are drawn in the order
+    they're first seen. So where Creatures overlap, the parts of one may be drawn over the parts of another
+    (i.e. all tentacles under all bells), unlike drawing each Creature's canvas in turn.
+
+    Creatures with debug_visuals are not batched, their own canvas is drawn after the batches.
+    """
+
+    # Mesh indices are unsigned short
+    max_vertices = 65535
+
+    def __init__(self, canvas):
+        self.creatures = []
+        self._canvas = canvas
+
+        self._group = InstructionGroup()
+        self._group.add(Color(1, 1, 1, 1))
+        canvas.add(self._group)
+
+        # Mesh instructions in use, re-used between frames
+        self._meshes = []
+        # (id(indices), mode) -> (indices, triangles indices)
+        # indices is kept so the id can't be reused
+        self._triangles = {}
+
+        # (vertex buffer, indices, number of vertices, texture) of each mesh when the batches were built
+        self._layout = None
+        # [texture, vertices, indices] of each batch Mesh
+        self._batches = []
+        # (batch, first float in the batch vertices) of each mesh in _layout
+        self._slots = []
+        # id(VertexBuffer) -> [VertexBuffer, transform, version, transformed vertices] of meshes with an offset
+        self._transformed = {}
+
+    def add(self, creature):
+        self.creatures.append(creature)
+        if creature.debug_visuals:
+            # Debug visuals are drawn by the Creature's canvas
+            self._canvas.add(creature.canvas)
+            return
+
+        for vertex_buffer, _, _ in creature.batch_meshes():
+            vertex_buffer.upload = False
+
+    def remove(self, creature):
+        self.creatures.remove(creature)
+        if creature.debug_visuals:
+            self._canvas.remove(creature.canvas)
+            return
+
+        for vertex_buffer, _, _ in creature.batch_meshes():
+            self._transformed.pop(id(vertex_buffer), None)
+            vertex_buffer.upload = True
+            vertex_buffer.replace(vertex_buffer.data)
+
+    def clear(self):
+        for creature in self.creatures[:]:
+            self.remove(creature)
+
+        self._triangles.clear()
+        self._transformed.clear()
+        self.update()
+
+    def _triangles_of(self, indices, mode):
+        key = (id(indices), mode)
+        cached = self._triangles.get(key)
+        if cached is None or cached[0] is not indices:
+            cached = self._triangles[key] = (indices, triangulate(indices, mode))
+
+        return cached[1]
+
+    def update(self):
+        """Merge the current vertices of all Creatures, call once per frame after updating the Creatures"""
+        # (creature, vertex buffer, indices, offset) of the meshes to draw
+        meshes = []
+        layout = []
+        for creature in self.creatures:
+            if creature.debug_visuals:
+                continue
+
+            for vertex_buffer, indices, offset in creature.batch_meshes():
+                texture = vertex_buffer.mesh.texture
+                if texture is None:
+                    # not loaded yet
+                    continue
+
+                meshes.append((creature, vertex_buffer, indices, offset))
+                layout.append((vertex_buffer, indices, len(vertex_buffer.data), texture))
+
+        if layout != self._layout:
+            # Meshes added, removed, resized or textured, indices only change here
+            self._build_batches(layout)
+
+        # Vertices are written in place, the batch Meshes upload them
+        for (creature, vertex_buffer, indices, offset), (batch, start) in zip(meshes, self._slots):
+            src = vertex_buffer.data
+            if offset is not None:
+                src = self._transform(creature, vertex_buffer, offset)
+
+            batch[1][start:start + len(src)] = src
+
+        for mesh, (_, verts, _) in zip(self._meshes, self._batches):
+            mesh.vertices = verts
+
+    def _build_batches(self, layout):
+        """Lay out the meshes in batches by texture and update the batch Meshes' indices"""
+        self._layout = layout
+        max_vertices = self.max_vertices
+        # texture -> list of [texture, vertices, indices], new batch when max_vertices reached
+        texture_batches = {}
+        textures = []
+        slots = self._slots = []
+
+        for vertex_buffer, indices, size, texture in layout:
+            batches = texture_batches.get(texture)
+            if batches is None:
+                batches = texture_batches[texture] = [[texture, array('f'), []]]
+                textures.append(texture)
+
+            batch = batches[-1]
+            base = len(batch[1]) // 4
+            if base + size // 4 > max_vertices:
+                batch = [texture, array('f'), []]
+                batches.append(batch)
+                base = 0
+
+            slots.append((batch, base * 4))
+            batch[1].extend(vertex_buffer.data)
+            batch[2].extend([i + base for i in self._triangles_of(indices, vertex_buffer.mesh.mode)])
+
+        self._batches = [batch for texture in textures for batch in texture_batches[texture]]
+
+        meshes = self._meshes
+        group = self._group
+        for num, (texture, _, indices) in enumerate(self._batches):
+            if num < len(meshes):
+                mesh = meshes[num]
+            else:
+                mesh = Mesh(mode='triangles')
+                meshes.append(mesh)
+                group.add(mesh)
+
+            mesh.indices = indices
+            mesh.texture = texture
+
+        # Remove meshes no longer needed
+        num = len(self._batches)
+        for mesh in meshes[num:]:
+            group.remove(mesh)
+
+        del meshes[num:]
+
+    def _transform(self, creature, vertex_buffer, offset):
+        """:returns vertices translated by offset and transformed by Creature.draw_transform(),
+        only re-calculated when the Creature moved or the vertices changed"""
+        transform = creature.draw_transform()
+        cached = self._transformed.get(id(vertex_buffer))
+        if cached is not None and cached[0] is vertex_buffer \
+                and cached[1] == transform and cached[2] == vertex_buffer.version:
+            return cached[3]
+
+        src = vertex_buffer.data
+        # u, v are copied as is
+        out = array('f', src)
+        a, b, c, d, tx, ty = transform
+        ox, oy = offset
+        for i in range(0, len(src), 4):
+            x = src[i] + ox
+            y = src[i + 1] + oy
+            out[i] = a * x + b * y + tx
+            out[i + 1] = c * x + d * y + ty
+
+        self._transformed[id(vertex_buffer)] = [vertex_buffer, transform, vertex_buffer.version, out]
+        return out
+
+
+def rotate_scale_translate(angle, scale, pos):
+    """Affine transform (a, b, c, d, tx, ty) of Scale(scale), Translate(pos), Rotate(angle degrees)
+    x' = a*x + b*y + tx
+    y' = c*x + d*y + ty
+    """
+    angle = radians(angle)
+    cos_s = cos(angle) * scale
+    sin_s = sin(angle) * scale
+    return cos_s, -sin_s, sin_s, cos_s, pos[0] * scale, pos[1] * scale
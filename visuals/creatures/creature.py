@@ -14,6 +14,13 @@ import cymunk as phy
 from cymunk import Vec2d
 
 from misc.util import not_none_keywords
+from misc.physics_util import apply_drag
+from visuals.batch_renderer import rotate_scale_translate
+from misc.frame_governor import frame_governor
+from misc.profiling import profiler, timer
+from misc.tracing import probes
+from misc.memory import leak_tracker
+from misc.recording import recorder
 
 
 def fix_angle(angle):
@@ -48,6 +55,16 @@ class Creature(EventDispatcher):
 
     mass = NumericProperty(1.0e6)
 
+    # Level of detail, 0 is full detail. Body parts and animations bind to this.
+    lod = NumericProperty(0)
+
+    # Projected radius (pixels) below which each successive level of detail is used
+    lod_radii = (dp(48), dp(20))
+
+    # Physics step the per-update impulses (i.e. drag tweaks) were tuned for.
+    # Longer steps scale them by step_scale, so the impulse per second stays the same.
+    reference_interval = 1 / 60.0
+
     @not_none_keywords('creature_id', 'part_name')
     def __init__(self, creature_id=None, part_name=None, tweaks=None, debug_visuals=False, **kwargs):
 
@@ -55,6 +72,8 @@ class Creature(EventDispatcher):
 
         self.creature_id = creature_id
         self.part_name = part_name
+        # Profiler section of update()
+        self.update_section = 'creature.{}.update'.format(creature_id)
 
         # All creatures will have a tweaks dictionary of various values that
         # change behaviour
@@ -87,10 +106,20 @@ class Creature(EventDispatcher):
         self.orienting_angle = 0
         self.orienting_throttle = 1.0
 
+        # Updates counted for FrameGovernor.drag_interval
+        # drag_multiplier is 0 when drag is skipped this update, body parts use it too
+        self._drag_tick = 0
+        self.drag_multiplier = 1
+        # Environment update_interval / reference_interval, set each update
+        self.step_scale = 1.0
+
         # TODO just use a incrementing global for all creatures?
         self.phy_group_num = kwargs.get('phy_group_num', 1)
 
         self.environment_wref = None
+        # Scale from the environment to window pixels, set by the environment
+        self._view_scale = 1.0
+
         # mass and moment will be updated after subclass draws
         self.phy_body = body = phy.Body(1, 1)
         self.phy_body.velocity_limit = 1000  # TODO units?
@@ -164,6 +193,35 @@ class Creature(EventDispatcher):
     def scale(self, scale):
         # TODO what does z do for 2D?
         self._scale.xyz = (scale, scale, 1.0)
+        self.update_lod()
+
+    @property
+    def view_scale(self):
+        """Scale from the environment to window pixels (i.e. zoom of a Scatter containing it)"""
+        return self._view_scale
+
+    @view_scale.setter
+    def view_scale(self, view_scale):
+        self._view_scale = view_scale
+        self.update_lod()
+
+    def projected_radius(self):
+        """Approximate radius in pixels the Creature covers on screen"""
+        return self.phy_shape.radius * self.scale * self._view_scale
+
+    def update_lod(self):
+        """Set lod from the projected size"""
+        if not hasattr(self, 'phy_shape'):
+            return
+
+        radius = self.projected_radius()
+        lod = 0
+        for lod_radius in self.lod_radii:
+            if radius >= lod_radius:
+                break
+            lod += 1
+
+        self.lod = lod
 
     def on_mass(self, o, mass):
         self.phy_body.mass = mass
@@ -187,8 +245,18 @@ class Creature(EventDispatcher):
                 Logger.warning('Creature environment_wref weakref is None, not binding body part to space')
 
             else:
-                part.bind_physics_space(env.phy_space)
+                part.bind_physics_space(env.phy_registry)
+
+
+    def phy_objects(self):
+        """generator of all physics objects of the Creature and its body parts"""
+        yield self.phy_body
+        if hasattr(self, 'phy_shape'):
+            yield self.phy_shape
 
+        for bp in self.body_parts:
+            for o in bp.phy_objects():
+                yield o
 
     def bind_environment(self, environment):
         """Attach to the given environment and its physics space.
@@ -196,22 +264,18 @@ class Creature(EventDispatcher):
 
         Required environment attributes
         - phy_space -- cymunk Space
+        - phy_registry -- PhysicsRegistry of phy_space
         """
 
         # Not planning on moving Creatures between environments
         assert self.environment_wref is None
-        space = environment.phy_space
 
         # Cannot create weakref to space
         # Create a weakref to make sure avoid circular GC
         self.environment_wref = weakref_ref(environment)
 
-        space.add(self.phy_body)  # add physical objects to simulated space
-        if hasattr(self, 'phy_shape'):
-            space.add(self.phy_shape)
-
-        for bp in self.body_parts:
-            bp.bind_physics_space(space)
+        # add physical objects to simulated space
+        environment.phy_registry.add(self.phy_objects())
 
     def unbind_environment(self):
         """Remove all of the Creature's physics objects from the physics space
@@ -221,19 +285,21 @@ class Creature(EventDispatcher):
             Logger.warning("%s.unbind_environment called but env weakref None", self.__class__.__name__)
             return
 
-        space = env.phy_space
+        env.phy_registry.remove(self.phy_objects())
 
-        for bp in self.body_parts:
-            bp.unbind_physics_space(space)
+    def suspend(self):
+        """Stop animating while the environment isn't shown, until resume()
+        (subclasses override)"""
+        pass
 
-        space.remove(self.phy_body)
-        if hasattr(self, 'phy_shape'):
-            space.remove(self.phy_shape)
+    def resume(self):
+        pass
 
     def destroy(self):
         """unbind from the environment and stop all clocks and other activities
         """
         self.unbind_environment()
+        leak_tracker.track(self, '{} {}'.format(self.__class__.__name__, self.creature_id))
         # (subclasses will override this to do more)
 
     def draw(self):
@@ -283,10 +349,27 @@ class Creature(EventDispatcher):
             PopMatrix()
             PopState()
 
+    def draw_transform(self):
+        """Affine transform (a, b, c, d, tx, ty) of the Scale, Translate and Rotate
+        as currently drawn by the canvas"""
+        return rotate_scale_translate(self._rotate.angle, self._scale.x, self._translate.xy)
+
+    def batch_meshes(self):
+        """generator of (VertexBuffer, indices, offset) of the meshes to draw with BatchRenderer, in drawing order.
+        offset None: vertices are in environment coordinates,
+        otherwise vertices are translated by offset then drawn with draw_transform()
+        """
+        for bp in self.body_parts:
+            for m in bp.batch_meshes():
+                yield m
+
     def orient(self, angle, throttle=1.0):
         """Orient the Creature toward the angle, using body motion
         throttle 0.0 to 1.0 for how quickly to rotate
         """
+        if recorder.recording:
+            recorder.orient(self, angle, throttle)
+
         if angle is None:
             self.orienting = False
             if self.debug_visuals:
@@ -312,11 +395,18 @@ class Creature(EventDispatcher):
         # 1. Apply forces to body
         # TODO drag, continuous force? how to update instead of adding new, just reset? look at arrows example
 
-        drag_const = self.tweaks['drag_constant']  # drag coeficcent * density of fluid
-        # TODO cos/sine of angle?
-        drag_force = body.velocity.rotated_degrees(180) * (body.velocity.get_length_sqrd() * self.cross_area * drag_const)
-        # TODO limit force here as in Gooey drag?
-        self.phy_body.apply_impulse(drag_force)
+        env = self.environment_wref() if self.environment_wref else None
+        self.step_scale = step_scale = env.update_interval / self.reference_interval if env is not None else 1.0
+
+        # Drag is applied every drag_interval updates, multiplied to match (apply_drag never reverses velocity)
+        drag_interval = frame_governor.drag_interval
+        self._drag_tick += 1
+        self.drag_multiplier = drag_interval * step_scale if self._drag_tick % drag_interval == 0 else 0
+
+        if self.drag_multiplier:
+            # drag coeficcent * density of fluid
+            # TODO cos/sine of angle?
+            apply_drag(body, self.tweaks['drag_constant'] * self.cross_area, self.drag_multiplier)
 
         # Update visual position and rotation with information from physics Body
 
@@ -325,8 +415,15 @@ class Creature(EventDispatcher):
         self._rotate.angle = degrees(body.angle) - 90 # adjust orientation graphics
 
         # Update body parts
-        for bp in self.body_parts:
-            bp.update()
+        if profiler.enabled:
+            for bp in self.body_parts:
+                start = timer()
+                bp.update()
+                profiler.record('part.{}.update'.format(bp.__class__.__name__), timer() - start)
+
+        else:
+            for bp in self.body_parts:
+                bp.update()
 
 
         # Check if in bounds, wrap to other side if out
@@ -367,6 +464,9 @@ class Creature(EventDispatcher):
         # update_creature()
 
     def adjust_part_tweak(self, part_name, tweak_name, value):
+        if recorder.recording:
+            recorder.tweak(self, part_name, tweak_name, value)
+
         if self.part_name == part_name:
             part = self
         else:
@@ -404,15 +504,18 @@ class CreatureBodyPart(EventDispatcher):
         self.creature = creature
         self.part_name = part_name
 
-    def bind_physics_space(self, space):
+    def bind_physics_space(self, registry):
         """Add all physics objects this body part created to the physics space
+        :param registry: PhysicsRegistry of the space
         """
-        for o in self.phy_objects():
-            space.add(o)
+        registry.add(self.phy_objects())
+
+    def unbind_physics_space(self, registry):
+        registry.remove(self.phy_objects())
 
-    def unbind_physics_space(self, space):
-        for o in reversed(tuple(self.phy_objects())):
-            space.remove(o)
+    def batch_meshes(self):
+        """See Creature.batch_meshes()"""
+        return iter(())
 
     def translate(self, translation_vector):
         for body in self.phy_objects(body_only=True):
@@ -423,3 +526,6 @@ class CreatureBodyPart(EventDispatcher):
 
     def adjust_tweak(self, name, value):
         self.tweaks[name] = value
+
+
+probes.register('creature.update', Creature, 'update', subclasses=True)
@@ -7,42 +7,75 @@ import gettext
 _ = gettext.lgettext
 
 import random
-from math import cos, sin, radians, degrees, pi
+from bisect import bisect_right
+from weakref import WeakValueDictionary, WeakSet
+from math import cos, sin, radians, degrees, pi, sqrt
 from collections import namedtuple, OrderedDict, Iterable
 
 from kivy.logger import Logger
 from kivy.graphics import Color, Translate, PushMatrix, PopMatrix, \
     Mesh, Ellipse, Line, Rectangle
-from kivy.core.image import Image as CoreImage
 from kivy.clock import Clock
 from kivy.event import EventDispatcher
-from kivy.properties import BoundedNumericProperty
+from kivy.properties import BoundedNumericProperty, NumericProperty
 from kivy.metrics import dp, mm
 
 from cymunk import Vec2d, DampedSpring, PinJoint, Body, Circle, moment_for_circle
 
-from visuals.animations import MeshAnimator, setup_step
+from visuals.animations import MeshAnimator, setup_step, fan_indices
+from visuals.vertex_buffer import VertexBuffer
 from misc.exceptions import InsufficientData
 from misc.util import not_none_keywords
-from misc.physics_util import world_pos_of_offset, offset_to_pos
+from misc.physics_util import world_pos_of_offset, offset_to_pos, apply_drag
+from misc.image_util import cached_circle_layout, load_texture_async
+from misc.spatial import KDTree
+from misc.soft_body import SoftBody
+from misc.frame_governor import frame_governor
+from misc.tracing import probes
+from misc.memory import leak_tracker
+from data.state_storage import load_layout_cache_storage
 from .creature import Creature, CreatureBodyPart
+from .parts import Parts
 
-ChainNode = namedtuple('ChainNode', ['shape', 'body', 'ellipse', 'perimeter_spring', 'internal_springs'])
+# With the soft_body physics_engine, body is the SoftBody node index, springs are SoftBody spring indices
+# and shape is None
+ChainNode = namedtuple('ChainNode', ['shape', 'body', 'ellipse', 'perimeter_spring', 'internal_springs', 'radius'])
 # Fields that may be None and are physics objects
 optional_chain_node_physics_fields = ('shape', 'perimeter_spring', 'internal_springs')
 
 # could do constraints dict, but just put min, max in tuple for simplicity
 TweakMeta = namedtuple('TweakInfo', 'title desc type ui min max')
 
+# Fewest perimeter nodes for a lower level of detail GooeyBodyPart
+MIN_LOD_PERIMETER_NODES = 6
+
 # Doesn't seem to have effect regardless of value, don't think this applies to springs, only hard connections
 SPRING_MAX_FORCE = 1e6
 # TODO max_bias?
 
-class Parts(object):
-    """List of typical part names to avoid typos in code"""
-    jelly_bell = 'jelly_bell'
-    gooey_body = 'gooey_body'
-    tentacles_group = 'tentacles/'
+
+class PartGeometry(object):
+    """Immutable geometry of a body part, calculated from its construction structure.
+    Equal geometries are shared (see shared()), so copies of a Creature only hold their own
+    physics objects and vertices.
+    """
+
+    # key -> PartGeometry, while used by a body part
+    _shared = WeakValueDictionary()
+
+    def __init__(self, **attributes):
+        self.__dict__.update(attributes)
+
+    @classmethod
+    def shared(cls, key, compute):
+        """:param key: hashable, equal for parts with equal geometry
+        :param compute: called when no geometry is in use for key, returns dict of the attributes
+        :returns PartGeometry"""
+        geometry = cls._shared.get(key)
+        if geometry is None:
+            geometry = cls._shared[key] = cls(**compute())
+
+        return geometry
 
 # TODO PhysicsVisual baseclass?
 class GooeyBodyPart(CreatureBodyPart):
@@ -60,7 +93,9 @@ class GooeyBodyPart(CreatureBodyPart):
         'outer_spring_damping': 15,
         'internal_spring_stiffness': 50,
         'internal_spring_damping': 15,
-        'drag_constant': 1e-6
+        'drag_constant': 1e-6,
+        # one of physics_engines
+        'physics_engine': 'cymunk'
     }
 
     # Used to generate gui
@@ -95,6 +130,15 @@ class GooeyBodyPart(CreatureBodyPart):
 
     mass = BoundedNumericProperty(1.0, min=1.0)
 
+    # Values for the physics_engine tweak
+    # cymunk: Body, Shape and Constraints added to the cymunk Space
+    # soft_body: nodes and springs simulated by SoftBody, coupled to the creature through the pins and
+    # center springs. Nodes do not collide and no cymunk objects are created for them.
+    physics_engines = ('cymunk', 'soft_body')
+
+    # Structure kwargs not set by create_construction_structure that construction screens keep
+    preserved_structure_keys = ('tweaks', 'physics_engine')
+
     @staticmethod
     def create_construction_structure(anim_constr_screen):
         anim_constr = anim_constr_screen.ids.animation_constructor
@@ -125,10 +169,16 @@ class GooeyBodyPart(CreatureBodyPart):
 
     @not_none_keywords('image_filepath', 'vertices', 'indices')
     def __init__(self, image_filepath=None, mesh_mode='triangle_fan',
-                 vertices=None, indices=None, **kwargs):
+                 vertices=None, indices=None, physics_engine=None, **kwargs):
+        """physics_engine: used if the physics_engine tweak is not set (stores from before it was a tweak)"""
 
         num_vertices = len(vertices)
 
+        if physics_engine is not None:
+            if kwargs.get('tweaks') is None:
+                kwargs['tweaks'] = {}
+            kwargs['tweaks'].setdefault('physics_engine', physics_engine)
+
         if num_vertices < 3:
             raise InsufficientData('Less than 3 vertices')
         if len(indices) < 3:
@@ -137,8 +187,13 @@ class GooeyBodyPart(CreatureBodyPart):
         super(GooeyBodyPart, self).__init__(**kwargs)
         tweaks = self.tweaks
 
-        # Mapping of ChainNode bodies to their natural distance from creature.pos
-        self.__body_distance = {}
+        physics_engine = tweaks['physics_engine']
+        if physics_engine not in self.physics_engines:
+            raise ValueError('Unknown physics_engine {}'.format(physics_engine))
+
+        # Per level of detail:
+        # _node_distance: Mapping of ChainNode bodies to their natural distance from creature.pos
+        # soft_body: SoftBody if physics_engine is soft_body
 
         mesh_mode = str(mesh_mode)  # Mesh.mode does not support unicode
         if mesh_mode != 'triangle_fan':
@@ -149,49 +204,166 @@ class GooeyBodyPart(CreatureBodyPart):
         self.jelly = creature = self.creature
 
         creature_phy_body = creature.phy_body
-        debug_visuals = creature.debug_visuals
+
+        # Mass
+        # TODO make fraction of bell a tweak
+        tentacles_total_mass = tweaks['mass_fraction'] * creature_phy_body.mass
+
+        # Positions relative to the creature body don't depend on where this copy is,
+        # copies constructed from the same store share them
+        self.geometry = geometry = PartGeometry.shared(
+            (GooeyBodyPart.class_path, tuple(vertices), creature.centering_trans_x, creature.centering_trans_y,
+             len(creature.lod_radii)),
+            lambda: self._compute_geometry(vertices))
+
+        ### Levels of detail ###
+        # Each level has its own chains with every 2**level perimeter vertex
+        # Only the active level is in the physics space. Levels are built when first used,
+        # from positions relative to the creature body so they're built where the creature is then.
+        self._num_perimeter = len(geometry.offsets)
+        self._physics_engine = physics_engine
+
+        self._levels = [None] * len(geometry.levels)
+        self._level = None
+        self._activate_level(min(creature.lod, len(self._levels) - 1))
+
+        creature.bind(mass=self.on_creature_mass, lod=self.on_creature_lod)
+        self.bind(mass=self.on_mass_changed)
+        self.mass = tentacles_total_mass
+
+        ### Setup Mesh ###
+
+        # TODO probably should be in main canvas, inserted at index
+        with creature.canvas.before:
+            Color(rgba=(1.0, 1.0, 1.0, 1.0))
+            self.mesh = mesh = Mesh(mode=mesh_mode, indices=self._lod_mesh_indices)
+
+        self.vertex_buffer = VertexBuffer(mesh, self._lod_mesh_vertices)
+
+        # Placeholder until the image is decoded
+        mesh.texture = load_texture_async(image_filepath, self.on_texture_loaded)
+
+        creature.add_body_part(self)
+
+    def _compute_geometry(self, vertices):
+        """:returns dict of PartGeometry attributes:
+        offsets: (x, y) of the perimeter vertices relative to the creature body
+        centroid_offset, center_offset: (x, y) of the Mesh centroid and center chain
+        uv: (u, v) of the centroid followed by the perimeter vertices
+        levels: (perimeter indices, Mesh indices) for each level of detail
+        """
+        creature = self.creature
+        creature_phy_body = creature.phy_body
+        num_vertices = len(vertices)
 
         # backwards unit vector
         backwards_vec = creature_phy_body.rotation_vector.rotated_degrees(180)
         assert 0.9999 <= backwards_vec.get_length() <= 1.00001
         jelly_pos = Vec2d(creature.pos)
-        # +  * (2 * width + jelly.phy_shape.radius / 2.0)
 
+        # FIXME Tentacles vertices don't need all this encoding
+        positions = []
+        uv = [(vertices[2], vertices[3])]
+
+        # Start at 4 to skip centroid
+        tentacles_offset = backwards_vec * -5.0
+        for i in range(4, num_vertices, 4):
+            # These are in Image coordinates
+            # Can't just scale and rotate because it's attached to the physics system
+            positions.append(creature.texture_xy_to_world(vertices[i], vertices[i+1]) + tentacles_offset)
+            uv.append((vertices[i+2], vertices[i+3]))
+
+        # Calculate average centroid
+        # triangle_fan needs centroid
+        # TODO Use centroid? Make centroid it's own massive point? single point in center_chain?
+        num_averaged = num_vertices/4 - 1
+        cent_pos_x = sum(vertices[x] for x in range(4, num_vertices, 4)) / num_averaged
+        cent_pos_y = sum(vertices[y] for y in range(5, num_vertices, 4)) / num_averaged
+        centroid = creature.texture_xy_to_world(cent_pos_x, cent_pos_y) + tentacles_offset
+
+        # For now, just do a single center body near centroid (vertical aligned with jelly_pos)
+        dist_creature_to_goocenter = jelly_pos.get_distance(centroid)
+        center_position = jelly_pos + backwards_vec * dist_creature_to_goocenter
+
+        num_levels = 1
+        while num_levels <= len(creature.lod_radii) \
+                and len(positions) // 2 ** num_levels >= MIN_LOD_PERIMETER_NODES:
+            num_levels += 1
+
+        levels = []
+        for level in range(num_levels):
+            perimeter_indices = tuple(range(0, len(positions), 2 ** level))
+            levels.append((perimeter_indices, tuple(fan_indices(len(perimeter_indices)))))
+
+        def offset(pos):
+            vec = offset_to_pos(creature_phy_body, pos)
+            return vec.x, vec.y
+
+        return {'offsets': tuple(offset(pos) for pos in positions),
+                'centroid_offset': offset(centroid),
+                'center_offset': offset(center_position),
+                'uv': tuple(uv),
+                'levels': tuple(levels)}
+
+    # Attributes that are different for each level of detail (set by _activate_level)
+    _level_attributes = ('outer_chain', 'center_chain', 'chains', '_node_distance',
+                         'soft_body', '_soft_outer_nodes',
+                         '_lod_perimeter_indices', '_lod_mesh_vertices', '_lod_mesh_indices')
+
+    def _build_level(self, level):
+        """Create the chains and constraints (or SoftBody) for a level of detail
+        using every 2**level perimeter position, at the creature's current position and angle
+        """
+        creature_phy_body = self.creature.phy_body
+
+        geometry = self.geometry
+        perimeter_indices, mesh_indices = geometry.levels[level]
+        positions = [world_pos_of_offset(creature_phy_body, geometry.offsets[p]) for p in perimeter_indices]
+        center_position = world_pos_of_offset(creature_phy_body, geometry.center_offset)
+
+        self._node_distance = {}
+        self.soft_body = None
+        self._soft_outer_nodes = None
+        self._lod_perimeter_indices = perimeter_indices
+
+        # centroid + perimeter vertices
+        # World xy of the mesh vertices are replaced by the next mesh update
+        uv = geometry.uv
+        centroid = world_pos_of_offset(creature_phy_body, geometry.centroid_offset)
+        mesh_vertices = [centroid.x, centroid.y, uv[0][0], uv[0][1]]
+        for p, pos in zip(perimeter_indices, positions):
+            u, v = uv[p + 1]
+            mesh_vertices.extend((pos.x, pos.y, u, v))
+
+        self._lod_mesh_vertices = mesh_vertices
+        self._lod_mesh_indices = mesh_indices
+
+        if self._physics_engine == 'soft_body':
+            self._build_soft_body(positions, center_position)
+        else:
+            self._build_chains(positions, center_position)
+
+        self._levels[level] = dict((name, getattr(self, name)) for name in self._level_attributes)
+
+    def _build_chains(self, positions, center_position):
+        """Create the cymunk chains and constraints of a level of detail"""
+        creature = self.creature
+        creature_phy_body = creature.phy_body
+        debug_visuals = creature.debug_visuals
+        tweaks = self.tweaks
         canvas_after = creature.canvas.after
 
         stiffness = tweaks['outer_spring_stiffness']
         damping = tweaks['outer_spring_damping']
-        # FIXME NOW finish up spring tweaks, drag tweaks
         creature_radius = creature.phy_shape.radius  # FIXME assumes Circle shape
 
-        # Mass
-        # TODO make fraction of bell a tweak
-        tentacles_total_mass = tweaks['mass_fraction'] * creature_phy_body.mass
-
         ### Outer Chain ###
         # TODO Prevent Mesh triangles from flipping somehow
         if debug_visuals:
             canvas_after.add(Color(rgba=(1.0, 0, 0, 0.3)))
 
-        # FIXME Tentacles vertices don't need all this encoding
-        positions = []
-
-        # Mesh vertices translated to correct world positions relative to Jelly
-        # will set Mesh.vertices at end
-        translated_vertices = []
-
-        # Start at 4 to skip centroid
-        tentacles_offset = backwards_vec * -5.0
-        for i in range(4, num_vertices, 4):
-            # within canvas to scale...
-            # These are in Image coordinates
-            # Can't just scale and rotate because it's attached to the physics system
-
-            xy = creature.texture_xy_to_world(vertices[i], vertices[i+1]) + tentacles_offset
-            positions.append(xy)
-            translated_vertices.extend((xy.x, xy.y, vertices[i+2], vertices[i+3]))
-
-        self.outer_chain = outer_chain = self._create_chain(positions, canvas_after, loop_around=True,
+        self.outer_chain = outer_chain = self._create_chain(positions,
+                                                            canvas_after, loop_around=True,
                                                             radius=dp(10), stiffness=stiffness, damping=damping)
 
 
@@ -199,6 +371,7 @@ class GooeyBodyPart(CreatureBodyPart):
         # TODO customized pin points with GUI
 
         # Automatic: Finds the closest two points on the left and right side and pins them
+        outer_chain_index = KDTree([node.body.position for node in outer_chain], outer_chain)
 
         ## Left Offset ##
         # Vector perpendicular to default 0 angle to right
@@ -207,13 +380,13 @@ class GooeyBodyPart(CreatureBodyPart):
         offset_world_vec = world_pos_of_offset(creature_phy_body, (0, offset_length))
 
         # Get closest body in outer_chain
-        closest = min(outer_chain, key=lambda x: x.body.position.get_distance(offset_world_vec))
+        closest = outer_chain_index.nearest(offset_world_vec)[0][1]
         closest_body = closest.body
 
         anchor_offset = offset_to_pos(creature_phy_body, closest_body.position)
 
         # Constraint anchor offset needs to be relative to the creature orientation
-        spring = PinJoint(creature_phy_body, closest_body, (anchor_offset.x, anchor_offset.y), (0, 0))
+        spring = self._pin_joint(creature_phy_body, closest_body, (anchor_offset.x, anchor_offset.y))
         # TODO separate field for PinJoint?
         closest.internal_springs.append(spring)
 
@@ -226,24 +399,17 @@ class GooeyBodyPart(CreatureBodyPart):
         ## Right Offset ##
         offset_world_vec = world_pos_of_offset(creature_phy_body, (0, -offset_length))
         # (same code as for left offset above)
-        closest = min(outer_chain, key=lambda x: x.body.position.get_distance(offset_world_vec))
+        closest = outer_chain_index.nearest(offset_world_vec)[0][1]
         closest_body = closest.body
         anchor_offset = offset_to_pos(creature_phy_body, closest_body.position)
 
-        spring = PinJoint(creature_phy_body, closest_body, (anchor_offset.x, anchor_offset.y), (0, 0))
+        spring = self._pin_joint(creature_phy_body, closest_body, (anchor_offset.x, anchor_offset.y))
         closest.internal_springs.append(spring)
 
         # FIXME Setup groups some other way, Need to detect points that start inside
         closest.shape.group = creature.phy_group_num
 
 
-        # Calculate average centroid
-        num_averaged = num_vertices/4 - 1
-        cent_pos_x = sum(vertices[x] for x in range(4, num_vertices, 4)) / num_averaged
-        cent_pos_y = sum(vertices[y] for y in range(5, num_vertices, 4)) / num_averaged
-        cent_pos_x, cent_pos_y = creature.texture_xy_to_world(cent_pos_x, cent_pos_y) + tentacles_offset
-
-
         ### Center Chain ###
         # Just at centroid
         # could be offset a bit...
@@ -257,12 +423,8 @@ class GooeyBodyPart(CreatureBodyPart):
         # start = jelly_pos + backwards_vec * (creature.phy_shape.radius + 20)
         # positions = [start + backwards_vec * (dist_apart * n) for n in range(2)]
 
-        # For now, just do a single body near centroid (vertical aligned with jelly_pos)
-        dist_creature_to_goocenter = jelly_pos.get_distance((cent_pos_x, cent_pos_y))
-        positions = [jelly_pos + backwards_vec * dist_creature_to_goocenter]
-
         # With 1 position, no springs will actually be created
-        self.center_chain = center_chain = self._create_chain(positions, canvas_after,
+        self.center_chain = center_chain = self._create_chain([center_position], canvas_after,
                                                               radius=radius,
                                                               phy_group_num=creature.phy_group_num)
 
@@ -274,17 +436,13 @@ class GooeyBodyPart(CreatureBodyPart):
         anchor = (0, offset_dist)
         offset_world_vec = world_pos_of_offset(creature_phy_body, anchor)
         rest_length = offset_world_vec.get_distance(creature_phy_body.position)
-        spring = DampedSpring(creature_phy_body, first.body, anchor, (0, 0),
-                              rest_length, stiffness, damping)
-        spring.max_force = SPRING_MAX_FORCE
+        spring = self._damped_spring(creature_phy_body, first.body, anchor, rest_length, stiffness, damping)
         first.internal_springs.append(spring)
 
         anchor = (0, -offset_dist)
         offset_world_vec = world_pos_of_offset(creature_phy_body, anchor)
         rest_length = offset_world_vec.get_distance(creature_phy_body.position)
-        spring = DampedSpring(creature_phy_body, first.body, anchor, (0, 0),
-                              rest_length, stiffness, damping)
-        spring.max_force = SPRING_MAX_FORCE
+        spring = self._damped_spring(creature_phy_body, first.body, anchor, rest_length, stiffness, damping)
         first.internal_springs.append(spring)
 
         # Link outer chain with center
@@ -293,34 +451,193 @@ class GooeyBodyPart(CreatureBodyPart):
 
         self.chains = (center_chain, outer_chain)
 
-        creature.bind(mass=self.on_creature_mass)
-        self.bind(mass=self.on_mass_changed)
-        self.mass = tentacles_total_mass
+    def _build_soft_body(self, positions, center_position):
+        """Create the SoftBody of a level of detail directly from the positions,
+        with the same nodes and springs as _build_chains() creates in cymunk"""
+        creature = self.creature
+        creature_phy_body = creature.phy_body
+        creature_pos = creature_phy_body.position
+        debug_visuals = creature.debug_visuals
+        tweaks = self.tweaks
+        canvas_after = creature.canvas.after
 
-        ### Setup Mesh ###
+        stiffness = tweaks['outer_spring_stiffness']
+        damping = tweaks['outer_spring_damping']
+        creature_radius = creature.phy_shape.radius  # FIXME assumes Circle shape
 
-        # triangle_fan needs centroid
-        # TODO Use centroid? Make centroid it's own massive point? single point in center_chain?
-        # FIXME Really hackish, but just using first center chain for now with original u, v
-        # cent_pos = center_chain[0][0].body.position
+        self.soft_body = soft = SoftBody()
+        distances = self._node_distance
 
-        # Prepend centroid vertices list
-        # translated_vertices = [cent_pos.x, cent_pos.y, vertices[2], vertices[3]] + translated_vertices
+        def add_node(pos, radius):
+            # mass is set in on_mass_changed
+            node = soft.add_node(pos, 1.0)
+            distances[node] = creature_pos.get_distance(pos)
+            if not debug_visuals:
+                return node, None
 
-        # for i in range(4, len(vertices), 4):
-            # vertices[i]
-            # vertices[i + 1]
+            e = Ellipse(pos=(pos.x - radius, pos.y - radius), size=(radius * 2.0, radius * 2.0))
+            canvas_after.add(e)
+            return node, e
 
-        translated_vertices = [cent_pos_x, cent_pos_y, vertices[2], vertices[3]] + translated_vertices
+        ### Outer Chain ###
+        if debug_visuals:
+            canvas_after.add(Color(rgba=(1.0, 0, 0, 0.3)))
 
-        # TODO probably should be in main canvas, inserted at index
-        with creature.canvas.before:
-            Color(rgba=(1.0, 1.0, 1.0, 1.0))
-            img = CoreImage(image_filepath)
-            self.mesh = mesh = Mesh(mode=mesh_mode, texture=img.texture, indices=indices,
-                                    vertices=translated_vertices)
+        radius = dp(10)
+        outer = [add_node(pos, radius) for pos in positions]
+        # Each node has a spring to the previous, the first to the last
+        perimeter_springs = [soft.add_spring(outer[i - 1][0], node, stiffness, damping)
+                             for i, (node, _) in enumerate(outer)]
 
-        creature.add_body_part(self)
+        ### Pin Points ###
+        # Closest nodes to points on the left and right of the creature
+        outer_index = KDTree(positions, range(len(positions)))
+        offset_length = creature_radius*0.5
+        for side in (1, -1):
+            i = outer_index.nearest(world_pos_of_offset(creature_phy_body, (0, side * offset_length)))[0][1]
+            anchor_offset = offset_to_pos(creature_phy_body, positions[i])
+            soft.add_pin(outer[i][0], creature_phy_body, (anchor_offset.x, anchor_offset.y))
+
+        ### Center Chain ###
+        if debug_visuals:
+            canvas_after.add(Color(rgba=(0, 0, 1.0, 0.3)))
+
+        center_radius = dp(12)
+        center, center_ellipse = add_node(center_position, center_radius)
+
+        # Two springs to the creature, offset sideways from its center
+        offset_dist = 0.5 * creature_radius
+        for anchor in ((0, offset_dist), (0, -offset_dist)):
+            rest_length = world_pos_of_offset(creature_phy_body, anchor).get_distance(creature_pos)
+            soft.add_body_spring(center, creature_phy_body, anchor, rest_length, stiffness, damping)
+
+        # Link outer chain with center
+        internal_stiffness = tweaks['internal_spring_stiffness']
+        internal_damping = tweaks['internal_spring_damping']
+        self.outer_chain = outer_chain = [
+            ChainNode(shape=None, body=node, ellipse=e, perimeter_spring=spring, radius=radius,
+                      internal_springs=[soft.add_spring(node, center, internal_stiffness, internal_damping)])
+            for (node, e), spring in zip(outer, perimeter_springs)]
+
+        self.center_chain = center_chain = [
+            ChainNode(shape=None, body=center, ellipse=center_ellipse, perimeter_spring=None,
+                      internal_springs=[], radius=center_radius)]
+
+        self.chains = (center_chain, outer_chain)
+        self._soft_outer_nodes = [node for node, _ in outer]
+
+    def _activate_level(self, level):
+        """Make the chains (and SoftBody) of the given level of detail the current ones,
+        building them if the level wasn't used before.
+        Does not move physics objects between spaces or update the Mesh.
+        """
+        if self._level is not None:
+            self._show_debug_ellipses(False)
+
+        self._level = level
+        level_attributes = self._levels[level]
+        if level_attributes is None:
+            # debug ellipses are drawn shown
+            self._build_level(level)
+        else:
+            for name, value in level_attributes.viewitems():
+                setattr(self, name, value)
+
+            self._show_debug_ellipses(True)
+
+        # Inactive levels keep mass and spring values from when they were created or last active
+        self.on_mass_changed(self, self.mass)
+        for name in ('outer_spring_stiffness', 'outer_spring_damping',
+                     'internal_spring_stiffness', 'internal_spring_damping'):
+            self.adjust_tweak(name, self.tweaks[name])
+
+    def _show_debug_ellipses(self, show):
+        """Show or hide the debug ellipses of the current level's chains"""
+        if not self.creature.debug_visuals:
+            return
+
+        for chain in self.chains:
+            for node in chain:
+                size = 2.0 * node.radius if show else 0
+                node.ellipse.size = size, size
+
+    def on_creature_lod(self, creature, lod):
+        """Switch to the chains of the new level of detail, continuing from the current
+        positions and velocities of the nodes
+        """
+        level = min(lod, len(self._levels) - 1)
+        if level == self._level:
+            return
+
+        Logger.debug('%s: level of detail %d -> %d', self.__class__.__name__, self._level, level)
+
+        old_indices = self._lod_perimeter_indices
+        outer_states = [self._get_node_state(node) for node in self.outer_chain]
+        center_states = [self._get_node_state(node) for node in self.center_chain]
+
+        registry = None
+        env = creature.environment_wref() if creature.environment_wref else None
+        if env is not None and env.phy_registry is not None:
+            registry = env.phy_registry
+            self.unbind_physics_space(registry)
+
+        self._activate_level(level)
+
+        # Interpolate between the closest nodes of the old level
+        num_perimeter = self._num_perimeter
+        for node, p in zip(self.outer_chain, self._lod_perimeter_indices):
+            i = bisect_right(old_indices, p) - 1
+            start_state = outer_states[i]
+            if i + 1 < len(old_indices):
+                t = float(p - old_indices[i]) / (old_indices[i + 1] - old_indices[i])
+                end_state = outer_states[i + 1]
+            else:
+                # Wraps around to first
+                t = float(p - old_indices[i]) / (old_indices[0] + num_perimeter - old_indices[i])
+                end_state = outer_states[0]
+
+            self._set_node_state(node, [a + (b - a) * t for a, b in zip(start_state, end_state)])
+
+        for node, state in zip(self.center_chain, center_states):
+            self._set_node_state(node, state)
+
+        if registry is not None:
+            self.bind_physics_space(registry)
+
+        self.vertex_buffer.replace(self._lod_mesh_vertices)
+        self.mesh.indices = self._lod_mesh_indices
+        if self.soft_body is None:
+            self._update_mesh()
+        else:
+            self._update_soft_body_visuals()
+
+    def _get_node_state(self, node):
+        """:returns x, y, vx, vy of the node"""
+        soft = self.soft_body
+        if soft is None:
+            body = node.body
+            return body.position.x, body.position.y, body.velocity.x, body.velocity.y
+
+        i = node.body
+        return soft.x[i], soft.y[i], soft.vx[i], soft.vy[i]
+
+    def _set_node_state(self, node, state):
+        x, y, vx, vy = state
+        soft = self.soft_body
+        if soft is None:
+            body = node.body
+            body.position = x, y
+            body.velocity = vx, vy
+
+        else:
+            i = node.body
+            soft.x[i] = x
+            soft.y[i] = y
+            soft.vx[i] = vx
+            soft.vy[i] = vy
+
+    def on_texture_loaded(self, texture):
+        self.mesh.texture = texture
 
     def on_mass_changed(self, o, mass):
         """Distribute the mass among all bodies according to tweaks
@@ -343,7 +660,9 @@ class GooeyBodyPart(CreatureBodyPart):
         center_chain = self.center_chain
         outer_chain = self.outer_chain
 
-        farthest_dist = max(self.__body_distance.values())
+        distances = self._node_distance
+        farthest_dist = max(distances.values())
+        soft = self.soft_body
 
         # TODO balance left-right mass?
         for chain_mass, chain in ((center_chain_mass, center_chain),
@@ -352,37 +671,93 @@ class GooeyBodyPart(CreatureBodyPart):
 
             for node in chain:
                 body = node.body
-                dist = self.__body_distance[body]
+                dist = distances[body]
 
                 # FIXME this equation doesn't maintain the total mass
                 m = body_mass * (dist / farthest_dist) ** 2.0 + 0.2 * body_mass
-                body.mass = m
-                body.moment = moment_for_circle(m, 0, node.shape.radius)
+                if soft is None:
+                    body.mass = m
+                    body.moment = moment_for_circle(m, 0, node.radius)
+                else:
+                    soft.set_mass(body, m)
 
 
-    # FIXME prevent double connections if chain1 is chain2
+    # FIXME prevent double connections (a-b and b-a) if chain1 is chain2
     def _cross_link(self, chain1, chain2, stiffness=20, damping=10, connect_num=1):
         """Connects springs with closest connect_num bodies from the other chain2
         adds the created springs to chain1's nodes internal_springs
+        If chain1 is chain2, nodes are not connected to themselves.
         """
 
-        for node1 in chain1:
-            # get closest 2 points in other chain
-            # construct list of 2 element tuples (dist, body)
-            others = []
-            for node2 in chain2:
-                others.append((node1.body.position.get_distance(node2.body.position), node2.body))
+        chain2_index = KDTree([node.body.position for node in chain2], [node.body for node in chain2])
 
-            others.sort(key=lambda x: x[0])
+        # Query one extra in case node1 is in chain2
+        query_num = connect_num + 1 if chain1 is chain2 else connect_num
 
-            # Springs with first two
-            for dist, body in others[:connect_num]:
-                spring = DampedSpring(node1.body, body, (0, 0), (0, 0),
-                                          dist, stiffness, damping)
-                spring.max_force = SPRING_MAX_FORCE
+        for node1 in chain1:
+            body1 = node1.body
+            # Springs with closest connect_num
+            closest = [x for x in chain2_index.nearest(body1.position, query_num) if x[1] is not body1]
+            for dist, body in closest[:connect_num]:
+                spring = self._damped_spring(body1, body, (0, 0), dist, stiffness, damping)
 
                 node1.internal_springs.append(spring)
 
+    def _damped_spring(self, a, b, anchr1, rest_length, stiffness, damping):
+        """Create a DampedSpring from anchr1 on a to the center of b"""
+        spring = DampedSpring(a, b, anchr1, (0, 0), rest_length, stiffness, damping)
+        spring.max_force = SPRING_MAX_FORCE
+        return spring
+
+    def _pin_joint(self, a, b, anchr1):
+        """Create a PinJoint from anchr1 on a to the center of b"""
+        return PinJoint(a, b, anchr1, (0, 0))
+
+    def _update_soft_body(self):
+        soft = self.soft_body
+        env = self.creature.environment_wref() if self.creature.environment_wref else None
+        if env is not None:
+            # Same fixed time step as the physics space
+            soft.step(env.update_interval, drag_constant=self.tweaks['drag_constant'],
+                      drag_scale=self.creature.step_scale)
+
+        self._update_soft_body_visuals()
+
+    def _update_soft_body_visuals(self):
+        soft = self.soft_body
+        xs = soft.x
+        ys = soft.y
+
+        if self.creature.debug_visuals and frame_governor.debug_visuals:
+            for chain in self.chains:
+                for node in chain:
+                    i = node.body
+                    radius = node.radius
+                    node.ellipse.pos = xs[i] - radius, ys[i] - radius
+
+        # Update Mesh vertices, centroid is average of outer points
+        verts = self.vertex_buffer.data
+        x = 0.0
+        y = 0.0
+        for v, i in enumerate(self._soft_outer_nodes, start=1):
+            verts[v*4] = xs[i]
+            verts[v*4 + 1] = ys[i]
+            x += xs[i]
+            y += ys[i]
+
+        num = len(self._soft_outer_nodes)
+        verts[0] = x / num
+        verts[1] = y / num
+        self.vertex_buffer.mark_dirty()
+
+    def translate(self, translation_vector):
+        if self.soft_body is None:
+            super(GooeyBodyPart, self).translate(translation_vector)
+            return
+
+        self.soft_body.translate(translation_vector[0], translation_vector[1])
+        self._update_soft_body_visuals()
+
     def _create_chain(self, positions, canvas, mass=1, radius=10, loop_around=False, stiffness=50, damping=15,
                       phy_group_num=None):
         """Creates a chain of bodies (ChainNode) at the specified positions connected together with
@@ -403,8 +778,7 @@ class GooeyBodyPart(CreatureBodyPart):
         for pos in positions:
             # mass falls with distance from jelly
             body = Body(mass, moment_for_circle(mass, 0, radius))
-            dist = creature_pos.get_distance(pos)
-            self.__body_distance[body] = dist
+            self._node_distance[body] = creature_pos.get_distance(pos)
             shape = Circle(body, radius)
             shape.friction = 0.4
             shape.elasticity = 0.3
@@ -424,11 +798,10 @@ class GooeyBodyPart(CreatureBodyPart):
             if prev:
                 # attach spring to previous
                 dist_apart = prev[0].body.position.get_distance(body.position)
-                spring = DampedSpring(prev[0].body, body, (0, 0), (0, 0), dist_apart, stiffness,
-                                          damping)
-                spring.max_force = SPRING_MAX_FORCE
+                spring = self._damped_spring(prev[0].body, body, (0, 0), dist_apart, stiffness, damping)
 
-            item = ChainNode(shape=shape, body=body, ellipse=e, perimeter_spring=spring, internal_springs=[])
+            item = ChainNode(shape=shape, body=body, ellipse=e, perimeter_spring=spring, internal_springs=[],
+                             radius=radius)
 
             center_chain.append(item)
 
@@ -439,40 +812,37 @@ class GooeyBodyPart(CreatureBodyPart):
             first_node = center_chain[0]
             first_body = first_node.body
             dist_apart = last_body.position.get_distance(first_body.position)
-            spring = DampedSpring(last_body, first_body, (0, 0), (0, 0),
-                                      dist_apart, stiffness, damping)
-            spring.max_force = SPRING_MAX_FORCE
+            spring = self._damped_spring(last_body, first_body, (0, 0), dist_apart, stiffness, damping)
             # Have to recreate because ChainNode is a tuple
-            center_chain[0] = ChainNode(shape=first_node.shape, body=first_body, ellipse=first_node.ellipse,
-                                        perimeter_spring=spring, internal_springs=[])
+            center_chain[0] = first_node._replace(perimeter_spring=spring)
 
         return center_chain
 
     def update(self):
-        debug_visuals = self.creature.debug_visuals
+        if self.soft_body is not None:
+            self._update_soft_body()
+            return
+
+        debug_visuals = self.creature.debug_visuals and frame_governor.debug_visuals
+        drag_multiplier = self.creature.drag_multiplier
+        drag_constant = self.tweaks['drag_constant']
         for chain in self.chains:
             for node in chain:
                 body = node.body
-                radius = node.shape.radius
+                radius = node.radius
                 if debug_visuals:
                     node.ellipse.pos = body.position.x - radius, body.position.y - radius
 
-                # drag force
-                # drag_force can be inf with high push power!? not sure why this happens
-                # TODO tweak
-                drag_force = body.velocity.rotated_degrees(180) \
-                             * (body.velocity.get_length_sqrd() * self.tweaks['drag_constant'])
-
-                force = drag_force.get_length_sqrd()
-                if force > 30.0:
-                    # TODO does this value need to be different depending on mass?
-                    drag_force.length = 30.0
-
-                body.apply_impulse(drag_force)
+                if drag_multiplier:
+                    # drag force can be inf with high push power!? not sure why this happens
+                    # TODO does max_impulse need to be different depending on mass?
+                    apply_drag(body, drag_constant, drag_multiplier, max_impulse=30.0)
 
+        self._update_mesh()
 
+    def _update_mesh(self):
         # Update Mesh vertices
-        verts = self.mesh.vertices
+        verts = self.vertex_buffer.data
         x = 0.0
         y = 0.0
         for i, node in enumerate(self.outer_chain):
@@ -495,7 +865,7 @@ class GooeyBodyPart(CreatureBodyPart):
 
         # Just average all points
 
-        self.mesh.vertices = verts
+        self.vertex_buffer.mark_dirty()
 
 
         # make sure center chain isn't too out of whack
@@ -510,10 +880,17 @@ class GooeyBodyPart(CreatureBodyPart):
         # force = vec_to_jelly.perpendicular_normal() * (angle_diff * 20)
         # first_body.apply_impulse(force)
 
+    def batch_meshes(self):
+        yield self.vertex_buffer, self._lod_mesh_indices, None
+
     def phy_objects(self, body_only=False):
         """generator of all physics objects in this body part
         Order: Body > Shape > Constraint
+        Nothing when simulated by a SoftBody
         """
+        if self.soft_body is not None:
+            return
+
         for chain in self.chains:
             for node in chain:
                 yield node.body
@@ -540,6 +917,12 @@ class GooeyBodyPart(CreatureBodyPart):
         elif name == 'center_mass_fraction':
             self.on_mass_changed(self, self.mass)
 
+        elif name == 'physics_engine':
+            self._change_physics_engine(value)
+
+        elif self.soft_body is not None:
+            self._adjust_soft_springs(name)
+
         elif name == 'outer_spring_stiffness':
             for node in self.outer_chain:
                 node.perimeter_spring.stiffness = value
@@ -565,6 +948,67 @@ class GooeyBodyPart(CreatureBodyPart):
                     except AttributeError:
                         pass
 
+    def _adjust_soft_springs(self, name):
+        """Set the SoftBody springs of a changed spring tweak"""
+        tweaks = self.tweaks
+        soft = self.soft_body
+        if name in ('outer_spring_stiffness', 'outer_spring_damping'):
+            stiffness = tweaks['outer_spring_stiffness']
+            damping = tweaks['outer_spring_damping']
+            for node in self.outer_chain:
+                soft.set_spring_params(node.perimeter_spring, stiffness, damping)
+
+        elif name in ('internal_spring_stiffness', 'internal_spring_damping'):
+            stiffness = tweaks['internal_spring_stiffness']
+            damping = tweaks['internal_spring_damping']
+            for node in self.outer_chain:
+                for spring in node.internal_springs:
+                    soft.set_spring_params(spring, stiffness, damping)
+
+    def _change_physics_engine(self, physics_engine):
+        """Rebuild the current level of detail with physics_engine,
+        continuing from the current positions and velocities of the nodes"""
+        if physics_engine not in self.physics_engines:
+            raise ValueError('Unknown physics_engine {}'.format(physics_engine))
+
+        if physics_engine == self._physics_engine:
+            return
+
+        creature = self.creature
+        states = [[self._get_node_state(node) for node in chain] for chain in self.chains]
+
+        registry = None
+        env = creature.environment_wref() if creature.environment_wref else None
+        if env is not None and env.phy_registry is not None:
+            registry = env.phy_registry
+            self.unbind_physics_space(registry)
+
+        # Levels built with the other engine are discarded
+        if creature.debug_visuals:
+            canvas_after = creature.canvas.after
+            for level_attributes in self._levels:
+                if level_attributes is not None:
+                    for chain in level_attributes['chains']:
+                        for node in chain:
+                            canvas_after.remove(node.ellipse)
+
+        self._physics_engine = physics_engine
+        level = self._level
+        self._levels = [None] * len(self._levels)
+        self._level = None
+        self._activate_level(level)
+
+        for chain, chain_states in zip(self.chains, states):
+            for node, state in zip(chain, chain_states):
+                self._set_node_state(node, state)
+
+        if registry is not None:
+            self.bind_physics_space(registry)
+
+        if self.soft_body is None:
+            self._update_mesh()
+        else:
+            self._update_soft_body_visuals()
 
 class JellyBell(Creature):
     """An animated Jelly bell Creature that uses a MeshAnimator to animate between an open
@@ -577,6 +1021,9 @@ class JellyBell(Creature):
     class_path = 'visuals.creatures.jelly.JellyBell'
     part_title = _('Jelly Bell')
 
+    # Live JellyBells, see _rebind_bell_vertical_fraction()
+    _live = WeakSet()
+
     # FIXME where to set min/max
     # Here in data
     # Using kivy properties?
@@ -606,11 +1053,15 @@ class JellyBell(Creature):
                                     float, 'Slider', 1e-11, 1e-9))
     ))
 
+    # Fraction the bell radius changes before updating the body moment
+    moment_radius_tolerance = 0.01
+
     @not_none_keywords('image_filepath', 'mesh_animator')
-    def __init__(self, image_filepath=None, mesh_animator=None, **kwargs):
+    def __init__(self, image_filepath=None, mesh_animator=None, animation_phase=0.0, **kwargs):
         """Creates Mesh using image_filepath and binds MeshAnimator to it
 
-        image_filepath"""
+        image_filepath
+        animation_phase -- seconds to delay the bell animation, so copies don't pulse together"""
 
         self.image_filepath = image_filepath
 
@@ -619,16 +1070,21 @@ class JellyBell(Creature):
 
         self._prev_bell_vertical_fraction = 0.0
         self.bell_push_dir = True  # whether Bell is pulsing as to push jelly
-        # indices of the Bell Mesh that can be the farthest horizontally to the right
-        # (used to determine the bell_diameter dynamically)
-        self._rightmost_vertices_for_step = {}
+        # scaled bell radius the body moment was last calculated with
+        self._moment_radius = 0.0
 
         # Required for Creature.mass calculation
 
         super(JellyBell, self).__init__(**kwargs)
 
         mesh_animator.bind(vertical_fraction=self.on_bell_vertical_fraction, step=self.on_bell_animstep)
-        mesh_animator.start_animation()
+        JellyBell._live.add(self)
+        mesh_animator.lod = self.lod
+        self.bind(lod=mesh_animator.setter('lod'))
+        if animation_phase > 0:
+            mesh_animator.start_animation_delayed(animation_phase)
+        else:
+            mesh_animator.start_animation()
 
         # super called draw_creature
 
@@ -680,8 +1136,15 @@ class JellyBell(Creature):
         if name == 'density':
             self.mass = value * self.volume
 
+    def suspend(self):
+        self.mesh_animator.stop_animation()
+
+    def resume(self):
+        self.mesh_animator.start_animation()
+
     def destroy(self):
         self.mesh_animator.stop_animation()
+        leak_tracker.track(self.mesh_animator, 'MeshAnimator of {}'.format(self.creature_id))
         super(JellyBell, self).destroy()
 
     def draw_creature(self):
@@ -709,8 +1172,9 @@ class JellyBell(Creature):
         t = Translate()
         t.xy = adjustment
 
-        img = CoreImage(self.image_filepath)
-        self.bell_mesh = mesh = Mesh(texture=img.texture)
+        self.bell_mesh = mesh = Mesh()
+        # Placeholder until the image is decoded
+        mesh.texture = load_texture_async(self.image_filepath, self.on_bell_texture_loaded)
         a.mesh = mesh
 
         PopMatrix()
@@ -735,7 +1199,21 @@ class JellyBell(Creature):
         self.mass = density * volume
         Logger.debug('%s: updating mass=%s, volume=%s, density=%s, radius=%s',
                      self.__class__.__name__, self.mass, volume, density, radius)
-        # moment already updated in calc_bell_radius
+        # moment updated by on_mass
+
+    def batch_meshes(self):
+        # body parts are drawn before (canvas.before)
+        for m in super(JellyBell, self).batch_meshes():
+            yield m
+
+        a = self.mesh_animator
+        yield a.vertex_buffer, a.mesh_indices, (self.centering_trans_x, self.centering_trans_y)
+
+    def on_bell_texture_loaded(self, texture):
+        self.bell_mesh.texture = texture
+
+    def projected_radius(self):
+        return self.bell_radius * self.scale * self._view_scale
 
     def calc_bell_radius(self):
         """Get the current bell radius
@@ -744,27 +1222,34 @@ class JellyBell(Creature):
 
         # Coordinates are in Texture image x, y coords
         x_adjustment = self.centering_trans_x  # number is negative (add to adjust)
-        verts = self.bell_mesh.vertices
-        rightmost_dist = 0
-        for vertex_index in range(0, len(verts), 4):
-            x = verts[vertex_index] + x_adjustment
-            if x > rightmost_dist:
-                rightmost_dist = x
+        # Precomputed for the current animation steps, full detail regardless of lod
+        rightmost_dist = max(0.0, self.mesh_animator.max_x() + x_adjustment)
 
         self.bell_radius = rightmost_dist
         scaled_bell_radius = rightmost_dist * self.scale
         # Updating shape is not really allowed! Need to create a new shape each time
         # self.phy_shape.radius = scaled_bell_radius
-        # In some languages multiplying by self is faster than pow
 
-        # Maybe calc moment manually instead of using function?
-        # r_sqd = rightmost_dist*rightmost_dist
-        # self.phy_body.moment = (pi / 2.0) * r_sqd * r_sqd
-        self.phy_body.moment = moment_for_circle(self.phy_body.mass, 0, scaled_bell_radius)
+        self._update_moment(scaled_bell_radius)
         self.cross_area = pi * scaled_bell_radius * scaled_bell_radius
 
         return rightmost_dist
 
+    def _update_moment(self, scaled_bell_radius, force=False):
+        """Update the body moment if the radius changed more than moment_radius_tolerance"""
+        previous = self._moment_radius
+        if not force and abs(scaled_bell_radius - previous) <= previous * self.moment_radius_tolerance:
+            return
+
+        self._moment_radius = scaled_bell_radius
+        self.phy_body.moment = moment_for_circle(self.phy_body.mass, 0, scaled_bell_radius)
+
+    def on_mass(self, o, mass):
+        super(JellyBell, self).on_mass(o, mass)
+        # moment is proportional to mass
+        if self._moment_radius:
+            self._update_moment(self._moment_radius, force=True)
+
     # TODO change pulse speed according to throttle
 
     def on_bell_animstep(self, meshanim, step):
@@ -874,124 +1359,315 @@ class JellyBell(Creature):
     # def on_scale(self, widget, new_scale):
     #     self.size = (self.texture_img.width * self.scale, self.texture_img.height * self.scale)
 
-class Tentacle(object):
+class Tentacle(CreatureBodyPart):
+    """A chain of bodies laid out along a tentacle image (see cached_circle_layout)
+    drawn with a triangle_strip Mesh. The first body is pinned to the creature.
+    Bodies have no shapes, so tentacles never collide and add nothing to collision detection.
+    """
     # TODO Tentacle features
-    # copy mechanism
-    #  - Is there really anything to share besides the image?
-    #  - Could just cache calculations on image...
     # scaling
     # I think it's cleanest for scaling to be done by just moving the bodies closer together
     # (Adjusting constraint) and radius as well as vertex distances
 
+    class_path = 'visuals.creatures.jelly.Tentacle'
+    part_title = _('Tentacle')
+
+    tweaks_defaults = {
+        'mass_fraction': 0.05,
+        'bend_stiffness': 20,
+        'bend_damping': 5,
+        'drag_constant': 1e-6
+    }
+
+    # Used to generate gui
+    tweaks_meta = OrderedDict((
+        ('mass_fraction', TweakMeta(_('Mass fraction'), _('Mass as percentage of bell.'),
+                                   float, 'Slider', 0.005, 0.5)),
+
+        ('bend_stiffness', TweakMeta(_('Bend stiffness'), _('How much the tentacle resists bending.'),
+                                    float, 'Slider', 0.1, 100)),
+
+        ('bend_damping', TweakMeta(_('Bend damping'), _('The damping amount when the tentacle bends.'),
+                                  float, 'Slider', 0.1, 100)),
+
+        ('drag_constant', TweakMeta(_('Drag'), _('How much drag the tentacle experiences.'),
+                                    float, 'Slider', 1e-7, 1e-5))
+    ))
+
+    # Padding around the circles for the strip width (in image pixels)
+    # Is anything wrong with making the padding much larger? (as long as not out of texture bounds)
+    vertex_padding = 2
+
+    mass = NumericProperty(1.0)
+
     @staticmethod
-    def create_construction_structure(anim_constr_screen):
-        raise NotImplementedError()
-        # anim_constr = anim_constr_screen.ids.animation_constructor
-        # vertices, indices = anim_constr.calc_mesh_vertices(update_mesh=False)
-        #
-        # return {GooeyBodyPart.class_path:
-        #         {
-        #             'image_filepath': anim_constr.image_filepath,
-        #             'mesh_mode': anim_constr.mesh_mode,
-        #             'vertices': vertices, 'indices': indices
-        #         }
-        #     }
-
-    @not_none_keywords('circles', 'image_filepath')
-    def __init__(self, circles=None, image_filepath=None, **kwargs):
+    def create_construction_structure(tentacle_constr):
+        """Creates construction structure (see: construct_value()) from a TentacleConstruction widget
+        position is where the top-left of the tentacle image is in creature texture coordinates.
+        """
+        (x, y), (width, height) = tentacle_constr.bbox
+        return {Tentacle.class_path:
+                {
+                    'image_filepath': tentacle_constr.image_filepath,
+                    'position': [x, y + height],
+                    'scale': tentacle_constr.scale,
+                    'radius_spacing': tentacle_constr.radius_spacing
+                }
+            }
+
+    @staticmethod
+    def setup_tentacle_constr(tentacle_constr, structure):
+        """Modify the TentacleConstruction to represent the state stored in the
+        structure (as returned from create_construction_structure)
+        """
+        data = structure[Tentacle.class_path]
+        tentacle_constr.image_filepath = data['image_filepath']
+        tentacle_constr.radius_spacing = data.get('radius_spacing', 1.0)
+        tentacle_constr.scale = scale = data.get('scale', 1.0)
+        x, y = data['position']
+        tentacle_constr.pos = x, y - tentacle_constr.height * scale
+
+    @not_none_keywords('image_filepath', 'position')
+    def __init__(self, image_filepath=None, position=None, scale=1.0, radius_spacing=1.0, circles=None,
+                 **kwargs):
+        """position: where the top-left of the image is in creature texture coordinates
+        scale: image pixels to texture coordinates
+        circles: [(x, y, radius), ...] as returned by layout_circles_on_rows,
+        if None the layout is looked up in (or added to) the layout cache"""
+        if circles is None:
+            circles = cached_circle_layout(image_filepath, radius_spacing=radius_spacing,
+                                           store=load_layout_cache_storage())
+
+        if len(circles) < 2:
+            raise InsufficientData('Less than 2 tentacle circles')
+
         super(Tentacle, self).__init__(**kwargs)
 
         creature = self.creature
+        creature_phy_body = creature.phy_body
         tweaks = self.tweaks
+        debug_visuals = creature.debug_visuals
 
-        # Some kind at Attachment parameter?
-        attachment = NotImplemented
+        left, top = position
 
-        with creature.canvas.before:
-            self.color = Color(rgba=(1.0, 1.0, 1.0, 1.0))
-            img = CoreImage(image_filepath)
-            self.mesh = mesh = Mesh(mode='triangle_strip', texture=img.texture)
+        # Copies constructed from the same store share the strip geometry
+        circles = tuple(tuple(c) for c in circles)
+        self.geometry = geometry = PartGeometry.shared(
+            (Tentacle.class_path, circles, scale, self.vertex_padding),
+            lambda: self._compute_geometry(circles, scale))
 
-        texture_width = img.texture.width
-        texture_height = img.texture.height
+        self.radii = radii = geometry.radii
+        # Half of the strip width at each body
+        self._half_widths = geometry.half_widths
+        # u, v of the strip vertices in image pixels, normalized when the texture is loaded
+        self._image_uv = image_uv = geometry.image_uv
+        self.bodies = bodies = []
+        self._ellipses = []
 
         # What if when scaling smaller, circles crash into each other?
-        # Maybe TentacleInstance is what takes circles?
-        # So this should be in charge of calculating circles?
         # Dynamic scaling is going to be difficult...
         # Actually may be easier to change body size and vertices calculation to scale
-        # Maybe it's fine if shape groups makes them not collide
-
-        self.phy_circles = circles = []
-        # TODO think about density vs radius or vs total tentacle
-        # One issue is if radius spacing is updated, mass will change
-        # So should be total mass
-        # Gooey also has issues with total_mass, need to think about mass distribution schemes
-        # density = tweaks['density']
-        vertices = []
-        # Is anything wrong with making the padding much larger? (as long as not out of texture bounds)
-        vertex_padding = 2
-        for x, y, radius in circles:
-            rad_plus_pad = radius + vertex_padding
-            # mass = density * (4/3.0) * pi * radius ^ 3
-            mass = 100
-            b = Body(mass, moment_for_circle(mass, radius))
-
-            circle = Circle(b, radius, (0, 0))
-            # self.phy_shape.friction = 0.4
-            circle.elasticity = 0.3
-            # self.phy_shape.group = self.phy_group_num
-            circles.append((b, circle))
-
-            # x, y, coordinates don't matter, but just use current anyway
-            tx = x - rad_plus_pad
-            vertices.extend((tx, y, tx / texture_width, y / texture_height))
-            tx = x + rad_plus_pad
-            vertices.extend((tx, y, tx / texture_width, y / texture_height))
-
-        mesh.vertices = vertices
-        mesh.indices = range(len(vertices) / 4)
+        for (x, y, width), radius in zip(circles, radii):
+            # mass is set in on_mass_changed
+            body = Body(1, moment_for_circle(1, 0, radius))
+            # Image y is down
+            body.position = creature.texture_xy_to_world(left + x * scale, top - y * scale)
+            bodies.append(body)
+
+        ### Constraints ###
+        self.constraints = constraints = []
+        # Bending springs skip a body, kept for tweaks
+        self.bend_springs = []
+
+        for i in range(len(bodies) - 1):
+            constraints.append(PinJoint(bodies[i], bodies[i + 1], (0, 0), (0, 0)))
+
+        for i in range(len(bodies) - 2):
+            a = bodies[i]
+            b = bodies[i + 2]
+            spring = DampedSpring(a, b, (0, 0), (0, 0), a.position.get_distance(b.position),
+                                  tweaks['bend_stiffness'], tweaks['bend_damping'])
+            spring.max_force = SPRING_MAX_FORCE
+            constraints.append(spring)
+            self.bend_springs.append(spring)
+
+        # Pin the first body to two points above it on either side, holding its position but not angle
+        x, y, width = circles[0]
+        first = bodies[0]
+        for side in (-1, 1):
+            anchor_world = creature.texture_xy_to_world(left + x * scale + side * radii[0],
+                                                        top - y * scale + radii[0])
+            anchor_offset = offset_to_pos(creature_phy_body, anchor_world)
+            constraints.append(PinJoint(creature_phy_body, first, (anchor_offset.x, anchor_offset.y), (0, 0)))
+
+        if debug_visuals:
+            creature.canvas.after.add(Color(rgba=(0.0, 1.0, 0, 0.3)))
+            for body, radius in zip(bodies, radii):
+                e = Ellipse(pos=(body.position.x - radius, body.position.y - radius),
+                            size=(radius * 2.0, radius * 2.0))
+                creature.canvas.after.add(e)
+                self._ellipses.append(e)
+
+        ### Mesh ###
+        # 2 vertices for each body, u, v set once the texture is loaded
+        with creature.canvas.before:
+            Color(rgba=(1.0, 1.0, 1.0, 1.0))
+            self._strip_indices = geometry.strip_indices
+            self.mesh = mesh = Mesh(mode='triangle_strip', indices=self._strip_indices)
+
+        self.vertex_buffer = vertex_buffer = VertexBuffer(mesh, [0.0] * (len(image_uv) * 4))
+
+        # Placeholder until the image is decoded, stretched along the strip
+        # (image_uv are pixels of the image, the texture size is needed)
+        last_row = float(max(1, len(image_uv) // 2 - 1))
+        for i in range(len(image_uv)):
+            vertex_buffer.set_uv(i, i % 2, (i // 2) / last_row)
+
+        mesh.texture = load_texture_async(image_filepath, self.on_texture_loaded)
+
+        creature.bind(mass=self.on_creature_mass)
+        self.bind(mass=self.on_mass_changed)
+        self.mass = tweaks['mass_fraction'] * creature.mass
+        self.on_mass_changed(self, self.mass)
 
         self.update()
+        creature.add_body_part(self)
+
+    def _compute_geometry(self, circles, scale):
+        """:returns dict of PartGeometry attributes:
+        radii of the bodies, half_widths of the strip at each body,
+        image_uv: (u, v) of the strip vertices in image pixels, strip_indices of the Mesh
+        """
+        padding = self.vertex_padding
+        radii = []
+        half_widths = []
+        image_uv = []
+        for x, y, width in circles:
+            # layout width is the colored pixels across the row
+            radii.append(max(width * scale / 2.0, 1.0))
+            half_widths.append((width / 2.0 + padding) * scale)
+            image_uv.append((x - width / 2.0 - padding, y))
+            image_uv.append((x + width / 2.0 + padding, y))
+
+        return {'radii': tuple(radii),
+                'half_widths': tuple(half_widths),
+                'image_uv': tuple(image_uv),
+                'strip_indices': tuple(range(len(image_uv)))}
+
+    def on_texture_loaded(self, texture):
+        vertex_buffer = self.vertex_buffer
+        width = float(texture.width)
+        height = float(texture.height)
+        for i, (u, v) in enumerate(self._image_uv):
+            vertex_buffer.set_uv(i, u / width, v / height)
+
+        vertex_buffer.flush()
+        self.mesh.texture = texture
+
+    def on_creature_mass(self, o, mass):
+        self.mass = self.tweaks['mass_fraction'] * mass
+
+    def on_mass_changed(self, o, mass):
+        """Distribute mass in proportion with each body's area"""
+        radii = self.radii
+        total = sum(r * r for r in radii)
+        for body, radius in zip(self.bodies, radii):
+            m = mass * radius * radius / total
+            body.mass = m
+            body.moment = moment_for_circle(m, 0, radius)
 
     def update(self):
-        debug_visuals = self.creature.debug_visuals
+        drag_constant = self.tweaks['drag_constant']
+        drag_multiplier = self.creature.drag_multiplier
 
-        verts = self.mesh.vertices
-        # Future: Could maybe do intermediate vertex with bezier curve?
+        xs = []
+        ys = []
+        for body in self.bodies:
+            if drag_multiplier:
+                # same as GooeyBodyPart
+                apply_drag(body, drag_constant, drag_multiplier, max_impulse=30.0)
 
-        vertex_padding = 2
-        # At this point, u, v is set (as usual) and just x, y are to be updated
-        for i, (body, shape) in enumerate(self.phy_circles):
-            i *= 2
+            pos = body.position
+            xs.append(pos.x)
+            ys.append(pos.y)
 
-            radius = shape.radius
-            rad_plus_pad = radius + vertex_padding
+        if self._ellipses and frame_governor.debug_visuals:
+            for e, x, y, radius in zip(self._ellipses, xs, ys, self.radii):
+                e.pos = x - radius, y - radius
 
-            x = body.x
-            y = body.y
+        self._update_strip(xs, ys)
 
-            # 2 vertices for each circle
-            vertex = i * 4
-            verts[vertex] = x - rad_plus_pad
-            verts[vertex + 1] = y
+    def _update_strip(self, xs, ys):
+        """Update the strip vertices x, y in a single pass over the body positions.
+        Each pair of vertices is perpendicular to the tentacle direction at the body.
+        """
+        verts = self.vertex_buffer.data
+        half_widths = self._half_widths
+        last = len(xs) - 1
+        for i in range(last + 1):
+            # direction from previous to next body (one-sided at the ends)
+            prev_i = i - 1 if i > 0 else 0
+            next_i = i + 1 if i < last else last
+            dx = xs[next_i] - xs[prev_i]
+            dy = ys[next_i] - ys[prev_i]
+            length = sqrt(dx * dx + dy * dy)
+            if length == 0.0:
+                nx, ny = 1.0, 0.0
+            else:
+                # normal pointing to the right of the direction
+                nx = dy / length
+                ny = -dx / length
 
-            vertex += 4
-            verts[vertex] = x + rad_plus_pad
-            verts[vertex + 1] = y
+            half = half_widths[i]
+            x = xs[i]
+            y = ys[i]
+            # left, right
+            v = i * 8
+            verts[v] = x - nx * half
+            verts[v + 1] = y - ny * half
+            verts[v + 4] = x + nx * half
+            verts[v + 5] = y + ny * half
 
-        self.mesh.vertices = verts
+        self.vertex_buffer.mark_dirty()
 
+    def batch_meshes(self):
+        yield self.vertex_buffer, self._strip_indices, None
 
     def phy_objects(self, body_only=False):
-        for circle in self.phy_circles:
-            yield circle[0]
+        """generator of all physics objects in this body part
+        Order: Body > Constraint
+        """
+        for body in self.bodies:
+            yield body
 
         if body_only:
             return
 
-        for circle in self.phy_circles:
-            yield circle[1]
+        for constraint in self.constraints:
+            yield constraint
+
+    def adjust_tweak(self, name, value):
+        self.tweaks[name] = value
+        if name == 'mass_fraction':
+            self.mass = value * self.creature.mass
+
+        elif name == 'bend_stiffness':
+            for spring in self.bend_springs:
+                spring.stiffness = value
+
+        elif name == 'bend_damping':
+            for spring in self.bend_springs:
+                spring.damping = value
+
+
+def _rebind_bell_vertical_fraction(old, new):
+    """Replace the on_bell_vertical_fraction handler live JellyBells bound (i.e. when its probe is toggled)"""
+    for bell in list(JellyBell._live):
+        bell.mesh_animator.unbind(vertical_fraction=old.__get__(bell, JellyBell))
+        bell.mesh_animator.bind(vertical_fraction=new.__get__(bell, JellyBell))
 
-        # TODO constraints
 
+probes.register('jelly.bell_vertical_fraction', JellyBell, 'on_bell_vertical_fraction',
+                rebind=_rebind_bell_vertical_fraction)
+probes.register('gooey_body.update', GooeyBodyPart, 'update')
+probes.register('tentacle.update', Tentacle, 'update')
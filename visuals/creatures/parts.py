@@ -0,0 +1,10 @@
+__author__ = 'awhite'
+
+# Kept apart from jelly.py, so screens can name parts without importing the part classes
+
+
+class Parts(object):
+    """List of typical part names to avoid typos in code"""
+    jelly_bell = 'jelly_bell'
+    gooey_body = 'gooey_body'
+    tentacles_group = 'tentacles/'
@@ -0,0 +1,95 @@
+__author__ = 'awhite'
+
+from array import array
+
+from kivy.clock import Clock
+
+
+class VertexBuffer(object):
+    """Keeps the vertices of a Mesh in a persistent float array that is written in place,
+    instead of copying Mesh.vertices out and assigning it back for every change.
+
+    Writes mark the buffer dirty and the Mesh is updated once before the next frame
+    no matter how many writes happened (Mesh always uploads all of its vertices).
+    Each Mesh should have a single VertexBuffer, share it between objects that write the same Mesh. Vertices are x, y, u, v as in Mesh.vertices.
+    Read the current vertices from data (Mesh.vertices may not be updated yet).
+
+    upload False stops updating the Mesh, for when data is drawn by something else (BatchRenderer).
+    version is incremented on every change of data.
+    """
+
+    __slots__ = ('mesh', 'data', 'dirty', 'upload', 'version', '_flush_trigger')
+
+    def __init__(self, mesh, vertices=None):
+        """:param vertices: initial vertices, defaults to the current Mesh.vertices"""
+        self.mesh = mesh
+        self.dirty = False
+        self.upload = True
+        self.version = 0
+        # -1 is before the next frame
+        self._flush_trigger = Clock.create_trigger(self._on_flush, -1)
+
+        if vertices is None:
+            self.data = array('f', mesh.vertices)
+        else:
+            self.data = array('f', vertices)
+            mesh.vertices = self.data
+
+    def __len__(self):
+        """Number of vertices"""
+        return len(self.data) // 4
+
+    def set_xy(self, index, x, y):
+        i = index * 4
+        data = self.data
+        data[i] = x
+        data[i + 1] = y
+        self.mark_dirty()
+
+    def set_uv(self, index, u, v):
+        i = index * 4
+        data = self.data
+        data[i + 2] = u
+        data[i + 3] = v
+        self.mark_dirty()
+
+    def set_xy_lanes(self, xs, ys, start=0):
+        """Set x, y of consecutive vertices starting at start"""
+        data = self.data
+        i = start * 4
+        for x, y in zip(xs, ys):
+            data[i] = x
+            data[i + 1] = y
+            i += 4
+
+        self.mark_dirty()
+
+    def mark_dirty(self):
+        """Mark the vertices as changed, use after writing to data directly"""
+        self.version += 1
+        if not self.dirty:
+            self.dirty = True
+            self._flush_trigger()
+
+    def replace(self, vertices):
+        """Replace all vertices (the number of vertices may change). Updates the Mesh immediately
+        so it's never drawn with indices that don't match."""
+        self.data = array('f', vertices)
+        self.version += 1
+        self.dirty = False
+        if self.upload:
+            self.mesh.vertices = self.data
+
+    def flush(self):
+        """Update the Mesh now if any vertices changed"""
+        if not self.dirty:
+            return
+
+        self.dirty = False
+        if not self.upload:
+            return
+
+        self.mesh.vertices = self.data
+
+    def _on_flush(self, dt):
+        self.flush()